@@ -0,0 +1,73 @@
+"""
+Compare finding out if a sender shares their displayname in large plumbed rooms.
+
+Disambiguation used to scan every displayname of the room for each message, the index makes it a lookup. Member
+changes are measured too as those now update the index.
+
+Usage: python benchmarks/disambiguation.py [--members 100 1000 5000 20000] [--messages 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.displaynames import Displaynames  # noqa: E402
+
+
+def scan(displaynames, sender):
+    # what PlumbedRoom.on_mx_message did before the index
+    sender_displayname = displaynames[sender]
+    for user_id, displayname in displaynames.items():
+        if user_id != sender and displayname == sender_displayname:
+            return True
+    return False
+
+
+def lookup(displaynames, sender):
+    return len(displaynames.users(displaynames[sender])) > 1
+
+
+def measure(func, displaynames, senders):
+    start = time.perf_counter()
+    for sender in senders:
+        func(displaynames, sender)
+    return (time.perf_counter() - start) / len(senders)
+
+
+def run(args):
+    rnd = random.Random(args.seed)
+
+    print(f"{'members':>8} {'scan':>12} {'index':>12} {'member change':>14}")
+
+    for members in args.members:
+        # a few common names are shared, like in any large room
+        displaynames = Displaynames(
+            {f"@user{i}:example.com": f"user{i}" if rnd.random() < 0.9 else f"common{i % 10}" for i in range(members)}
+        )
+        senders = rnd.choices(list(displaynames), k=args.messages)
+
+        scanned = measure(scan, displaynames, senders)
+        looked_up = measure(lookup, displaynames, senders)
+        assert [scan(displaynames, s) for s in senders] == [lookup(displaynames, s) for s in senders]
+
+        start = time.perf_counter()
+        for i, sender in enumerate(senders):
+            displaynames[sender] = f"renamed{i}"
+        changed = (time.perf_counter() - start) / len(senders)
+
+        print(f"{members:8} {scanned * 1e6:9.1f} us {looked_up * 1e6:9.2f} us {changed * 1e6:11.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="plumbed room disambiguation benchmark")
+    parser.add_argument("--members", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Measure EventQueue enqueue cost under an IRC flood.
+
+Lines from a single sender are fed at a fixed rate in small bursts, like a busy channel, and the CPU time spent and
+the number of timers scheduled on the event loop are reported. A long paste of formatted lines from one sender is
+also timed as it is merged into as few events as possible.
+
+Usage: python benchmarks/event_queue.py [--rate 10000] [--duration 3] [--senders 1] [--paste 500]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.event_queue import EventQueue  # noqa: E402
+
+
+def message(user_id, body):
+    return {
+        "type": "m.room.message",
+        "content": {"msgtype": "m.text", "body": body},
+        "user_id": user_id,
+    }
+
+
+def formatted_message(user_id, body):
+    return {
+        "type": "m.room.message",
+        "content": {
+            "msgtype": "m.text",
+            "format": "org.matrix.custom.html",
+            "body": body,
+            "formatted_body": f"<b>{body}</b>",
+        },
+        "user_id": user_id,
+    }
+
+
+async def run(args):
+    loop = asyncio.get_event_loop()
+    timers = 0
+    call_at = loop.call_at
+
+    def counting_call_at(*a, **kw):
+        nonlocal timers
+        timers += 1
+        return call_at(*a, **kw)
+
+    loop.call_at = counting_call_at
+
+    batches = 0
+    lines = 0
+
+    async def callback(events):
+        nonlocal batches, lines
+        batches += len(events)
+        for event in events:
+            lines += event["content"]["body"].count("\n") + 1
+
+    queue = EventQueue(callback)
+    queue.start()
+
+    # micro: back to back enqueues without yielding
+    start = time.perf_counter()
+    for i in range(args.rate):
+        queue.enqueue(message("@irc_a:localhost", f"line {i} of a flood that keeps on going"))
+    micro = time.perf_counter() - start
+    await asyncio.sleep(1.2)
+
+    timers = 0
+    batches = 0
+    lines = 0
+
+    # paced: the target rate delivered every millisecond
+    per_tick = max(1, args.rate // 1000)
+    total = int(args.rate * args.duration)
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    sent = 0
+    while sent < total:
+        for i in range(per_tick):
+            queue.enqueue(
+                message(f"@irc_{sent % args.senders}:localhost", f"line {sent} of a flood that keeps on going")
+            )
+            sent += 1
+        await asyncio.sleep(0.001)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    await asyncio.sleep(1.2)
+
+    print(f"micro:        {micro / args.rate * 1e6:.2f} us/enqueue ({args.rate} back to back)")
+    print(f"paced:        {sent} lines in {wall:.2f} s from {args.senders} sender(s)")
+    print(f"cpu:          {cpu:.2f} s ({cpu / sent * 1e6:.2f} us/line)")
+    print(f"timers:       {timers} scheduled")
+    print(f"delivered:    {lines} lines in {batches} events")
+
+    # paste: a long formatted paste arriving all at once, flushed right away to include joining the lines
+    line = "paste " + "x" * 394
+    rounds = 20
+    lines = 0
+    start = time.perf_counter()
+    for r in range(rounds):
+        for i in range(args.paste):
+            queue.enqueue(formatted_message("@irc_a:localhost", line))
+        queue._flush()
+    paste = (time.perf_counter() - start) / rounds
+    await asyncio.sleep(0.1)
+    assert lines == rounds * args.paste
+
+    print(f"paste:        {paste * 1000:.2f} ms per {args.paste} lines of {len(line)} chars")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="event queue benchmark")
+    parser.add_argument("--rate", type=int, default=10000, help="lines per second")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--senders", type=int, default=1, help="rotate between this many senders")
+    parser.add_argument("--paste", type=int, default=500, help="lines in a single paste")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
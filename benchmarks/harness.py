@@ -0,0 +1,561 @@
+"""
+Local test bed for benchmarking the bridge end to end.
+
+Runs the real bridge against a fake IRC server and a stub Matrix homeserver, both on localhost:
+
+- FakeIrcServer accepts the bridge connection, answers registration, JOIN and NAMES and can push any traffic to it,
+  including replaying captured logs.
+- StubHomeserver implements just enough of the client-server API for the bridge, records every call and can inject
+  latency into each of them.
+- Bridge seeds the homeserver with a network room and channel rooms and starts BridgeAppService.run() on top.
+- Tracker tags lines sent on IRC and finds them again in events sent to Matrix to measure end to end latency.
+
+See irc_replay.py for how they are used.
+"""
+import asyncio
+import collections
+import logging
+import os
+import random
+import re
+import socket
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.__main__ import BridgeAppService  # noqa: E402
+
+SERVER_NAME = "localhost"
+BOT_USER_ID = f"@heisenbridge:{SERVER_NAME}"
+OWNER_USER_ID = f"@owner:{SERVER_NAME}"
+NETWORK = "bench"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, p):
+    if len(values) == 0:
+        return float("nan")
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class StubHomeserver:
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.url = None
+
+        self.calls = collections.Counter()
+        self.account_data = {}
+        self.rooms = {}
+        self.registered = set()
+        self.events = []
+        self.room_events = {}
+
+        self._runner = None
+        self._next_id = 0
+        self._routes = []
+
+        # method, path, name and handler, path groups are passed to the handler
+        for (method, path, name, handler) in [
+            ("GET", r"/_matrix/client/r0/account/whoami", "whoami", self._whoami),
+            ("GET", r"/_matrix/client/r0/joined_rooms", "joined_rooms", self._joined_rooms),
+            ("GET", r"/_matrix/client/r0/user/([^/]+)/account_data/([^/]+)", "get_account_data", self._get_data),
+            ("PUT", r"/_matrix/client/r0/user/([^/]+)/account_data/([^/]+)", "put_account_data", self._put_data),
+            (
+                "GET",
+                r"/_matrix/client/r0/user/([^/]+)/rooms/([^/]+)/account_data/([^/]+)",
+                "get_room_account_data",
+                self._get_room_data,
+            ),
+            (
+                "PUT",
+                r"/_matrix/client/r0/user/([^/]+)/rooms/([^/]+)/account_data/([^/]+)",
+                "put_room_account_data",
+                self._put_room_data,
+            ),
+            ("GET", r"/_matrix/client/r0/rooms/([^/]+)/joined_members", "joined_members", self._joined_members),
+            ("GET", r"/_matrix/client/r0/rooms/([^/]+)/event/([^/]+)", "get_event", self._get_event),
+            ("GET", r"/_matrix/client/r0/rooms/([^/]+)/state/([^/]+)/?(.*)", "get_state", self._get_state),
+            ("PUT", r"/_matrix/client/r0/rooms/([^/]+)/send/([^/]+)/([^/]+)", "send", self._send),
+            ("PUT", r"/_matrix/client/r0/rooms/([^/]+)/state/([^/]+)/?(.*)", "send_state", self._send_state),
+            ("POST", r"/_matrix/client/r0/rooms/([^/]+)/invite", "invite", self._ok),
+            ("POST", r"/_matrix/client/r0/rooms/([^/]+)/join", "join", self._join),
+            ("POST", r"/_matrix/client/r0/rooms/([^/]+)/leave", "leave", self._leave),
+            ("POST", r"/_matrix/client/r0/rooms/([^/]+)/kick", "kick", self._kick),
+            ("POST", r"/_matrix/client/r0/rooms/([^/]+)/forget", "forget", self._ok),
+            ("POST", r"/_matrix/client/r0/rooms/([^/]+)/receipt/.*", "receipt", self._ok),
+            ("POST", r"/_matrix/client/r0/createRoom", "create_room", self._create_room),
+            ("POST", r"/_matrix/client/r0/register", "register", self._register),
+            ("PUT", r"/_matrix/client/r0/profile/([^/]+)/displayname", "displayname", self._ok),
+            ("PUT", r"/_matrix/client/r0/profile/([^/]+)/avatar_url", "avatar_url", self._ok),
+            ("GET", r"/_matrix/client/r0/profile/([^/]+)/avatar_url", "get_avatar_url", self._not_found),
+            ("PUT", r"/_matrix/client/r0/presence/([^/]+)/status", "presence", self._ok),
+            ("POST", r"/_matrix/media/r0/upload", "upload", self._upload),
+            ("GET", r"/_synapse/admin/.*", "synapse_admin", self._forbidden),
+        ]:
+            self._routes.append((method, re.compile(path + "$"), name, handler))
+
+    def add_room(self, room_id, members, config=None):
+        self.rooms[room_id] = {"members": {member: None for member in members}}
+
+        if config is not None:
+            self.account_data[(BOT_USER_ID, room_id, "irc")] = config
+
+    def add_event(self, event):
+        """Make an event known to the homeserver so the bridge can fetch it, like the original of a reply."""
+        self.room_events[event["event_id"]] = event
+
+    def sent(self, type="m.room.message"):
+        return [event for event in self.events if event[3] == type]
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{path:.*}", self._handle)
+
+        port = free_port()
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _handle(self, req):
+        if self.latency > 0 or self.jitter > 0:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        for (method, path, name, handler) in self._routes:
+            m = path.match(req.path)
+            if m and req.method == method:
+                self.calls[name] += 1
+                body = await req.json() if req.can_read_body and req.content_type == "application/json" else None
+                (status, data) = handler(req, body, *m.groups())
+                return web.json_response(data, status=status)
+
+        self.calls["unknown"] += 1
+        logging.warning(f"Stub homeserver got an unknown request {req.method} {req.path}")
+        return web.json_response({"errcode": "M_UNRECOGNIZED", "error": "Unrecognized request"}, status=404)
+
+    def _sender(self, req):
+        return req.query.get("user_id", BOT_USER_ID)
+
+    def _new_id(self, sigil):
+        self._next_id += 1
+        return f"{sigil}{self._next_id}:{SERVER_NAME}"
+
+    def _ok(self, req, body, *args):
+        return (200, {})
+
+    def _not_found(self, req, body, *args):
+        return (404, {"errcode": "M_NOT_FOUND", "error": "Not found"})
+
+    def _forbidden(self, req, body, *args):
+        return (403, {"errcode": "M_FORBIDDEN", "error": "Forbidden"})
+
+    def _whoami(self, req, body):
+        return (200, {"user_id": BOT_USER_ID})
+
+    def _joined_rooms(self, req, body):
+        return (
+            200,
+            {"joined_rooms": [room_id for room_id, room in self.rooms.items() if BOT_USER_ID in room["members"]]},
+        )
+
+    def _get_data(self, req, body, user_id, key):
+        if (user_id, None, key) not in self.account_data:
+            return self._not_found(req, body)
+
+        return (200, self.account_data[(user_id, None, key)])
+
+    def _put_data(self, req, body, user_id, key):
+        self.account_data[(user_id, None, key)] = body
+        return (200, {})
+
+    def _get_room_data(self, req, body, user_id, room_id, key):
+        if (user_id, room_id, key) not in self.account_data:
+            return self._not_found(req, body)
+
+        return (200, self.account_data[(user_id, room_id, key)])
+
+    def _put_room_data(self, req, body, user_id, room_id, key):
+        self.account_data[(user_id, room_id, key)] = body
+        return (200, {})
+
+    def _joined_members(self, req, body, room_id):
+        if room_id not in self.rooms:
+            return self._not_found(req, body)
+
+        members = self.rooms[room_id]["members"]
+        return (200, {"joined": {user_id: {"display_name": name} for user_id, name in members.items()}})
+
+    def _get_state(self, req, body, room_id, type, state_key):
+        if type == "m.room.join_rules":
+            return (200, {"join_rule": "invite"})
+
+        return self._not_found(req, body)
+
+    def _get_event(self, req, body, room_id, event_id):
+        if event_id not in self.room_events:
+            return self._not_found(req, body)
+
+        return (200, self.room_events[event_id])
+
+    def _send(self, req, body, room_id, type, txn_id):
+        event_id = self._new_id("$")
+        self.events.append((time.perf_counter(), room_id, self._sender(req), type, body))
+        self.add_event(
+            {"event_id": event_id, "room_id": room_id, "sender": self._sender(req), "type": type, "content": body}
+        )
+        return (200, {"event_id": event_id})
+
+    def _send_state(self, req, body, room_id, type, state_key):
+        event_id = self._new_id("$")
+        self.events.append((time.perf_counter(), room_id, self._sender(req), type, body))
+        return (200, {"event_id": event_id})
+
+    def _join(self, req, body, room_id):
+        if room_id in self.rooms:
+            self.rooms[room_id]["members"][self._sender(req)] = None
+
+        return (200, {"room_id": room_id})
+
+    def _leave(self, req, body, room_id):
+        if room_id in self.rooms:
+            self.rooms[room_id]["members"].pop(self._sender(req), None)
+
+        return (200, {})
+
+    def _kick(self, req, body, room_id):
+        if room_id in self.rooms:
+            self.rooms[room_id]["members"].pop(body["user_id"], None)
+
+        return (200, {})
+
+    def _create_room(self, req, body):
+        room_id = self._new_id("!")
+        self.add_room(room_id, [BOT_USER_ID] + body.get("invite", []))
+        return (200, {"room_id": room_id})
+
+    def _register(self, req, body):
+        user_id = f"@{body['username']}:{SERVER_NAME}"
+        if user_id in self.registered:
+            return (400, {"errcode": "M_USER_IN_USE", "error": "User ID already taken."})
+
+        self.registered.add(user_id)
+        return (200, {"user_id": user_id})
+
+    def _upload(self, req, body):
+        return (200, {"content_uri": "mxc://" + SERVER_NAME + "/" + self._new_id("m").split(":")[0][1:]})
+
+
+class FakeIrcClient:
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.nick = None
+        self.registered = False
+        self.welcomed = False
+        self.channels = set()
+
+    def send(self, line):
+        self.writer.write(line.encode("utf-8") + b"\r\n")
+
+    def reply(self, numeric, *args):
+        self.send(f":{self.server.name} {numeric} {self.nick} " + " ".join(args))
+
+    async def run(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+
+                self.handle(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.server.clients.remove(self)
+            self.writer.close()
+
+    def handle(self, line):
+        self.server.received.append((time.perf_counter(), line))
+
+        (command, _, rest) = line.partition(" ")
+        command = command.upper()
+
+        if command == "NICK":
+            self.nick = rest.lstrip(":")
+        elif command == "USER":
+            self.registered = True
+
+        if command in ["NICK", "USER"] and self.registered and self.nick is not None:
+            self.welcome()
+        elif command == "PING":
+            self.send(f":{self.server.name} PONG {self.server.name} {rest}")
+        elif command == "JOIN":
+            for channel in rest.split(" ")[0].split(","):
+                self.join(channel)
+        elif command == "MODE":
+            target = rest.split(" ")[0]
+            if target.startswith("#"):
+                self.reply("324", target, "+nt")
+            else:
+                self.reply("221", "+i")
+        elif command == "QUIT":
+            self.writer.close()
+
+    def welcome(self):
+        if self.welcomed:
+            return
+
+        self.welcomed = True
+        self.reply("001", f":Welcome to the {self.server.name} benchmark network {self.nick}")
+        self.reply("005", "CHANTYPES=# PREFIX=(ov)@+ NETWORK=Bench", ":are supported by this server")
+        self.reply("376", ":End of MOTD command")
+        self.server.joined.set()
+
+    def join(self, channel):
+        channel = channel.lower()
+        members = self.server.channels.setdefault(channel, [])
+
+        self.channels.add(channel)
+        self.send(f":{self.nick}!bridge@localhost JOIN {channel}")
+        self.reply("332", channel, ":Benchmark channel")
+
+        # NAMES replies are split to fit in a line like real servers do
+        names = [self.nick] + members
+        chunk = []
+        for name in names:
+            chunk.append(name)
+            if len(" ".join(chunk)) > 400:
+                self.reply("353", "=", channel, ":" + " ".join(chunk))
+                chunk = []
+        if chunk:
+            self.reply("353", "=", channel, ":" + " ".join(chunk))
+
+        self.reply("366", channel, ":End of /NAMES list.")
+        self.server.joined.set()
+
+
+class FakeIrcServer:
+    def __init__(self, name="irc.bench"):
+        self.name = name
+        self.port = None
+        self.channels = {}
+        self.clients = []
+        self.received = []
+        self.joined = asyncio.Event()
+
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._accept, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+
+        for client in list(self.clients):
+            client.writer.close()
+
+    async def wait_joined(self, channels, timeout=60):
+        channels = {channel.lower() for channel in channels}
+
+        async def wait():
+            while not any(client.welcomed and channels <= client.channels for client in self.clients):
+                self.joined.clear()
+                await self.joined.wait()
+
+        await asyncio.wait_for(wait(), timeout)
+
+    def _accept(self, reader, writer):
+        client = FakeIrcClient(self, reader, writer)
+        self.clients.append(client)
+        asyncio.ensure_future(client.run())
+
+    def send(self, line):
+        for client in self.clients:
+            client.send(line)
+
+    async def drain(self):
+        for client in self.clients:
+            await client.writer.drain()
+
+    def privmsg(self, nick, target, text):
+        self.send(f":{nick}!{nick}@bench.example PRIVMSG {target} :{text}")
+
+    def join(self, nick, channel):
+        self.channels.setdefault(channel.lower(), []).append(nick)
+        self.send(f":{nick}!{nick}@bench.example JOIN {channel}")
+
+    def part(self, nick, channel, reason="Leaving"):
+        members = self.channels.get(channel.lower(), [])
+        if nick in members:
+            members.remove(nick)
+        self.send(f":{nick}!{nick}@bench.example PART {channel} :{reason}")
+
+    def quit(self, nick, reason="Quit: bye"):
+        for members in self.channels.values():
+            if nick in members:
+                members.remove(nick)
+        self.send(f":{nick}!{nick}@bench.example QUIT :{reason}")
+
+    async def replay(self, path, speed=1.0, nick=None, tracker=None):
+        """
+        Replay a captured log.
+
+        Each line of the log is a relative timestamp in seconds followed by a raw IRC line as sent by a server, eg:
+        "12.5 :alice!a@example.com PRIVMSG #channel :hello". A $nick in the raw line is replaced with the nick of the
+        bridge user and PRIVMSG lines are tagged if a tracker is given. Returns the number of lines sent.
+        """
+        start = time.perf_counter()
+        sent = 0
+
+        with open(path) as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line or line.startswith("#"):
+                    continue
+
+                (at, raw) = line.split(" ", 1)
+                wait = start + float(at) / speed - time.perf_counter()
+                if wait > 0:
+                    await self.drain()
+                    await asyncio.sleep(wait)
+
+                if nick is not None:
+                    raw = raw.replace("$nick", nick)
+
+                if tracker is not None and " PRIVMSG " in raw and " :" in raw:
+                    (head, text) = raw.split(" :", 1)
+                    raw = head + " :" + tracker.tag(text)
+
+                self.send(raw)
+                sent += 1
+
+        await self.drain()
+        return sent
+
+
+class Tracker:
+    """Tags lines with an id to find them again on the Matrix side."""
+
+    pattern = re.compile(r"\[t:(\d+)\]")
+
+    def __init__(self):
+        self.sent = {}
+
+    def tag(self, text):
+        tag = len(self.sent)
+        self.sent[tag] = time.perf_counter()
+        return f"[t:{tag}] {text}"
+
+    def latencies(self, events):
+        seen = {}
+
+        for (at, room_id, sender, type, content) in events:
+            for m in self.pattern.finditer(content.get("body", "")):
+                tag = int(m.group(1))
+                if tag in self.sent and tag not in seen:
+                    seen[tag] = at - self.sent[tag]
+
+        return list(seen.values())
+
+
+class Bridge:
+    def __init__(self, hs, irc, channels, member_sync="half", room_config=None):
+        self.hs = hs
+        self.irc = irc
+        self.channels = channels
+        self.member_sync = member_sync
+        self.room_config = room_config or {}
+        self.port = None
+        self.serv = None
+        self.network_room_id = f"!network:{SERVER_NAME}"
+        self.channel_room_ids = {}
+
+        self._task = None
+
+    def seed(self):
+        self.hs.account_data[(BOT_USER_ID, None, "irc")] = {
+            "networks": {NETWORK: {"servers": [{"address": "127.0.0.1", "port": self.irc.port, "tls": False}]}},
+            "owner": OWNER_USER_ID,
+            "allow": {},
+            "idents": {},
+            "member_sync": self.member_sync,
+            "media_url": "http://localhost",
+        }
+
+        self.hs.add_room(
+            self.network_room_id,
+            [BOT_USER_ID, OWNER_USER_ID],
+            {"type": "NetworkRoom", "user_id": OWNER_USER_ID, "name": NETWORK, "connected": True, "nick": "bridgeuser"},
+        )
+
+        for (i, channel) in enumerate(self.channels):
+            room_id = f"!channel{i}:{SERVER_NAME}"
+            self.channel_room_ids[channel.lower()] = room_id
+            self.hs.add_room(
+                room_id,
+                [BOT_USER_ID, OWNER_USER_ID],
+                {
+                    "type": "ChannelRoom",
+                    "user_id": OWNER_USER_ID,
+                    "name": channel.lower(),
+                    "network": NETWORK,
+                    "member_sync": self.member_sync,
+                    **self.room_config,
+                },
+            )
+
+    async def start(self, timeout=60):
+        self.seed()
+
+        self.port = free_port()
+        self.serv = BridgeAppService()
+        self.serv.registration = {
+            "as_token": "as_token",
+            "hs_token": "hs_token",
+            "sender_localpart": "heisenbridge",
+            "namespaces": {"users": [{"regex": "@irc_.*", "exclusive": True}]},
+        }
+
+        self._task = asyncio.ensure_future(self.serv.run("127.0.0.1", self.port, self.hs.url, None))
+        await self.irc.wait_joined(self.channels, timeout)
+
+    async def stop(self):
+        for room in self.serv._rooms.values():
+            room.cleanup()
+
+        self._task.cancel()
+        await self.serv.api.conn.close()
+
+    @property
+    def nick(self):
+        return self.irc.clients[0].nick
+
+    async def settle(self, quiet=1.0, timeout=120):
+        """Wait until the bridge has not sent anything to the homeserver for a while."""
+        start = time.perf_counter()
+        last = -1
+
+        while time.perf_counter() - start < timeout:
+            count = sum(self.hs.calls.values())
+            if count == last:
+                return
+
+            last = count
+            await asyncio.sleep(quiet)
@@ -0,0 +1,100 @@
+"""
+Compare HTML to IRC conversion of formatted bodies with and without the single pass parser.
+
+The corpus mimics what Element sends: mentions, replies, inline formatting and links make up most of it with the
+occasional list, quote or code block that needs the full parser.
+
+Usage: python benchmarks/html_to_irc.py [--messages 5000] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.parser import IRCMatrixParser  # noqa: E402
+from heisenbridge.parser import IRCRecursionContext  # noqa: E402
+
+WORDS = "the quick brown fox jumps over the lazy dog while the bridge relays every single word".split()
+USERS = [f"@user{i}:example.com" for i in range(50)]
+DISPLAYNAMES = {user_id: f"user{i}" for i, user_id in enumerate(USERS)}
+
+
+def corpus(count, seed):
+    rnd = random.Random(seed)
+
+    def text(n=8):
+        return " ".join(rnd.choices(WORDS, k=rnd.randint(1, n)))
+
+    def pill():
+        user_id = rnd.choice(USERS)
+        return f'<a href="https://matrix.to/#/{user_id}">{DISPLAYNAMES[user_id]}</a>'
+
+    def reply():
+        user_id = rnd.choice(USERS)
+        return (
+            '<mx-reply><blockquote><a href="https://matrix.to/#/!room:example.com/$event">In reply to</a> '
+            f'<a href="https://matrix.to/#/{user_id}">{user_id}</a><br>{text()}</blockquote></mx-reply>{text()}'
+        )
+
+    kinds = [
+        (30, lambda: f"{pill()}: {text()}"),
+        (20, reply),
+        (10, lambda: f"{text()} <strong>{text(3)}</strong> {text()}"),
+        (8, lambda: f"{text()} <em>{text(3)}</em>"),
+        (8, lambda: f"{text()} <code>{text(2)}</code> {text()}"),
+        (6, lambda: f'see <a href="https://example.com/{rnd.choice(WORDS)}">{text(3)}</a>'),
+        (5, lambda: f"{text()}<br>{text()}<br>{text()}"),
+        (4, lambda: f"{pill()} {pill()} {text()}"),
+        (3, lambda: "<ul>\n" + "".join(f"<li>{text()}</li>\n" for i in range(3)) + "</ul>\n"),
+        (3, lambda: f"<blockquote>\n<p>{text()}</p>\n</blockquote>\n<p>{text()}</p>\n"),
+        (3, lambda: f'<pre><code class="language-python">{text()}\n{text()}\n</code></pre>\n'),
+    ]
+    weights = [weight for weight, _ in kinds]
+
+    return [rnd.choices(kinds, weights)[0][1]() for i in range(count)]
+
+
+def measure(messages, parse):
+    start = time.perf_counter()
+    for message in messages:
+        parse(message)
+    return time.perf_counter() - start
+
+
+def run(args):
+    messages = corpus(args.messages, args.seed)
+
+    def full(message):
+        ctx = IRCRecursionContext(displaynames=DISPLAYNAMES)
+        return str(IRCMatrixParser.node_to_fstring(IRCMatrixParser.read_html(f"<body>{message}</body>"), ctx))
+
+    def fast(message):
+        return str(IRCMatrixParser.parse(message, IRCRecursionContext(displaynames=DISPLAYNAMES)))
+
+    simple = sum(
+        1
+        for message in messages
+        if IRCMatrixParser.parse_simple(message, IRCRecursionContext(displaynames=DISPLAYNAMES)) is not None
+    )
+    mismatches = sum(1 for message in messages if full(message) != fast(message))
+
+    full_time = min(measure(messages, full) for i in range(3))
+    fast_time = min(measure(messages, fast) for i in range(3))
+
+    print(f"{len(messages)} messages, {simple / len(messages) * 100:.0f}% take the single pass, {mismatches} differ")
+    print(f"  full parser   {full_time / len(messages) * 1e6:7.1f} us/message")
+    print(f"  single pass   {fast_time / len(messages) * 1e6:7.1f} us/message ({full_time / fast_time:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML to IRC conversion benchmark")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Measure the cost of mostly idle rooms on the event loop.
+
+A handful of rooms keep sending messages while the rest stay idle. Reports the number of live tasks, RSS, how late
+the loop runs a timer, how many tasks were spawned and how long a full garbage collection takes with all the rooms around.
+
+Usage: python benchmarks/idle_rooms.py [--rooms 10000] [--active 100] [--duration 5]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from room_memory import fake_serv  # noqa: E402
+from room_memory import room_config  # noqa: E402
+from room_memory import rss  # noqa: E402
+
+
+class NullApi:
+    """Accepts sends from rooms without going anywhere."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def put_room_send_event(self, room_id, type, content, user_id=None, txn_id=None):
+        self.sent += 1
+
+
+async def chatter(room, stop):
+    while not stop.is_set():
+        room.send_message("hello", user_id=None)
+        await asyncio.sleep(random.uniform(0.01, 0.2))
+
+
+async def probe_lag(stop, lags):
+    loop = asyncio.get_event_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(0.01)
+        lags.append(loop.time() - start - 0.01)
+
+
+async def yields(n):
+    start = time.perf_counter()
+    for i in range(n):
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+async def run(args):
+    created = 0
+
+    def count_tasks(loop, coro, **kwargs):
+        nonlocal created
+        created += 1
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    asyncio.get_event_loop().set_task_factory(count_tasks)
+
+    serv = fake_serv()
+    serv.api = NullApi()
+    members = ["@owner:localhost", serv.user_id]
+
+    gc.collect()
+    base_rss = rss()
+
+    rooms = []
+    for i in range(args.rooms):
+        rooms.append(serv.init_room(f"!room{i}:localhost", room_config(args.type, i), list(members), {}))
+
+    # let any start-up work settle
+    await asyncio.sleep(0.5)
+    idle_tasks = len(asyncio.all_tasks())
+
+    stop = asyncio.Event()
+    lags = []
+    workers = [asyncio.ensure_future(chatter(room, stop)) for room in rooms[: args.active]]
+    workers.append(asyncio.ensure_future(probe_lag(stop, lags)))
+
+    await asyncio.sleep(args.duration / 2)
+    busy_tasks = len(asyncio.all_tasks()) - len(workers)
+    yield_time = await yields(100_000)
+    await asyncio.sleep(args.duration / 2)
+
+    stop.set()
+    await asyncio.gather(*workers)
+
+    gc.collect()
+    start = time.perf_counter()
+    gc.collect()
+    gc_time = time.perf_counter() - start
+
+    lags.sort()
+    print(f"rooms:           {args.rooms} x {args.type}, {args.active} active for {args.duration} s")
+    print(f"events sent:     {serv.api.sent}")
+    print(f"tasks idle:      {idle_tasks}")
+    print(f"tasks busy:      {busy_tasks} (excluding benchmark tasks)")
+    print(f"tasks created:   {created}")
+    print(f"RSS growth:      {(rss() - base_rss) / 1024 / 1024:.1f} MiB")
+    print(
+        f"timer lag:       median {statistics.median(lags) * 1000:.2f} ms, p99 {lags[int(len(lags) * 0.99)] * 1000:.2f} ms"
+    )
+    print(f"100k yields:     {yield_time * 1000:.0f} ms")
+    print(f"full gc:         {gc_time * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="idle room benchmark")
+    parser.add_argument("--rooms", type=int, default=10000)
+    parser.add_argument("--active", type=int, default=100, help="number of rooms that keep sending")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to run active rooms")
+    parser.add_argument("--type", default="PrivateRoom", choices=["PrivateRoom", "ChannelRoom", "PlumbedRoom"])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measure the cost of converting IRC lines to Matrix HTML.
+
+The corpus mimics a busy channel: most lines are plain, some mention other users and a few use bold, colours or
+both. Run it in an older checkout to compare.
+
+Usage: python benchmarks/irc_formatting.py [--lines 20000] [--pills 50] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.private_room import parse_irc_formatting  # noqa: E402
+
+WORDS = "the quick brown fox jumps over the lazy dog while the bridge relays every single word".split()
+
+
+def corpus(count, nicks, seed):
+    rnd = random.Random(seed)
+
+    def text(n=12):
+        return " ".join(rnd.choices(WORDS, k=rnd.randint(1, n)))
+
+    kinds = [
+        (60, lambda: text()),
+        (20, lambda: f"{rnd.choice(nicks)}: {text()}"),
+        (8, lambda: f"{text()} \x02{text(3)}\x02 {text()}"),
+        (6, lambda: f"\x0304,01{text(3)}\x03 {text()} \x0312{text(2)}\x0F"),
+        (6, lambda: f"\x02\x0309{rnd.choice(nicks)}\x0F {text()} \x1D{text(2)}\x1D"),
+    ]
+    weights = [weight for weight, _ in kinds]
+
+    return [rnd.choices(kinds, weights)[0][1]() for i in range(count)]
+
+
+def run(args):
+    nicks = [f"nick{i}" for i in range(args.pills)]
+    pills = {nick: (f"@irc_{nick}:example.com", nick) for nick in nicks}
+    lines = corpus(args.lines, nicks, args.seed)
+
+    for name, pills in [("without pills", None), ("with pills", pills)]:
+        best = None
+        for i in range(5):
+            start = time.perf_counter()
+            for line in lines:
+                parse_irc_formatting(line, pills)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        print(f"{name:14} {best / len(lines) * 1e6:6.2f} us/line")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IRC formatting benchmark")
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--pills", type=int, default=50, help="number of nicks that can be pillified")
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
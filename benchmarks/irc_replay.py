@@ -0,0 +1,172 @@
+"""
+Replay IRC traffic through the bridge and report throughput, latency and homeserver calls.
+
+The bridge runs unmodified against the fake IRC server and stub homeserver from harness.py. Scenarios:
+
+- names:  the bridge joins a channel with a large member list
+- storm:  a flood of users joining and then parting or quitting
+- burst:  tagged PRIVMSG lines sent as fast as possible from a set of users
+- replay: a captured log, see FakeIrcServer.replay() for the format
+
+Usage: python benchmarks/irc_replay.py [--scenario names,storm,burst] [--log FILE] [--hs-latency 0.005]
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harness import Bridge  # noqa: E402
+from harness import FakeIrcServer  # noqa: E402
+from harness import percentile  # noqa: E402
+from harness import StubHomeserver  # noqa: E402
+from harness import Tracker  # noqa: E402
+
+CHANNEL = "#bench"
+
+
+def report_calls(title, before, after, elapsed):
+    calls = after - before
+    total = sum(calls.values())
+
+    print(f"{title}: {elapsed:.2f} s, {total} homeserver calls")
+    for (name, count) in calls.most_common():
+        print(f"  {name:24} {count:8}")
+
+
+def report_latency(tracker, hs, elapsed):
+    latencies = tracker.latencies(hs.sent())
+    sent = len(tracker.sent)
+
+    print(f"  delivered {len(latencies)}/{sent} lines, {len(latencies) / elapsed:.0f} lines/s")
+    if latencies:
+        print(
+            "  latency ms: "
+            + ", ".join(f"p{int(p * 100)} {percentile(latencies, p) * 1000:.0f}" for p in [0.5, 0.9, 0.99])
+            + f", max {max(latencies) * 1000:.0f}"
+        )
+
+
+async def wait_delivered(tracker, hs, timeout):
+    start = time.perf_counter()
+
+    while time.perf_counter() - start < timeout:
+        if len(tracker.latencies(hs.sent())) >= len(tracker.sent):
+            break
+        await asyncio.sleep(0.1)
+
+    return time.perf_counter() - start
+
+
+async def phase(title, bridge, hs, coro):
+    before = collections.Counter(hs.calls)
+    start = time.perf_counter()
+    result = await coro
+    await bridge.settle()
+    report_calls(title, before, hs.calls, time.perf_counter() - start)
+    return result
+
+
+async def storm(irc, args):
+    nicks = [f"storm{i}" for i in range(args.storm)]
+
+    for nick in nicks:
+        irc.join(nick, CHANNEL)
+    await irc.drain()
+
+    for (i, nick) in enumerate(nicks):
+        if i % 2 == 0:
+            irc.part(nick, CHANNEL)
+        else:
+            irc.quit(nick)
+    await irc.drain()
+
+
+async def burst(irc, hs, tracker, args):
+    nicks = [f"talker{i}" for i in range(args.senders)]
+
+    start = time.perf_counter()
+    for i in range(args.burst):
+        irc.privmsg(nicks[i % len(nicks)], CHANNEL, tracker.tag(f"message number {i} in a burst"))
+        if i % 100 == 99:
+            await irc.drain()
+    await irc.drain()
+
+    await wait_delivered(tracker, hs, args.timeout)
+    report_latency(tracker, hs, time.perf_counter() - start)
+
+
+async def replay(irc, bridge, hs, tracker, args):
+    start = time.perf_counter()
+    sent = await irc.replay(args.log, args.speed, bridge.nick, tracker)
+    await wait_delivered(tracker, hs, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    print(f"  replayed {sent} lines at {args.speed}x")
+    report_latency(tracker, hs, elapsed)
+
+
+async def run(args):
+    scenarios = args.scenario.split(",")
+
+    hs = StubHomeserver(args.hs_latency, args.hs_jitter)
+    irc = FakeIrcServer()
+    await hs.start()
+    await irc.start()
+
+    if "names" in scenarios:
+        irc.channels[CHANNEL] = [f"member{i}" for i in range(args.names)]
+
+    bridge = Bridge(hs, irc, [CHANNEL], member_sync=args.member_sync)
+
+    print(
+        f"homeserver latency {args.hs_latency * 1000:.0f} ms + up to {args.hs_jitter * 1000:.0f} ms,"
+        f" member sync {args.member_sync}"
+    )
+    await phase("startup" + (f" with {args.names} names" if "names" in scenarios else ""), bridge, hs, bridge.start())
+
+    if "storm" in scenarios:
+        await phase(f"storm of {args.storm} joins and leaves", bridge, hs, storm(irc, args))
+
+    if "burst" in scenarios:
+        tracker = Tracker()
+        await phase(f"burst of {args.burst} lines from {args.senders} users", bridge, hs, burst(irc, hs, tracker, args))
+
+    if "replay" in scenarios:
+        if not args.log:
+            print("replay needs --log")
+        else:
+            tracker = Tracker()
+            await phase(f"replay of {args.log}", bridge, hs, replay(irc, bridge, hs, tracker, args))
+
+    await bridge.stop()
+    await irc.stop()
+    await hs.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay IRC traffic through the bridge")
+    parser.add_argument("--scenario", default="names,storm,burst", help="comma separated: names,storm,burst,replay")
+    parser.add_argument("--log", help="captured log to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed up")
+    parser.add_argument("--names", type=int, default=2000, help="members in the channel when joining")
+    parser.add_argument("--storm", type=int, default=500, help="users joining and leaving")
+    parser.add_argument("--burst", type=int, default=5000, help="lines in the burst")
+    parser.add_argument("--senders", type=int, default=20, help="users sending the burst")
+    parser.add_argument("--member-sync", default="half", choices=["lazy", "half", "full", "off"])
+    parser.add_argument("--hs-latency", type=float, default=0.005, help="seconds added to every homeserver call")
+    parser.add_argument("--hs-jitter", type=float, default=0.005, help="random seconds added on top")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for delivery")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compare JSON codecs on the hot paths of the bridge.
+
+- decode: an appservice transaction as received by BridgeAppService._transaction
+- encode: message contents as serialized for Matrix.put_room_send_event, through the aiohttp JSON payload
+
+The standard library is always measured, the fast runtime codec (orjson or ujson) if one is installed.
+
+Usage: python benchmarks/json_codec.py [--events 50] [--rounds 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+from aiohttp.payload import JsonPayload
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.runtime import JsonCodec  # noqa: E402
+
+WORDS = "the quick brown fox jumps over the lazy dög while the bridge relays every single wörd 🙂".split()
+
+
+def message(rnd, i):
+    text = " ".join(rnd.choices(WORDS, k=rnd.randint(3, 40)))
+    content = {"msgtype": "m.text", "body": text}
+
+    if i % 3 == 0:
+        content["format"] = "org.matrix.custom.html"
+        content["formatted_body"] = f"<b>{text}</b> <a href='https://matrix.to/#/@irc_someone:localhost'>someone</a>"
+
+    return content
+
+
+def transaction(rnd, events):
+    return {
+        "events": [
+            {
+                "event_id": f"$event{i}:localhost",
+                "room_id": f"!room{i % 10}:localhost",
+                "sender": f"@user{i % 20}:localhost",
+                "type": "m.room.message",
+                "origin_server_ts": 1600000000000 + i,
+                "unsigned": {"age": rnd.randint(0, 1000)},
+                "content": message(rnd, i),
+            }
+            for i in range(events)
+        ]
+    }
+
+
+def run(args):
+    rnd = random.Random(1)
+    codecs = [JsonCodec()]
+    fast = JsonCodec(fast=True)
+    if fast.name != "json":
+        codecs.append(fast)
+    else:
+        print("no faster JSON library installed, only measuring the standard library")
+
+    body = codecs[0].dumps(transaction(rnd, args.events)).encode()
+    contents = [message(rnd, i) for i in range(100)]
+
+    print(f"transaction of {args.events} events is {len(body)} bytes")
+    print()
+    print("codec      decode us/txn  encode us/event")
+
+    baseline = None
+    for codec in codecs:
+        assert codec.loads(body) == codecs[0].loads(body)
+
+        decode = min(timeit.repeat(lambda: codec.loads(body), number=args.rounds, repeat=3)) / args.rounds
+        encode = (
+            min(
+                timeit.repeat(
+                    lambda: [JsonPayload(content, dumps=codec.dumps) for content in contents],
+                    number=args.rounds // 10,
+                    repeat=3,
+                )
+            )
+            / (args.rounds // 10)
+            / len(contents)
+        )
+
+        speedup = ""
+        if baseline:
+            speedup = f"  ({baseline[0] / decode:.1f}x decode, {baseline[1] / encode:.1f}x encode)"
+        else:
+            baseline = (decode, encode)
+
+        print(f"{codec.name:10} {decode * 1e6:13.1f}  {encode * 1e6:15.2f}{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON codec benchmark")
+    parser.add_argument("--events", type=int, default=50, help="events in a transaction")
+    parser.add_argument("--rounds", type=int, default=2000)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Push a single very large transaction into the bridge, like a homeserver does after a backlog.
+
+Reports how long it took until the first event was handled, until the transaction was accepted and until every event
+was handled, the most events being handled at once and the peak memory allocated while doing so.
+
+Events are sent to rooms the bridge does not know so handling them is cheap, --handler-delay adds a delay to each to
+stand in for handlers waiting on the homeserver.
+
+Usage: python benchmarks/large_transaction.py [--events 5000] [--size 1000] [--handler-delay 0.01]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harness import Bridge  # noqa: E402
+from harness import FakeIrcServer  # noqa: E402
+from harness import StubHomeserver  # noqa: E402
+
+
+def transaction(events, size):
+    return json.dumps(
+        {
+            "events": [
+                {
+                    "event_id": f"$backlog{i}:localhost",
+                    "room_id": f"!unknown{i % 100}:localhost",
+                    "sender": "@someone:localhost",
+                    "type": "m.room.message",
+                    "origin_server_ts": 1600000000000 + i,
+                    "content": {"msgtype": "m.text", "body": "x" * size},
+                }
+                for i in range(events)
+            ]
+        }
+    ).encode()
+
+
+async def run(args):
+    hs = StubHomeserver(0.001, 0)
+    irc = FakeIrcServer()
+    await hs.start()
+    await irc.start()
+
+    bridge = Bridge(hs, irc, [])
+    await bridge.start()
+
+    serv = bridge.serv
+    on_mx_event = serv._on_mx_event
+    handled = []
+    running = 0
+    max_running = 0
+
+    async def timed_on_mx_event(event):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(running, max_running)
+        try:
+            await asyncio.sleep(args.handler_delay)
+            await on_mx_event(event)
+        finally:
+            running -= 1
+            handled.append(time.perf_counter())
+
+    serv._on_mx_event = timed_on_mx_event
+
+    body = transaction(args.events, args.size)
+    url = f"http://127.0.0.1:{bridge.port}/_matrix/app/v1/transactions/1?access_token=hs_token"
+
+    if args.trace:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    # sent in chunks so the client does not buffer the whole body and show up in the memory use
+    async def chunks():
+        for pos in range(0, len(body), 64 * 1024):
+            yield body[pos : pos + 64 * 1024]
+
+    headers = {"Content-Type": "application/json", "Content-Length": str(len(body))}
+
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        async with session.put(url, data=chunks(), headers=headers) as resp:
+            await resp.read()
+            status = resp.status
+        accepted = time.perf_counter() - start
+
+    while len(handled) < args.events and time.perf_counter() - start < args.timeout:
+        await asyncio.sleep(0.01)
+
+    if args.trace:
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+    print(f"transaction of {args.events} events, {len(body) / 1024 / 1024:.1f} MiB")
+
+    if status != 200 or not handled:
+        print(f"  failed with HTTP status {status} after {accepted * 1000:.0f} ms, handled {len(handled)} events")
+    else:
+        report(start, accepted, handled, max_running)
+
+    if args.trace:
+        print(f"  peak memory {peak / 1024 / 1024:.1f} MiB over the transaction body")
+
+    await bridge.stop()
+    await irc.stop()
+    await hs.stop()
+
+
+def report(start, accepted, handled, max_running):
+    print(f"  first event handled after {(min(handled) - start) * 1000:.0f} ms")
+    print(f"  accepted after            {accepted * 1000:.0f} ms")
+    print(f"  all events handled after  {(max(handled) - start) * 1000:.0f} ms")
+    print(f"  at most {max_running} events handled at once")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="large transaction benchmark")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=1000, help="message body size")
+    parser.add_argument("--handler-delay", type=float, default=0.01, help="seconds each event takes to handle")
+    parser.add_argument("--no-trace", dest="trace", action="store_false", help="skip measuring memory")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare event merge policies on a replayed busy channel.
+
+A synthetic log of a busy channel is generated: a few talkative users, people splitting a thought over a couple of
+lines and the occasional paste. It is replayed through an EventQueue with the policy of each room type and the number
+of Matrix events sent and the delay each line got before being sent are reported.
+
+The log is replayed faster than real time with the policy windows scaled down to match, latencies are reported in
+log time.
+
+Usage: python benchmarks/merge_policy.py [--duration 60] [--rate 5] [--speed 10] [--seed 1]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.channel_room import ChannelRoom  # noqa: E402
+from heisenbridge.event_queue import EventQueue  # noqa: E402
+from heisenbridge.plumbed_room import PlumbedRoom  # noqa: E402
+from heisenbridge.private_room import PrivateRoom  # noqa: E402
+
+
+def busy_channel(duration, rate, seed):
+    rnd = random.Random(seed)
+    nicks = [f"user{i}" for i in range(40)]
+    weights = [1 / (i + 1) for i in range(len(nicks))]
+    log = []
+
+    t = 0.0
+    while t < duration:
+        t += rnd.expovariate(rate)
+        nick = rnd.choices(nicks, weights)[0]
+        roll = rnd.random()
+
+        if roll < 0.02:
+            # paste, paced by the flood protection of the client
+            lines = rnd.randint(10, 40)
+            log += [(t + i * 0.05, nick, "x" * rnd.randint(20, 120)) for i in range(lines)]
+        elif roll < 0.25:
+            # a thought split over a few lines
+            lines = rnd.randint(2, 4)
+            at = t
+            for i in range(lines):
+                log.append((at, nick, "x" * rnd.randint(5, 80)))
+                at += rnd.uniform(0.3, 3.0)
+        else:
+            log.append((t, nick, "x" * rnd.randint(5, 150)))
+
+    log.sort(key=lambda line: line[0])
+    return [line for line in log if line[0] < duration]
+
+
+async def replay(log, policy, speed):
+    loop = asyncio.get_event_loop()
+    arrived = {}
+    latencies = []
+    events = 0
+
+    async def callback(batch):
+        nonlocal events
+        now = loop.time()
+        for event in batch:
+            events += 1
+            for line in event["content"]["body"].split("\n"):
+                latencies.append((now - arrived[line.split(" ", 1)[0]]) * speed)
+
+    (delay, max_age, max_size) = policy
+    queue = EventQueue(callback, delay / speed, max_age / speed, max_size)
+    queue.start()
+
+    start = loop.time()
+    for (i, (at, nick, text)) in enumerate(log):
+        wait = start + at / speed - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        arrived[str(i)] = loop.time()
+        queue.enqueue(
+            {
+                "type": "m.room.message",
+                "content": {"msgtype": "m.text", "body": f"{i} {text}"},
+                "user_id": f"@irc_{nick}:localhost",
+            }
+        )
+
+    await asyncio.sleep((max_age + 0.5) / speed)
+    queue.stop()
+
+    latencies.sort()
+    return (events, latencies)
+
+
+async def run(args):
+    log = busy_channel(args.duration, args.rate, args.seed)
+    print(f"log: {len(log)} lines over {args.duration:.0f} s, replayed at {args.speed}x")
+    print()
+    print("policy                     events  lines/event  median ms  p95 ms  max ms")
+
+    for cls in [PrivateRoom, ChannelRoom, PlumbedRoom]:
+        policy = (cls.merge_delay, cls.merge_max_age, cls.merge_max_size)
+        (events, latencies) = await replay(log, policy, args.speed)
+
+        print(
+            f"{cls.__name__:12} {policy[0]:4}/{policy[1]:3} s  {events:7}  {len(latencies) / events:11.2f}"
+            f"  {statistics.median(latencies) * 1000:9.0f}  {latencies[int(len(latencies) * 0.95)] * 1000:6.0f}"
+            f"  {latencies[-1] * 1000:6.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="merge policy benchmark")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of channel log")
+    parser.add_argument("--rate", type=float, default=5.0, help="messages per second")
+    parser.add_argument("--speed", type=float, default=10.0, help="replay speed up")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
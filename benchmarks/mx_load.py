@@ -0,0 +1,251 @@
+"""
+Push synthetic Matrix transactions through the bridge towards IRC.
+
+Transactions are PUT to the appservice endpoint of the unmodified bridge from harness.py. They carry a mix of plain
+and HTML messages, replies, edits and media spread over many channel rooms. Each message is tagged and found again:
+
+- when it is handed to the IRC connection (HeisenConnection.send_raw), which covers the whole Matrix side of the
+  bridge: _transaction, _on_mx_event, on_mx_message, _send_message, formatting and splitting
+- when it reaches the fake IRC server socket; the bridge throttles its IRC output on purpose so this is limited to
+  what the flood protection lets through in --socket-wait seconds
+
+Usage: python benchmarks/mx_load.py [--rooms 50] [--messages 5000] [--batch 10] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import urllib.parse
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harness import Bridge  # noqa: E402
+from harness import FakeIrcServer  # noqa: E402
+from harness import OWNER_USER_ID  # noqa: E402
+from harness import percentile  # noqa: E402
+from harness import SERVER_NAME  # noqa: E402
+from harness import StubHomeserver  # noqa: E402
+from harness import Tracker  # noqa: E402
+
+WORDS = "the quick brown fox jumps over the lazy dog while the bridge relays every single word".split()
+
+
+class Generator:
+    """Builds a mix of message events and keeps enough state to reply to and edit them."""
+
+    def __init__(self, hs, room_ids, tracker, seed):
+        self.hs = hs
+        self.room_ids = room_ids
+        self.tracker = tracker
+        self.rnd = random.Random(seed)
+        self.last = {}
+        self.counts = {}
+        self.next_id = 0
+
+    def text(self):
+        return " ".join(self.rnd.choices(WORDS, k=self.rnd.randint(3, 30)))
+
+    def event(self, room_id, content):
+        self.next_id += 1
+        return {
+            "event_id": f"$load{self.next_id}:{SERVER_NAME}",
+            "room_id": room_id,
+            "sender": OWNER_USER_ID,
+            "type": "m.room.message",
+            "origin_server_ts": int(time.time() * 1000),
+            "content": content,
+        }
+
+    def plain(self, room_id):
+        return {"msgtype": "m.text", "body": self.tracker.tag(self.text())}
+
+    def html(self, room_id):
+        text = self.tracker.tag(self.text())
+        link = "https://example.com/" + self.rnd.choice(WORDS)
+        return {
+            "msgtype": "m.text",
+            "body": f"{text} {link}",
+            "format": "org.matrix.custom.html",
+            "formatted_body": f"<b>{text}</b> <i>and</i> <code>some code</code> <a href='{link}'>a link</a>",
+        }
+
+    def reply(self, room_id):
+        original = {
+            "event_id": f"$original{self.next_id}:{SERVER_NAME}",
+            "room_id": room_id,
+            "sender": f"@irc_bench_someone:{SERVER_NAME}",
+            "type": "m.room.message",
+            "content": {"msgtype": "m.text", "body": "something worth replying to"},
+        }
+        self.hs.add_event(original)
+
+        text = self.tracker.tag(self.text())
+        return {
+            "msgtype": "m.text",
+            "body": f"> <{original['sender']}> something worth replying to\n\n{text}",
+            "format": "org.matrix.custom.html",
+            "formatted_body": (
+                f"<mx-reply><blockquote><a href='https://matrix.to/#/{original['room_id']}/{original['event_id']}'>"
+                f"In reply to</a> <a href='https://matrix.to/#/{original['sender']}'>{original['sender']}</a>"
+                "<br>something worth replying to</blockquote></mx-reply>"
+                f"{text}"
+            ),
+            "m.relates_to": {"m.in_reply_to": {"event_id": original["event_id"]}},
+        }
+
+    def edit(self, room_id):
+        if room_id not in self.last:
+            return self.plain(room_id)
+
+        # append a tag as a new word so the line diff sent to IRC keeps it
+        (event_id, body) = self.last[room_id]
+        new_body = self.tracker.tag(body)
+        return {
+            "msgtype": "m.text",
+            "body": f"* {new_body}",
+            "m.new_content": {"msgtype": "m.text", "body": new_body},
+            "m.relates_to": {"rel_type": "m.replace", "event_id": event_id},
+        }
+
+    def media(self, room_id):
+        name = self.tracker.tag(self.rnd.choice(WORDS)).replace(" ", "_") + ".png"
+        return {"msgtype": "m.image", "body": name, "url": f"mxc://{SERVER_NAME}/media{self.next_id}"}
+
+    def make(self):
+        room_id = self.rnd.choice(self.room_ids)
+        kind = self.rnd.choices(["plain", "html", "reply", "edit", "media"], [50, 20, 10, 10, 10])[0]
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+        event = self.event(room_id, getattr(self, kind)(room_id))
+        self.hs.add_event(event)
+
+        if kind in ["plain", "html"]:
+            self.last[room_id] = (event["event_id"], event["content"]["body"])
+
+        return event
+
+
+def instrument(bridge, tracker, handoffs):
+    # wrap the live connection, the bridge code itself is untouched
+    room = bridge.serv._rooms[bridge.network_room_id]
+    conn = room.conn
+    send_raw = conn.send_raw
+
+    def timed_send_raw(string, *args, **kwargs):
+        now = time.perf_counter()
+        # media is sent as an URL with the tagged file name quoted
+        for m in tracker.pattern.finditer(urllib.parse.unquote(string)):
+            handoffs.setdefault(int(m.group(1)), now)
+        return send_raw(string, *args, **kwargs)
+
+    conn.send_raw = timed_send_raw
+
+
+def delivered(tracker, lines):
+    seen = {}
+    for (at, line) in lines:
+        for m in tracker.pattern.finditer(urllib.parse.unquote(line)):
+            seen.setdefault(int(m.group(1)), at)
+    return seen
+
+
+def report(title, tracker, seen, elapsed):
+    latencies = [seen[tag] - tracker.sent[tag] for tag in seen if tag in tracker.sent]
+
+    print(f"{title}: {len(latencies)}/{len(tracker.sent)} messages, {len(latencies) / elapsed:.0f} messages/s")
+    if latencies:
+        print(
+            "  latency ms: "
+            + ", ".join(f"p{int(p * 100)} {percentile(latencies, p) * 1000:.1f}" for p in [0.5, 0.9, 0.99])
+            + f", max {max(latencies) * 1000:.1f}"
+        )
+
+
+async def run(args):
+    hs = StubHomeserver(args.hs_latency, args.hs_jitter)
+    irc = FakeIrcServer()
+    await hs.start()
+    await irc.start()
+
+    channels = [f"#load{i}" for i in range(args.rooms)]
+    bridge = Bridge(hs, irc, channels)
+    await bridge.start()
+    await bridge.settle()
+
+    tracker = Tracker()
+    handoffs = {}
+    instrument(bridge, tracker, handoffs)
+
+    generator = Generator(hs, list(bridge.channel_room_ids.values()), tracker, args.seed)
+    transactions = []
+    for i in range(0, args.messages, args.batch):
+        transactions.append([generator.make() for j in range(min(args.batch, args.messages - i))])
+
+    url = f"http://127.0.0.1:{bridge.port}/_matrix/app/v1/transactions"
+    put_latencies = []
+    socket_start = len(irc.received)
+
+    async def pusher(session, queue):
+        while queue:
+            (txn_id, events) = queue.pop()
+            start = time.perf_counter()
+            async with session.put(f"{url}/{txn_id}?access_token=hs_token", json={"events": events}) as resp:
+                await resp.read()
+            put_latencies.append(time.perf_counter() - start)
+
+    queue = list(reversed(list(enumerate(transactions))))
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[pusher(session, queue) for i in range(args.concurrency)])
+    put_elapsed = time.perf_counter() - start
+
+    # wait for everything to be handed to IRC
+    while len(handoffs) < len(tracker.sent) and time.perf_counter() - start < args.timeout:
+        await asyncio.sleep(0.05)
+    handoff_elapsed = max(handoffs.values()) - start if handoffs else float("nan")
+
+    await asyncio.sleep(args.socket_wait)
+    socket = delivered(tracker, irc.received[socket_start:])
+
+    print(f"{args.messages} messages in {len(transactions)} transactions to {args.rooms} rooms")
+    print("  " + ", ".join(f"{kind} {count}" for (kind, count) in sorted(generator.counts.items())))
+    print(
+        f"transactions: {len(transactions) / put_elapsed:.0f}/s, PUT latency ms p50"
+        f" {percentile(put_latencies, 0.5) * 1000:.1f}, p99 {percentile(put_latencies, 0.99) * 1000:.1f}"
+    )
+    report("handed to IRC", tracker, handoffs, handoff_elapsed)
+    report(f"on IRC socket after {args.socket_wait:.0f} s (throttled)", tracker, socket, time.perf_counter() - start)
+
+    calls = sorted(hs.calls.items(), key=lambda item: -item[1])
+    print("homeserver calls: " + ", ".join(f"{name} {count}" for (name, count) in calls))
+
+    await bridge.stop()
+    await irc.stop()
+    await hs.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matrix to IRC load generator")
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=10, help="events per transaction")
+    parser.add_argument("--concurrency", type=int, default=4, help="transactions in flight")
+    parser.add_argument("--hs-latency", type=float, default=0.005, help="seconds added to every homeserver call")
+    parser.add_argument("--hs-jitter", type=float, default=0.005, help="random seconds added on top")
+    parser.add_argument("--socket-wait", type=float, default=5.0, help="seconds to collect lines on the IRC socket")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
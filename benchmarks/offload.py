@@ -0,0 +1,86 @@
+"""
+Measure how long the event loop stalls while large formatted pastes are turned into IRC lines.
+
+A ticker runs every millisecond while the pastes are formatted, once inline and once through the offloader. The worst
+gap between ticks is what every other room and IRC connection had to wait.
+
+Usage: python benchmarks/offload.py [--pastes 10] [--size 50000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.displaynames import Displaynames  # noqa: E402
+from heisenbridge.offload import Offloader  # noqa: E402
+from heisenbridge.offload import OrderedResults  # noqa: E402
+from heisenbridge.private_room import format_irc_lines  # noqa: E402
+
+DISPLAYNAMES = Displaynames({f"@user{i}:example.com": f"user{i}" for i in range(50)})
+
+
+def paste(size):
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        line = f"<b>line {i}</b> <code>value = compute({i}, {i * 2})</code> see <a href='https://example.com/{i}'>x</a>"
+        lines.append(line)
+        length += len(line) + 4
+        i += 1
+    return "<br>".join(lines)
+
+
+async def measure(offloader, pastes):
+    results = OrderedResults()
+    args = ({}, DISPLAYNAMES, False, None, "<someone> ", "nick", "user", "host", "#target")
+    worst = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal worst
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst = max(worst, now - last)
+            last = now
+
+    async def format(body):
+        return await results.wait(offloader.run(len(body), format_irc_lines, {"formatted_body": body}, *args[1:]))
+
+    # warm up the pool so its start up is not measured
+    await offloader.run(len(pastes[0]), format_irc_lines, {"formatted_body": pastes[0]}, *args[1:])
+
+    task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    lines = await asyncio.gather(*[format(body) for body in pastes])
+    elapsed = time.perf_counter() - start
+    running = False
+    await task
+
+    return (elapsed, worst, sum(map(len, lines)))
+
+
+async def run(args):
+    pastes = [paste(args.size) for i in range(args.pastes)]
+
+    for name, offloader in [("inline", Offloader(threshold=sys.maxsize)), ("offloaded", Offloader())]:
+        (elapsed, worst, lines) = await measure(offloader, pastes)
+        offloader.shutdown()
+        print(f"{name:10} {elapsed * 1000:6.0f} ms total, loop stalled at most {worst * 1000:6.1f} ms ({lines} lines)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="formatting offload benchmark")
+    parser.add_argument("--pastes", type=int, default=10)
+    parser.add_argument("--size", type=int, default=50_000, help="formatted body size")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
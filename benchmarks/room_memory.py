@@ -0,0 +1,101 @@
+"""
+Measure memory used by room objects.
+
+Usage: python benchmarks/room_memory.py [--rooms 10000] [--type ChannelRoom] [--trace]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from heisenbridge.__main__ import BridgeAppService  # noqa: E402
+from heisenbridge.matrix import Matrix  # noqa: E402
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def fake_serv():
+    serv = BridgeAppService()
+    serv.api = Matrix("http://localhost:8008", "token")
+    serv.user_id = "@heisenbridge:localhost"
+    serv.server_name = "localhost"
+    serv.puppet_prefix = "irc_"
+    serv.synapse_admin = False
+    serv.endpoint = "http://localhost:8008"
+    serv.registration = {"sender_localpart": "heisenbridge"}
+    serv._rooms = {}
+    serv._users = {}
+    serv.config = {
+        "networks": {"bench": {"servers": []}},
+        "owner": "@owner:localhost",
+        "allow": {},
+        "idents": {},
+        "member_sync": "half",
+        "media_url": None,
+    }
+    return serv
+
+
+def room_config(type, i):
+    config = {"type": type, "user_id": "@owner:localhost"}
+
+    if type == "NetworkRoom":
+        config["name"] = f"bench{i}"
+    elif type != "ControlRoom":
+        config["name"] = f"#bench{i}"
+        config["network"] = "bench"
+
+    return config
+
+
+async def run(args):
+    serv = fake_serv()
+    members = ["@owner:localhost", serv.user_id]
+
+    gc.collect()
+    if args.trace:
+        tracemalloc.start()
+    base_rss = rss()
+    start = time.perf_counter()
+
+    for i in range(args.rooms):
+        serv.init_room(f"!room{i}:localhost", room_config(args.type, i), list(members), {})
+
+    elapsed = time.perf_counter() - start
+    gc.collect()
+
+    print(f"rooms:        {args.rooms} x {args.type}")
+    print(f"init time:    {elapsed:.2f} s ({elapsed / args.rooms * 1000:.3f} ms/room)")
+    print(
+        f"RSS growth:   {(rss() - base_rss) / 1024 / 1024:.1f} MiB ({(rss() - base_rss) / args.rooms / 1024:.1f} KiB/room)"
+    )
+    print(f"loop tasks:   {len(asyncio.all_tasks())}")
+
+    if args.trace:
+        mem = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"traced heap:  {mem / 1024 / 1024:.1f} MiB ({mem / args.rooms / 1024:.1f} KiB/room)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="room memory benchmark")
+    parser.add_argument("--rooms", type=int, default=10000)
+    parser.add_argument("--trace", action="store_true", help="also measure traced Python heap (slow)")
+    parser.add_argument(
+        "--type",
+        default="ChannelRoom",
+        choices=["ControlRoom", "NetworkRoom", "PrivateRoom", "ChannelRoom", "PlumbedRoom"],
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Measure how IRC to Matrix throughput scales with the number of shards.
+
+The bridge is started as its own process from the command line, unsharded and with each --shards count in turn, against
+the fake IRC server and stub homeserver from harness.py. Every user has a network room and a channel room on the same
+IRC channel so each line sent to the channel is relayed to Matrix once per user, by whichever shard owns them.
+
+The fake IRC server and stub homeserver run in this process, they need a core of their own for the bridge to be the
+bottleneck and there is no scaling to be seen with fewer cores than shards.
+
+Usage: python benchmarks/shards.py [--shards 0,1,2,4] [--users 8] [--lines 1000] [--senders 10]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harness import BOT_USER_ID  # noqa: E402
+from harness import free_port  # noqa: E402
+from harness import percentile  # noqa: E402
+from harness import FakeIrcServer  # noqa: E402
+from harness import NETWORK  # noqa: E402
+from harness import SERVER_NAME  # noqa: E402
+from harness import StubHomeserver  # noqa: E402
+from harness import Tracker  # noqa: E402
+
+CHANNEL = "#bench"
+REGISTRATION = {
+    "id": "heisenbridge",
+    "url": "http://127.0.0.1:9898",
+    "as_token": "as_token",
+    "hs_token": "hs_token",
+    "rate_limited": False,
+    "sender_localpart": "heisenbridge",
+    "namespaces": {"users": [{"regex": "@irc_.*", "exclusive": True}], "aliases": [], "rooms": []},
+}
+
+
+def seed(hs, irc, users):
+    hs.account_data[(BOT_USER_ID, None, "irc")] = {
+        "networks": {NETWORK: {"servers": [{"address": "127.0.0.1", "port": irc.port, "tls": False}]}},
+        "owner": f"@user0:{SERVER_NAME}",
+        "allow": {f"*:{SERVER_NAME}": "user"},
+        "idents": {},
+        "member_sync": "half",
+        "media_url": "http://localhost",
+    }
+
+    for i in range(users):
+        user_id = f"@user{i}:{SERVER_NAME}"
+
+        hs.add_room(
+            f"!network{i}:{SERVER_NAME}",
+            [BOT_USER_ID, user_id],
+            {"type": "NetworkRoom", "user_id": user_id, "name": NETWORK, "connected": True, "nick": f"bridge{i}"},
+        )
+        hs.add_room(
+            f"!channel{i}:{SERVER_NAME}",
+            [BOT_USER_ID, user_id],
+            {"type": "ChannelRoom", "user_id": user_id, "name": CHANNEL, "network": NETWORK, "member_sync": "half"},
+        )
+
+
+def delivered(hs, tracker, since):
+    latencies = []
+
+    for (at, room_id, sender, type, content) in hs.events[since:]:
+        for m in tracker.pattern.finditer(content.get("body", "")):
+            latencies.append(at - tracker.sent[int(m.group(1))])
+
+    return latencies
+
+
+async def wait_for(check, timeout):
+    start = time.perf_counter()
+
+    while not check():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError()
+        await asyncio.sleep(0.05)
+
+
+async def measure(shards, args, registration):
+    hs = StubHomeserver()
+    irc = FakeIrcServer()
+    await hs.start()
+    await irc.start()
+    seed(hs, irc, args.users)
+
+    command = [sys.executable, "-m", "heisenbridge", "-c", registration, "-p", str(free_port())]
+    if shards > 0:
+        command += ["--shards", str(shards)]
+    if args.fast:
+        command += ["--fast"]
+
+    proc = await asyncio.create_subprocess_exec(
+        *command, hs.url, stdout=asyncio.subprocess.DEVNULL, start_new_session=True
+    )
+
+    try:
+        # network rooms are connected one per second in every process
+        await wait_for(lambda: sum(CHANNEL in client.channels for client in irc.clients) == args.users, args.timeout)
+
+        # the first lines register the senders and join them to the rooms
+        tracker = Tracker()
+        nicks = [f"talker{i}" for i in range(args.senders)]
+        for nick in nicks:
+            irc.privmsg(nick, CHANNEL, tracker.tag("hello"))
+        await wait_for(lambda: len(delivered(hs, tracker, 0)) == len(nicks) * args.users, args.timeout)
+
+        tracker = Tracker()
+        since = len(hs.events)
+        calls = sum(hs.calls.values())
+        start = time.perf_counter()
+
+        for i in range(args.lines):
+            irc.privmsg(nicks[i % len(nicks)], CHANNEL, tracker.tag(f"\x02message\x02 number {i} from the benchmark"))
+            if i % 100 == 99:
+                await irc.drain()
+        await irc.drain()
+
+        await wait_for(lambda: len(delivered(hs, tracker, since)) >= args.lines * args.users, args.timeout)
+        elapsed = time.perf_counter() - start
+        latencies = delivered(hs, tracker, since)
+
+        return (elapsed, latencies, sum(hs.calls.values()) - calls)
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        await proc.wait()
+        await irc.stop()
+        await hs.stop()
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        registration = os.path.join(tmp, "registration.yaml")
+        with open(registration, "w") as f:
+            yaml.dump(REGISTRATION, f)
+
+        print(f"{os.cpu_count()} cores, {args.users} users, {args.lines} lines relayed to each of them")
+
+        for shards in [int(shards) for shards in args.shards.split(",")]:
+            (elapsed, latencies, calls) = await measure(shards, args, registration)
+            name = f"{shards} shards" if shards > 0 else "unsharded"
+
+            print(
+                f"{name:10} {len(latencies) / elapsed:7.0f} messages/s, {calls} homeserver calls, latency ms: "
+                + ", ".join(f"p{int(p * 100)} {percentile(latencies, p) * 1000:.0f}" for p in [0.5, 0.99])
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sharding benchmark")
+    parser.add_argument("--shards", default="0,1,2,4", help="comma separated shard counts, 0 is unsharded")
+    parser.add_argument("--users", type=int, default=8, help="users with their own IRC connection")
+    parser.add_argument("--lines", type=int, default=1000, help="lines sent to the channel")
+    parser.add_argument("--senders", type=int, default=10, help="IRC users sending the lines")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for delivery")
+    parser.add_argument("--fast", action="store_true", help="run the bridge with --fast")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
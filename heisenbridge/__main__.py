@@ -1,17 +1,22 @@
 import argparse
 import asyncio
 import grp
+import json
 import logging
 import os
 import pwd
 import random
 import re
+import signal
 import string
+import subprocess
 import sys
 import urllib
+from collections import OrderedDict
 from fnmatch import fnmatch
 from typing import Dict
 from typing import List
+from typing import Optional
 from typing import Tuple
 
 import aiohttp
@@ -23,6 +28,7 @@ from heisenbridge import __version__
 from heisenbridge.appservice import AppService
 from heisenbridge.channel_room import ChannelRoom
 from heisenbridge.control_room import ControlRoom
+from heisenbridge.control_room import forget_user
 from heisenbridge.identd import Identd
 from heisenbridge.matrix import Matrix
 from heisenbridge.matrix import MatrixError
@@ -31,21 +37,86 @@ from heisenbridge.matrix import MatrixUserInUse
 from heisenbridge.network_room import NetworkRoom
 from heisenbridge.plumbed_room import PlumbedRoom
 from heisenbridge.private_room import PrivateRoom
+from heisenbridge.profiler import Profiler
+from heisenbridge.profiler import ProfilerBusyError
 from heisenbridge.room import Room
 from heisenbridge.room import RoomInvalidError
+from heisenbridge.runtime import install_uvloop
+from heisenbridge.runtime import JsonCodec
+from heisenbridge.shard import Coordinator
+from heisenbridge.shard import ShardWorker
+from heisenbridge.transaction import TransactionParser
 
 
 class BridgeAppService(AppService):
     _rooms: Dict[str, Room]
     _users: Dict[str, str]
 
+    codec: JsonCodec = JsonCodec()
+
+    # set in worker processes to only handle the rooms of some users, or in the coordinator that routes events to them
+    shard: Optional[ShardWorker] = None
+    coordinator: Optional[Coordinator] = None
+
+    # events being handled at once before reading more of a transaction, transactions larger than stream_size bytes
+    # are decoded while they are received and recent transaction ids are remembered to skip retries
+    max_event_tasks = 100
+    stream_size = 256 * 1024
+    txn_history = 100
+
+    # the snapshot is written this many seconds after a room saved its config and every snapshot_interval anyway
+    snapshot_file: Optional[str] = None
+    snapshot_delay = 5.0
+    snapshot_interval = 300
+
+    _snapshot_pending: Optional[asyncio.TimerHandle] = None
+    _snapshot_lock: Optional[asyncio.Lock] = None
+
+    # room types that can be restored from config
+    room_types = {
+        room_type.__name__: room_type for room_type in [ControlRoom, NetworkRoom, PrivateRoom, ChannelRoom, PlumbedRoom]
+    }
+
     def register_room(self, room: Room):
         self._rooms[room.id] = room
 
+        if self.shard:
+            self.shard.register(room.id)
+
     def unregister_room(self, room_id):
         if room_id in self._rooms:
             del self._rooms[room_id]
 
+            if self.shard:
+                self.shard.unregister(room_id)
+
+    def owns_room(self, config) -> bool:
+        return self.shard is None or self.shard.owns(config.get("user_id", ""))
+
+    async def on_shard_command(self, command):
+        # replies go straight to the room the command came from, that room lives in another shard
+        lines = []
+
+        try:
+            if command["command"] == "forget":
+                await forget_user(self, command["user_id"], lines.append)
+            else:
+                lines.append(f"Unknown shard command {command['command']}")
+        except Exception:
+            logging.exception(f"Shard command {command} failed.")
+            lines.append("Failed, see bridge log for details.")
+
+        await self.api.put_room_send_event(
+            command["room_id"], "m.room.message", {"msgtype": "m.notice", "body": "\n".join(lines)}
+        )
+
+    async def save(self):
+        # the homeserver is written once and other shards are told about it
+        if self.shard:
+            self.shard.share_config(self.config)
+
+        await super().save()
+
     # this is mostly used by network rooms at init, it's a bit slow
     def find_rooms(self, rtype=None, user_id=None) -> List[Room]:
         ret = []
@@ -218,20 +289,97 @@ class BridgeAppService(AppService):
                 # show help on open
                 await room.show_help()
             except Exception:
-                if event["room_id"] in self._rooms:
-                    del self._rooms[event["room_id"]]
+                self.unregister_room(event["room_id"])
                 logging.exception("Failed to create control room.")
         else:
             pass
             # print(json.dumps(event, indent=4, sort_keys=True))
 
+    async def _dispatch(self, event):
+        if self.coordinator:
+            await self.coordinator.dispatch(event)
+            return
+
+        await self._event_tasks.acquire()
+        task = asyncio.ensure_future(self._on_mx_event(event))
+        task.add_done_callback(lambda task: self._event_tasks.release())
+
     async def _transaction(self, req):
-        body = await req.json()
+        txn_id = req.match_info["id"]
+
+        # a retry of a transaction that is still being read waits for it to finish or fail
+        while txn_id in self._txn_pending:
+            logging.debug(f"Transaction {txn_id} is already being handled, waiting for it")
+            await asyncio.wait([self._txn_pending[txn_id]])
+
+        if txn_id in self._txn_ids:
+            logging.debug(f"Transaction {txn_id} was already handled, skipping")
+            return web.json_response({}, dumps=self.codec.dumps)
+
+        # events of a transaction that was cut short are not dispatched again when it is retried
+        dispatched = self._txn_events.pop(txn_id, set())
+        self._txn_events[txn_id] = dispatched
+        if len(self._txn_events) > self.txn_history:
+            self._txn_events.popitem(last=False)
+
+        async def dispatch(event):
+            event_id = event.get("event_id")
+            if event_id in dispatched:
+                return
+
+            await self._dispatch(event)
+
+            if event_id is not None:
+                dispatched.add(event_id)
+
+        self._txn_pending[txn_id] = asyncio.get_event_loop().create_future()
+
+        try:
+            if req.content_length is not None and req.content_length <= self.stream_size:
+                for event in self.codec.loads(await req.read())["events"]:
+                    await dispatch(event)
+            else:
+                parser = TransactionParser()
+
+                async for data in req.content.iter_chunked(64 * 1024):
+                    for event in parser.feed(data):
+                        await dispatch(event)
+
+                for event in parser.close():
+                    await dispatch(event)
+        except (ValueError, KeyError, TypeError):
+            logging.exception(f"Failed to decode transaction {txn_id}")
+            return web.json_response({"errcode": "M_NOT_JSON", "error": "Invalid transaction"}, status=400)
+        finally:
+            self._txn_pending.pop(txn_id).set_result(None)
+
+        self._txn_events.pop(txn_id, None)
+        self._txn_ids[txn_id] = True
+        if len(self._txn_ids) > self.txn_history:
+            self._txn_ids.popitem(last=False)
+
+        return web.json_response({}, dumps=self.codec.dumps)
+
+    async def _profile(self, req):
+        token = req.headers.get("Authorization", "").replace("Bearer ", "", 1) or req.query.get("access_token")
+        if token != self.registration["as_token"]:
+            return web.Response(status=403, text="Forbidden\n")
+
+        try:
+            seconds = float(req.query.get("seconds", 10))
+            slow = float(req.query.get("slow", 100))
+        except ValueError:
+            return web.Response(status=400, text="Invalid seconds or slow\n")
 
-        for event in body["events"]:
-            asyncio.ensure_future(self._on_mx_event(event))
+        if seconds <= 0 or seconds > 300:
+            return web.Response(status=400, text="Profiling time must be between 0 and 300 seconds\n")
 
-        return web.json_response({})
+        try:
+            summary = await self.profiler.profile(seconds, slow / 1000)
+        except (ProfilerBusyError, ValueError) as e:
+            return web.Response(status=409, text=f"{str(e)}\n")
+
+        return web.Response(text=summary + "\n")
 
     async def detect_public_endpoint(self):
         async with ClientSession() as session:
@@ -272,7 +420,7 @@ class BridgeAppService(AppService):
         with open(config_file) as f:
             registration = yaml.safe_load(f)
 
-        self.api = Matrix(homeserver_url, registration["as_token"])
+        self.api = Matrix(homeserver_url, registration["as_token"], self.codec)
 
         whoami = await self.api.get_user_whoami()
         self.user_id = whoami["user_id"]
@@ -326,11 +474,238 @@ class BridgeAppService(AppService):
         asyncio.ensure_future(put_presence())
         asyncio.get_event_loop().call_later(60, self._keepalive)
 
-    async def run(self, listen_address, listen_port, homeserver_url, owner):
+    def init_room(self, room_id, config, members, displaynames) -> Room:
+        if "type" not in config or "user_id" not in config:
+            raise Exception("Invalid config")
+
+        cls = self.room_types.get(config["type"])
+        if not cls:
+            raise Exception("Unknown room type")
+
+        room = cls(id=room_id, user_id=config["user_id"], serv=self, members=members)
+        room.from_config(config)
+        room.loaded(config)
+
+        for user_id, displayname in displaynames.items():
+            room.displaynames[user_id] = displayname
+
+        # only add valid rooms to event handler
+        if not room.is_valid():
+            room.cleanup()
+            raise Exception("Room validation failed after init")
+
+        self.register_room(room)
+        return room
+
+    async def import_room(self, room_id, leave=True):
+        members = None
+
+        try:
+            config = await self.api.get_room_account_data(self.user_id, room_id, "irc")
+
+            # another shard takes care of it
+            if not self.owns_room(config):
+                self._foreign.add(room_id)
+                return
+
+            joined_members = (await self.api.get_room_joined_members(room_id))["joined"]
+            displaynames = {}
+
+            # add to room displayname
+            for user_id, data in joined_members.items():
+                if "display_name" in data and data["display_name"] is not None:
+                    displaynames[user_id] = str(data["display_name"])
+
+                # add to global puppet cache if it's a puppet
+                if user_id.startswith("@" + self.puppet_prefix) and self.is_local(user_id):
+                    self._users[user_id] = str(data["display_name"])
+
+            self.init_room(room_id, config, list(joined_members.keys()), displaynames)
+        except Exception:
+            if not leave:
+                logging.exception(f"Failed to reconfigure room {room_id}, ignoring.")
+                return
+
+            logging.exception(f"Failed to reconfigure room {room_id} during init, leaving.")
+
+            self.unregister_room(room_id)
+            await self.leave_room(room_id, members)
+
+    def load_snapshot(self):
+        try:
+            with open(self.snapshot_file) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            logging.info("No snapshot found, doing a full load from homeserver.")
+            return None
+        except Exception:
+            logging.exception("Failed to read snapshot, doing a full load from homeserver.")
+            return None
+
+        if snapshot.get("version") != 1 or snapshot.get("user_id") != self.user_id:
+            logging.warning("Snapshot does not match this bridge, ignoring it.")
+            return None
+
+        return snapshot
+
+    async def save_snapshot(self):
+        if self._snapshot_lock is None:
+            self._snapshot_lock = asyncio.Lock()
+
+        # one write at a time so they land in order and never share the temporary file
+        async with self._snapshot_lock:
+            snapshot = self._gather_snapshot()
+            await asyncio.get_event_loop().run_in_executor(None, self._write_snapshot, snapshot)
+
+    def _gather_snapshot(self) -> dict:
+        # everything is copied on the loop so serializing it in another thread doesn't race with events
+        rooms = {}
+
+        for room_id, room in self._rooms.items():
+            rooms[room_id] = {
+                "config": room.get_config(),
+                "members": list(room.members),
+                "displaynames": dict(room.displaynames),
+            }
+
+        return {
+            "version": 1,
+            "user_id": self.user_id,
+            "endpoint": self.endpoint,
+            "users": dict(self._users),
+            "rooms": rooms,
+            "shards": self.shard.shards if self.shard else 0,
+            "foreign": list(self._foreign),
+        }
+
+    def _write_snapshot(self, snapshot: dict) -> None:
+        try:
+            tmp_file = self.snapshot_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+            os.replace(tmp_file, self.snapshot_file)
+            logging.debug(f"Saved snapshot of {len(snapshot['rooms'])} rooms to {self.snapshot_file}")
+        except Exception:
+            logging.exception("Failed to save snapshot.")
+
+    def _snapshot_loop(self):
+        asyncio.get_event_loop().call_later(self.snapshot_interval, self._snapshot_loop)
+        asyncio.ensure_future(self.save_snapshot())
+
+    def snapshot_later(self):
+        if self.snapshot_file and self._snapshot_pending is None:
+            self._snapshot_pending = asyncio.get_event_loop().call_later(self.snapshot_delay, self._snapshot_later)
+
+    def _snapshot_later(self):
+        self._snapshot_pending = None
+        asyncio.ensure_future(self.save_snapshot())
+
+    def stop(self):
+        self._stopped.set()
+
+    async def reconcile(self):
+        logging.info("Reconciling rooms restored from snapshot with homeserver...")
+
+        resp = await self.api.get_user_joined_rooms()
+        joined_rooms = resp["joined_rooms"]
+
+        # drop rooms we are no longer in
+        for room_id in list(self._rooms.keys()):
+            if room_id not in joined_rooms:
+                logging.info(f"Room {room_id} from snapshot is no longer joined, dropping it.")
+                room = self._rooms[room_id]
+                self.unregister_room(room_id)
+                room.cleanup()
+
+        for room_id in joined_rooms:
+            room = self._rooms.get(room_id)
+
+            # rooms missing from the snapshot were loaded at startup
+            if room is None:
+                continue
+
+            # live events keep coming while we wait, only what the homeserver has different from now is applied
+            members = set(room.members)
+            displaynames = dict(room.displaynames)
+
+            try:
+                config = await self.api.get_room_account_data(self.user_id, room_id, "irc")
+                joined_members = (await self.api.get_room_joined_members(room_id))["joined"]
+            except Exception:
+                logging.exception(f"Failed to refresh {room_id}.")
+                continue
+
+            # the config may have changed after the snapshot was written, saving the old one would overwrite it
+            if config != room.get_config():
+                logging.info(f"Room {room_id} config changed since snapshot, reloading it.")
+                room.from_config(config)
+                room.loaded(config)
+
+            for user_id in members:
+                if user_id not in joined_members and user_id in room.members:
+                    room.members.remove(user_id)
+
+            for user_id in joined_members:
+                if user_id not in members and user_id not in room.members:
+                    room.members.append(user_id)
+
+            for user_id, displayname in displaynames.items():
+                if user_id not in joined_members and room.displaynames.get(user_id) == displayname:
+                    del room.displaynames[user_id]
+
+            current = set(room.members)
+            for user_id, data in joined_members.items():
+                if user_id not in current or room.displaynames.get(user_id) != displaynames.get(user_id):
+                    # a live event got there first
+                    pass
+                elif "display_name" in data and data["display_name"] is not None:
+                    room.displaynames[user_id] = str(data["display_name"])
+                elif user_id in room.displaynames:
+                    del room.displaynames[user_id]
+
+                if user_id.startswith("@" + self.puppet_prefix) and self.is_local(user_id):
+                    self._users[user_id] = str(data["display_name"])
+
+        if not self.config["media_url"]:
+            self.endpoint = await self.detect_public_endpoint()
+
+        await self.save_snapshot()
+        logging.info("Reconcile done.")
 
+    async def _listen(self, listen_address, listen_port):
         app = aiohttp.web.Application()
         app.router.add_put("/transactions/{id}", self._transaction)
         app.router.add_put("/_matrix/app/v1/transactions/{id}", self._transaction)
+        app.router.add_get("/_heisenbridge/profile", self._profile)
+
+        runner = aiohttp.web.AppRunner(app)
+        await runner.setup()
+        site = aiohttp.web.TCPSite(runner, listen_address, listen_port)
+        await site.start()
+
+    async def run_coordinator(self, listen_address, listen_port, coordinator, spawn):
+        print(f"Heisenbridge v{__version__} with {coordinator.shards} shards", flush=True)
+
+        self._rooms = {}
+        self._txn_ids = OrderedDict()
+        self._txn_pending = {}
+        self._txn_events = OrderedDict()
+        self.profiler = Profiler(self)
+        self.coordinator = coordinator
+
+        try:
+            await coordinator.start(spawn)
+            await self._listen(listen_address, listen_port)
+
+            logging.info("All shards are ready, bridge is now running!")
+
+            index = await coordinator.wait_closed()
+            logging.error(f"Shard {index} exited, stopping.")
+        finally:
+            coordinator.stop()
+
+    async def run(self, listen_address, listen_port, homeserver_url, owner, snapshot_file=None):
+        self._stopped = asyncio.Event()
 
         if "sender_localpart" not in self.registration:
             print("Missing sender_localpart from registration file.")
@@ -361,7 +736,7 @@ class BridgeAppService(AppService):
 
         print(f"Heisenbridge v{__version__}", flush=True)
 
-        self.api = Matrix(homeserver_url, self.registration["as_token"])
+        self.api = Matrix(homeserver_url, self.registration["as_token"], self.codec)
 
         try:
             await self.api.post_user_register(
@@ -379,8 +754,18 @@ class BridgeAppService(AppService):
         whoami = await self.api.get_user_whoami()
         logging.info("We are " + whoami["user_id"])
 
+        # restore transaction ids so sends retried after a restart are not duplicated
+        await self.api.load_txn(whoami["user_id"], self.shard.index if self.shard else None)
+
         self._rooms = {}
         self._users = {}
+        self._foreign = set()
+        self._event_tasks = asyncio.Semaphore(self.max_event_tasks)
+        self._txn_ids = OrderedDict()
+        self._txn_pending = {}
+        self._txn_events = OrderedDict()
+        self.profiler = Profiler(self)
+        self.snapshot_file = snapshot_file
         self.user_id = whoami["user_id"]
         self.server_name = self.user_id.split(":")[1]
         self.config = {
@@ -394,6 +779,10 @@ class BridgeAppService(AppService):
         logging.debug(f"Default config: {self.config}")
         self.synapse_admin = False
 
+        if self.shard:
+            logging.info(f"Running as shard {self.shard.index} of {self.shard.shards}")
+            await self.shard.connect(self)
+
         try:
             is_admin = await self.api.get_synapse_admin_users_admin(self.user_id)
             self.synapse_admin = is_admin["admin"]
@@ -405,9 +794,14 @@ class BridgeAppService(AppService):
         # load config from HS
         await self.load()
 
+        snapshot = self.load_snapshot() if self.snapshot_file else None
+
         # use configured media_url for endpoint if we have it
         if self.config["media_url"]:
             self.endpoint = self.config["media_url"]
+        elif snapshot and snapshot.get("endpoint"):
+            # detection is retried when reconciling
+            self.endpoint = snapshot["endpoint"]
         else:
             self.endpoint = await self.detect_public_endpoint()
 
@@ -416,6 +810,9 @@ class BridgeAppService(AppService):
         logging.info("Starting presence loop")
         self._keepalive()
 
+        logging.info("Starting event loop monitor")
+        self.monitor().start()
+
         # do a little migration for servers, remove this later
         for network in self.config["networks"].values():
             new_servers = []
@@ -436,60 +833,44 @@ class BridgeAppService(AppService):
             self.config["owner"] = owner
             await self.save()
 
-        resp = await self.api.get_user_joined_rooms()
-        logging.debug(f"Appservice rooms: {resp['joined_rooms']}")
-
-        # room types and their init order, network must be before chat and group
-        room_types = [ControlRoom, NetworkRoom, PrivateRoom, ChannelRoom, PlumbedRoom]
-
-        room_type_map = {}
-        for room_type in room_types:
-            room_type_map[room_type.__name__] = room_type
-
-        # import all rooms
-        for room_id in resp["joined_rooms"]:
-            members = None
+        if snapshot:
+            logging.info(f"Restoring {len(snapshot['rooms'])} rooms from snapshot, reconciling later.")
 
-            try:
-                config = await self.api.get_room_account_data(self.user_id, room_id, "irc")
+            self._users.update(snapshot["users"])
 
-                if "type" not in config or "user_id" not in config:
-                    raise Exception("Invalid config")
+            # rooms of other shards are only known to be theirs if the shards have not changed since
+            if snapshot.get("shards") == (self.shard.shards if self.shard else 0):
+                self._foreign.update(snapshot.get("foreign", []))
 
-                cls = room_type_map.get(config["type"])
-                if not cls:
-                    raise Exception("Unknown room type")
+            for room_id, data in snapshot["rooms"].items():
+                # shards may have been added or removed since
+                if not self.owns_room(data["config"]):
+                    continue
 
-                joined_members = (await self.api.get_room_joined_members(room_id))["joined"]
+                try:
+                    self.init_room(room_id, data["config"], data["members"], data["displaynames"])
+                except Exception:
+                    logging.exception(f"Failed to restore room {room_id} from snapshot, will retry from homeserver.")
 
-                room = cls(id=room_id, user_id=config["user_id"], serv=self, members=list(joined_members.keys()))
-                room.from_config(config)
+            # rooms joined after the snapshot was written are loaded normally, before networks attach their rooms
+            resp = await self.api.get_user_joined_rooms()
+            self._foreign.intersection_update(resp["joined_rooms"])
 
-                # add to room displayname
-                for user_id, data in joined_members.items():
-                    if "display_name" in data and data["display_name"] is not None:
-                        room.displaynames[user_id] = str(data["display_name"])
-
-                    # add to global puppet cache if it's a puppet
-                    if user_id.startswith("@" + self.puppet_prefix) and self.is_local(user_id):
-                        self._users[user_id] = str(data["display_name"])
-
-                # only add valid rooms to event handler
-                if room.is_valid():
-                    self._rooms[room_id] = room
-                else:
-                    room.cleanup()
-                    raise Exception("Room validation failed after init")
-            except Exception:
-                logging.exception(f"Failed to reconfigure room {room_id} during init, leaving.")
+            for room_id in resp["joined_rooms"]:
+                if room_id not in self._rooms and room_id not in self._foreign:
+                    await self.import_room(room_id, leave=False)
+        else:
+            resp = await self.api.get_user_joined_rooms()
+            logging.debug(f"Appservice rooms: {resp['joined_rooms']}")
 
-                self.unregister_room(room_id)
-                await self.leave_room(room_id, members)
+            # import all rooms
+            for room_id in resp["joined_rooms"]:
+                await self.import_room(room_id)
 
-        runner = aiohttp.web.AppRunner(app)
-        await runner.setup()
-        site = aiohttp.web.TCPSite(runner, listen_address, listen_port)
-        await site.start()
+        if self.shard:
+            self.shard.ready()
+        else:
+            await self._listen(listen_address, listen_port)
 
         logging.info("Connecting network rooms...")
 
@@ -504,9 +885,27 @@ class BridgeAppService(AppService):
                 asyncio.get_event_loop().call_later(wait, sync_connect, room)
                 wait += 1
 
+        if snapshot:
+            asyncio.ensure_future(self.reconcile())
+
+        if self.snapshot_file:
+            self._snapshot_loop()
+
         logging.info("Init done, bridge is now running!")
 
-        await asyncio.Event().wait()
+        stopped = asyncio.ensure_future(self._stopped.wait())
+
+        if self.shard:
+            await asyncio.wait(
+                [stopped, asyncio.ensure_future(self.shard.wait_closed())], return_when=asyncio.FIRST_COMPLETED
+            )
+        else:
+            await stopped
+
+        logging.info("Stopping bridge.")
+
+        if self.snapshot_file:
+            await self.save_snapshot()
 
 
 def main():
@@ -536,6 +935,19 @@ def main():
     parser.add_argument("-g", "--gid", help="group id to run as", default=None)
     parser.add_argument("-i", "--identd", action="store_true", help="enable identd service")
     parser.add_argument("--identd-port", type=int, default="113", help="identd listen port")
+    parser.add_argument("--snapshot", help="local state snapshot file for fast startup", default=None)
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="spread users over this many worker processes, STATUS only lists users of the same shard",
+    )
+    parser.add_argument("--shard", help=argparse.SUPPRESS, default=None)
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="use uvloop and a faster JSON library (orjson or ujson) when installed",
+    )
     parser.add_argument(
         "--generate",
         action="store_true",
@@ -575,7 +987,20 @@ def main():
         if args.verbose > 1:
             logging_level = logging.DEBUG
 
-    logging.basicConfig(stream=sys.stdout, level=logging_level)
+    if args.shard is not None:
+        logging.basicConfig(
+            stream=sys.stdout,
+            level=logging_level,
+            format=f"shard {args.shard.split(':')[0]}:%(levelname)s:%(name)s:%(message)s",
+        )
+    else:
+        logging.basicConfig(stream=sys.stdout, level=logging_level)
+
+    # needs to be done before the event loop is created
+    codec = JsonCodec(fast=args.fast)
+    if args.fast:
+        uvloop = install_uvloop()
+        logging.info(f"Fast runtime with {'uvloop' if uvloop else 'the default event loop'} and {codec.name}")
 
     if "generate" in args or "generate_compat" in args:
         letters = string.ascii_letters + string.digits
@@ -607,6 +1032,7 @@ def main():
         print(f"Registration file generated and saved to {args.config}")
     elif "reset" in args:
         service = BridgeAppService()
+        service.codec = codec
         loop = asyncio.get_event_loop()
         loop.run_until_complete(service.reset(args.config, args.homeserver))
         loop.close()
@@ -615,10 +1041,15 @@ def main():
     else:
         loop = asyncio.get_event_loop()
         service = BridgeAppService()
+        service.codec = codec
         identd = None
 
         service.load_reg(args.config)
 
+        if args.identd and args.shards > 0:
+            print("Identd is not supported with shards.")
+            sys.exit(1)
+
         if args.identd:
             identd = Identd()
             loop.run_until_complete(identd.start_listening(service, args.identd_port))
@@ -635,7 +1066,43 @@ def main():
 
         os.umask(0o077)
 
-        loop.run_until_complete(service.run(args.listen_address, args.listen_port, args.homeserver, args.owner))
+        if args.shards > 0 and args.shard is None:
+            workers = []
+
+            # workers are started with the same arguments, they have already dropped privileges
+            def spawn(index, path):
+                command = [sys.executable, "-m", __package__] + sys.argv[1:] + ["--shard", f"{index}:{path}"]
+                workers.append(subprocess.Popen(command))
+
+            try:
+                loop.run_until_complete(
+                    service.run_coordinator(
+                        args.listen_address, args.listen_port, Coordinator(args.shards, codec), spawn
+                    )
+                )
+            finally:
+                for worker in workers:
+                    worker.terminate()
+
+            loop.close()
+            sys.exit(1)
+
+        snapshot = args.snapshot
+
+        if args.shard is not None:
+            (index, path) = args.shard.split(":", 1)
+            service.shard = ShardWorker(int(index), args.shards, path)
+
+            if snapshot:
+                snapshot += "." + index
+
+        # stopping cleanly writes the snapshot one last time
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            loop.add_signal_handler(signum, service.stop)
+
+        loop.run_until_complete(
+            service.run(args.listen_address, args.listen_port, args.homeserver, args.owner, snapshot)
+        )
         loop.close()
 
 
@@ -4,6 +4,9 @@ from typing import List
 
 from heisenbridge.matrix import Matrix
 from heisenbridge.matrix import MatrixNotFound
+from heisenbridge.monitor import Monitor
+from heisenbridge.offload import Offloader
+from heisenbridge.persist import DebouncedSave
 
 
 class Room:
@@ -16,14 +19,42 @@ class AppService(ABC):
     server_name: str
     config: dict
 
+    _saver: DebouncedSave = None
+    _monitor: Monitor = None
+    _offloader: Offloader = None
+
     async def load(self):
         try:
-            self.config.update(await self.api.get_user_account_data(self.user_id, "irc"))
+            config = await self.api.get_user_account_data(self.user_id, "irc")
+            self.config.update(config)
+            self.saver().saved(config)
         except MatrixNotFound:
             await self.save()
 
+    def saver(self) -> DebouncedSave:
+        if self._saver is None:
+            self._saver = DebouncedSave(lambda config: self.api.put_user_account_data(self.user_id, "irc", config))
+
+        return self._saver
+
+    def monitor(self) -> Monitor:
+        if self._monitor is None:
+            self._monitor = Monitor()
+
+        return self._monitor
+
+    def offloader(self) -> Offloader:
+        if self._offloader is None:
+            self._offloader = Offloader()
+
+        return self._offloader
+
     async def save(self):
-        await self.api.put_user_account_data(self.user_id, "irc", self.config)
+        await self.saver().save(lambda: self.config)
+
+    def snapshot_later(self) -> None:
+        """Called when a room has changed its config, a local snapshot of rooms should be written soon."""
+        pass
 
     async def create_room(self, name: str, topic: str, invite: List[str]) -> str:
         resp = await self.api.post_room_create(
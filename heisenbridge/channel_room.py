@@ -7,6 +7,7 @@ from typing import Optional
 
 from irc.modes import parse_channel_modes
 
+from heisenbridge.command_parse import CommandManager
 from heisenbridge.command_parse import CommandParser
 from heisenbridge.private_room import parse_irc_formatting
 from heisenbridge.private_room import PrivateRoom
@@ -24,14 +25,12 @@ class ChannelRoom(PrivateRoom):
     names_buffer: List[str]
     bans_buffer: List[str]
 
-    def init(self) -> None:
-        super().init()
+    # channels are more about throughput than the quick back and forth of a conversation
+    merge_delay = 0.1
 
-        self.key = None
-        self.autocmd = None
-
-        # for migration the class default is full
-        self.member_sync = "full"
+    @classmethod
+    def init_commands(cls, commands: CommandManager) -> None:
+        super().init_commands(commands)
 
         cmd = CommandParser(
             prog="AUTOCMD",
@@ -43,7 +42,7 @@ class ChannelRoom(PrivateRoom):
         )
         cmd.add_argument("command", nargs="*", help="commands separated with ';'")
         cmd.add_argument("--remove", action="store_true", help="remove stored command")
-        self.commands.register(cmd, self.cmd_autocmd)
+        commands.register(cmd, "cmd_autocmd")
 
         cmd = CommandParser(
             prog="SYNC",
@@ -61,7 +60,7 @@ class ChannelRoom(PrivateRoom):
             help="disable member sync completely, the bridge will relay all messages, may be useful during spam attacks",
             action="store_true",
         )
-        self.commands.register(cmd, self.cmd_sync)
+        commands.register(cmd, "cmd_sync")
 
         cmd = CommandParser(
             prog="MODE",
@@ -75,7 +74,7 @@ class ChannelRoom(PrivateRoom):
             ),
         )
         cmd.add_argument("args", nargs="*", help="MODE command arguments")
-        self.commands.register(cmd, self.cmd_mode)
+        commands.register(cmd, "cmd_mode")
 
         cmd = CommandParser(
             prog="NAMES",
@@ -89,53 +88,62 @@ class ChannelRoom(PrivateRoom):
                 " if it has fallen out of sync.\n"
             ),
         )
-        self.commands.register(cmd, self.cmd_names)
+        commands.register(cmd, "cmd_names")
 
         cmd = CommandParser(prog="TOPIC", description="show or set channel topic")
         cmd.add_argument("text", nargs="*", help="topic text if setting")
-        self.commands.register(cmd, self.cmd_topic)
+        commands.register(cmd, "cmd_topic")
 
         cmd = CommandParser(prog="BANS", description="show channel ban list")
-        self.commands.register(cmd, self.cmd_bans)
+        commands.register(cmd, "cmd_bans")
 
         cmd = CommandParser(prog="OP", description="op someone")
         cmd.add_argument("nick", help="nick to target")
-        self.commands.register(cmd, self.cmd_op)
+        commands.register(cmd, "cmd_op")
 
         cmd = CommandParser(prog="DEOP", description="deop someone")
         cmd.add_argument("nick", help="nick to target")
-        self.commands.register(cmd, self.cmd_deop)
+        commands.register(cmd, "cmd_deop")
 
         cmd = CommandParser(prog="VOICE", description="voice someone")
         cmd.add_argument("nick", help="nick to target")
-        self.commands.register(cmd, self.cmd_voice)
+        commands.register(cmd, "cmd_voice")
 
         cmd = CommandParser(prog="DEVOICE", description="devoice someone")
         cmd.add_argument("nick", help="nick to target")
-        self.commands.register(cmd, self.cmd_devoice)
+        commands.register(cmd, "cmd_devoice")
 
         cmd = CommandParser(prog="KICK", description="kick someone")
         cmd.add_argument("nick", help="nick to target")
         cmd.add_argument("reason", nargs="*", help="reason")
-        self.commands.register(cmd, self.cmd_kick)
+        commands.register(cmd, "cmd_kick")
 
         cmd = CommandParser(prog="KB", description="kick and ban someone")
         cmd.add_argument("nick", help="nick to target")
         cmd.add_argument("reason", nargs="*", help="reason")
-        self.commands.register(cmd, self.cmd_kb)
+        commands.register(cmd, "cmd_kb")
 
         cmd = CommandParser(prog="JOIN", description="join this channel if not on it")
-        self.commands.register(cmd, self.cmd_join)
+        commands.register(cmd, "cmd_join")
 
         cmd = CommandParser(prog="PART", description="leave this channel temporarily")
-        self.commands.register(cmd, self.cmd_part)
+        commands.register(cmd, "cmd_part")
 
         cmd = CommandParser(
             prog="STOP",
             description="immediately clear all queued IRC events like long messages",
             epilog="Use this to stop accidental long pastes, also known as STAHP!",
         )
-        self.commands.register(cmd, self.cmd_stop, ["STOP!", "STAHP", "STAHP!"])
+        commands.register(cmd, "cmd_stop", ["STOP!", "STAHP", "STAHP!"])
+
+    def init(self) -> None:
+        super().init()
+
+        self.key = None
+        self.autocmd = None
+
+        # for migration the class default is full
+        self.member_sync = "full"
 
         self.names_buffer = []
         self.bans_buffer = []
@@ -153,7 +161,12 @@ class ChannelRoom(PrivateRoom):
             self.autocmd = config["autocmd"]
 
     def to_config(self) -> dict:
-        return {**(super().to_config()), "key": self.key, "member_sync": self.member_sync, "autocmd": self.autocmd}
+        return {
+            **(super().to_config()),
+            "key": self.key,
+            "member_sync": self.member_sync,
+            "autocmd": self.autocmd,
+        }
 
     @staticmethod
     def create(network: NetworkRoom, name: str) -> "ChannelRoom":
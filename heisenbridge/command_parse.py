@@ -59,13 +59,14 @@ class CommandManager:
         self._commands = {}
 
     def register(self, cmd: CommandParser, func, aliases=None):
+        # func can also be a method name that is looked up from the target on trigger
         self._commands[cmd.prog] = (cmd, func)
 
         if aliases is not None:
             for alias in aliases:
                 self._commands[alias] = (cmd, func)
 
-    async def trigger_args(self, args, tail=None, allowed=None, forward=None):
+    async def trigger_args(self, args, tail=None, allowed=None, forward=None, target=None):
         command = args.pop(0).upper()
 
         if allowed is not None and command not in allowed:
@@ -76,6 +77,8 @@ class CommandManager:
             cmd_args = cmd.parse_args(args)
             cmd_args._tail = tail
             cmd_args._forward = forward
+            if isinstance(func, str):
+                func = getattr(target, func)
             await func(cmd_args)
         elif command == "HELP":
             out = ["Following commands are supported:", ""]
@@ -90,7 +93,44 @@ class CommandManager:
         else:
             raise CommandParserError('Unknown command "{}", type HELP for list'.format(command))
 
-    async def trigger(self, text, tail=None, allowed=None, forward=None):
+    async def trigger(self, text, tail=None, allowed=None, forward=None, target=None):
         for args in split(text):
-            await self.trigger_args(args, tail, allowed, forward)
+            await self.trigger_args(args, tail, allowed, forward, target)
             tail = None
+
+
+class CommandRegistry:
+    """
+    Commands shared by every room of a class.
+
+    The parsers are only built when a command is first triggered so rooms that never see one do not pay for them.
+    """
+
+    def __init__(self, init):
+        self._init = init
+        self._manager = None
+
+    @property
+    def manager(self) -> CommandManager:
+        if self._manager is None:
+            self._manager = CommandManager()
+            self._init(self._manager)
+
+        return self._manager
+
+    def bind(self, target) -> "BoundCommands":
+        return BoundCommands(self, target)
+
+
+class BoundCommands:
+    __slots__ = ("_registry", "_target")
+
+    def __init__(self, registry: CommandRegistry, target):
+        self._registry = registry
+        self._target = target
+
+    async def trigger_args(self, args, tail=None, allowed=None, forward=None):
+        await self._registry.manager.trigger_args(args, tail, allowed, forward, self._target)
+
+    async def trigger(self, text, tail=None, allowed=None, forward=None):
+        await self._registry.manager.trigger(text, tail, allowed, forward, self._target)
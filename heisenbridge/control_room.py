@@ -1,35 +1,69 @@
 import asyncio
+import html
 import re
 from argparse import Namespace
 from urllib.parse import urlparse
 
 from heisenbridge import __version__
+from heisenbridge.command_parse import BoundCommands
 from heisenbridge.command_parse import CommandManager
 from heisenbridge.command_parse import CommandParser
 from heisenbridge.command_parse import CommandParserError
 from heisenbridge.matrix import MatrixError
 from heisenbridge.network_room import NetworkRoom
 from heisenbridge.parser import IRCMatrixParser
+from heisenbridge.profiler import ProfilerBusyError
 from heisenbridge.room import Room
 from heisenbridge.room import RoomInvalidError
 
 
+async def forget_user(serv, user_id: str, send_notice) -> None:
+    rooms = serv.find_rooms(None, user_id)
+
+    if len(rooms) == 0:
+        return send_notice("No such user. See STATUS for list of users.")
+
+    # disconnect each network room in first pass
+    for room in rooms:
+        if type(room) == NetworkRoom and room.conn and room.conn.connected:
+            send_notice(f"Disconnecting {user_id} from {room.name}...")
+            await room.cmd_disconnect(Namespace())
+
+    send_notice(f"Leaving all {len(rooms)} rooms {user_id} was in...")
+
+    # then just forget everything
+    for room in rooms:
+        serv.unregister_room(room.id)
+
+        try:
+            await serv.api.post_room_leave(room.id)
+        except MatrixError:
+            pass
+        try:
+            await serv.api.post_room_forget(room.id)
+        except MatrixError:
+            pass
+
+    send_notice(f"Done, I have forgotten about {user_id}")
+
+
 class ControlRoom(Room):
-    commands: CommandManager
+    commands: BoundCommands
 
-    def init(self):
-        self.commands = CommandManager()
+    mx_events = {"m.room.message": "on_mx_message"}
 
+    @classmethod
+    def init_commands(cls, commands: CommandManager, admin: bool = False) -> None:
         cmd = CommandParser(prog="NETWORKS", description="list available networks")
-        self.commands.register(cmd, self.cmd_networks)
+        commands.register(cmd, "cmd_networks")
 
         cmd = CommandParser(prog="SERVERS", description="list servers for a network")
         cmd.add_argument("network", help="network name (see NETWORKS)")
-        self.commands.register(cmd, self.cmd_servers)
+        commands.register(cmd, "cmd_servers")
 
         cmd = CommandParser(prog="OPEN", description="open network for connecting")
         cmd.add_argument("name", help="network name (see NETWORKS)")
-        self.commands.register(cmd, self.cmd_open)
+        commands.register(cmd, "cmd_open")
 
         cmd = CommandParser(
             prog="QUIT",
@@ -40,11 +74,11 @@ class ControlRoom(Room):
                 "Additionally this will close current DM session with the bridge.\n"
             ),
         )
-        self.commands.register(cmd, self.cmd_quit)
+        commands.register(cmd, "cmd_quit")
 
-        if self.serv.is_admin(self.user_id):
+        if admin:
             cmd = CommandParser(prog="MASKS", description="list allow masks")
-            self.commands.register(cmd, self.cmd_masks)
+            commands.register(cmd, "cmd_masks")
 
             cmd = CommandParser(
                 prog="ADDMASK",
@@ -58,7 +92,7 @@ class ControlRoom(Room):
             )
             cmd.add_argument("mask", help="Matrix ID mask (eg: @friend:contoso.com or *:contoso.com)")
             cmd.add_argument("--admin", help="Admin level access", action="store_true")
-            self.commands.register(cmd, self.cmd_addmask)
+            commands.register(cmd, "cmd_addmask")
 
             cmd = CommandParser(
                 prog="DELMASK",
@@ -69,15 +103,15 @@ class ControlRoom(Room):
                 ),
             )
             cmd.add_argument("mask", help="Matrix ID mask (eg: @friend:contoso.com or *:contoso.com)")
-            self.commands.register(cmd, self.cmd_delmask)
+            commands.register(cmd, "cmd_delmask")
 
             cmd = CommandParser(prog="ADDNETWORK", description="add new network")
             cmd.add_argument("name", help="network name")
-            self.commands.register(cmd, self.cmd_addnetwork)
+            commands.register(cmd, "cmd_addnetwork")
 
             cmd = CommandParser(prog="DELNETWORK", description="delete network")
             cmd.add_argument("name", help="network name")
-            self.commands.register(cmd, self.cmd_delnetwork)
+            commands.register(cmd, "cmd_delnetwork")
 
             cmd = CommandParser(prog="ADDSERVER", description="add server to a network")
             cmd.add_argument("network", help="network name")
@@ -91,16 +125,16 @@ class ControlRoom(Room):
                 default=False,
             )
             cmd.add_argument("--proxy", help="use a SOCKS proxy (socks5://...)", default=None)
-            self.commands.register(cmd, self.cmd_addserver)
+            commands.register(cmd, "cmd_addserver")
 
             cmd = CommandParser(prog="DELSERVER", description="delete server from a network")
             cmd.add_argument("network", help="network name")
             cmd.add_argument("address", help="server address")
             cmd.add_argument("port", nargs="?", type=int, help="server port", default=6667)
-            self.commands.register(cmd, self.cmd_delserver)
+            commands.register(cmd, "cmd_delserver")
 
             cmd = CommandParser(prog="STATUS", description="list active users")
-            self.commands.register(cmd, self.cmd_status)
+            commands.register(cmd, "cmd_status")
 
             cmd = CommandParser(
                 prog="FORGET",
@@ -115,15 +149,15 @@ class ControlRoom(Room):
                 ),
             )
             cmd.add_argument("user", help="Matrix ID (eg: @ex-friend:contoso.com)")
-            self.commands.register(cmd, self.cmd_forget)
+            commands.register(cmd, "cmd_forget")
 
             cmd = CommandParser(prog="DISPLAYNAME", description="change bridge displayname")
             cmd.add_argument("displayname", help="new bridge displayname")
-            self.commands.register(cmd, self.cmd_displayname)
+            commands.register(cmd, "cmd_displayname")
 
             cmd = CommandParser(prog="AVATAR", description="change bridge avatar")
             cmd.add_argument("url", help="new avatar URL (mxc:// format)")
-            self.commands.register(cmd, self.cmd_avatar)
+            commands.register(cmd, "cmd_avatar")
 
             cmd = CommandParser(
                 prog="IDENT",
@@ -137,7 +171,7 @@ class ControlRoom(Room):
             cmd_set.add_argument("ident", help="custom ident for the user")
             cmd_remove = subcmd.add_parser("remove", help="remove custom ident")
             cmd_remove.add_argument("mxid", help="mxid of the user")
-            self.commands.register(cmd, self.cmd_ident)
+            commands.register(cmd, "cmd_ident")
 
             cmd = CommandParser(
                 prog="SYNC",
@@ -150,17 +184,37 @@ class ControlRoom(Room):
                 "--half", help="set half sync, members are added when they join or talk (default)", action="store_true"
             )
             group.add_argument("--full", help="set full sync, members are fully synchronized", action="store_true")
-            self.commands.register(cmd, self.cmd_sync)
+            commands.register(cmd, "cmd_sync")
 
             cmd = CommandParser(prog="MEDIAURL", description="configure media URL for links")
             cmd.add_argument("url", nargs="?", help="new URL override")
             cmd.add_argument("--remove", help="remove URL override (will retry auto-detection)", action="store_true")
-            self.commands.register(cmd, self.cmd_media_url)
+            commands.register(cmd, "cmd_media_url")
 
             cmd = CommandParser(prog="VERSION", description="show bridge version")
-            self.commands.register(cmd, self.cmd_version)
+            commands.register(cmd, "cmd_version")
+
+            cmd = CommandParser(
+                prog="PROFILE",
+                description="profile the bridge for a while",
+                epilog=(
+                    "Profiles the whole bridge for the given time and posts a summary of slow callbacks, time spent in"
+                    " Matrix and IRC event handlers and the functions that used the most time.\n"
+                    "\n"
+                    "The bridge runs slower while profiling.\n"
+                ),
+            )
+            cmd.add_argument("seconds", nargs="?", type=float, help="how long to profile (default: 10)", default=10)
+            cmd.add_argument(
+                "--slow",
+                type=int,
+                help="report callbacks taking longer than this in milliseconds (default: 100)",
+                default=100,
+            )
+            commands.register(cmd, "cmd_profile")
 
-        self.mx_register("m.room.message", self.on_mx_message)
+    def init(self):
+        self.commands = self.bind_commands(admin=self.serv.is_admin(self.user_id))
 
     def is_valid(self) -> bool:
         if self.user_id is None:
@@ -354,6 +408,9 @@ class ControlRoom(Room):
         users.sort()
 
         self.send_notice(f"I have {len(users)} known users:")
+
+        if self.serv.shard:
+            self.send_notice(f"Only users on shard {self.serv.shard.index} of {self.serv.shard.shards} are listed.")
         for user in users:
             ncontrol = len(self.serv.find_rooms("ControlRoom", user))
 
@@ -384,37 +441,20 @@ class ControlRoom(Room):
 
                 self.send_notice(f"\t\t{network.name}, {connected}, {channels}, {privates}")
 
+        for line in self.serv.monitor().status():
+            self.send_notice(line)
+
     async def cmd_forget(self, args):
         if args.user == self.user_id:
             return self.send_notice("I can't forget you, silly!")
 
-        rooms = self.serv.find_rooms(None, args.user)
-
-        if len(rooms) == 0:
-            return self.send_notice("No such user. See STATUS for list of users.")
-
-        # disconnect each network room in first pass
-        for room in rooms:
-            if type(room) == NetworkRoom and room.conn and room.conn.connected:
-                self.send_notice(f"Disconnecting {args.user} from {room.name}...")
-                await room.cmd_disconnect(Namespace())
-
-        self.send_notice(f"Leaving all {len(rooms)} rooms {args.user} was in...")
-
-        # then just forget everything
-        for room in rooms:
-            self.serv.unregister_room(room.id)
-
-            try:
-                await self.serv.api.post_room_leave(room.id)
-            except MatrixError:
-                pass
-            try:
-                await self.serv.api.post_room_forget(room.id)
-            except MatrixError:
-                pass
+        # the shard that owns the user forgets them and reports back here
+        if self.serv.shard and not self.serv.shard.owns(args.user):
+            self.send_notice(f"{args.user} is on another shard, asking it to forget them...")
+            self.serv.shard.forward({"command": "forget", "user_id": args.user, "room_id": self.id})
+            return
 
-        self.send_notice(f"Done, I have forgotten about {args.user}")
+        await forget_user(self.serv, args.user, self.send_notice)
 
     async def cmd_displayname(self, args):
         try:
@@ -536,3 +576,16 @@ class ControlRoom(Room):
 
     async def cmd_version(self, args):
         self.send_notice(f"heisenbridge v{__version__}")
+
+    async def cmd_profile(self, args):
+        if args.seconds <= 0 or args.seconds > 300:
+            return self.send_notice("Profiling time must be between 0 and 300 seconds.")
+
+        self.send_notice(f"Profiling for {args.seconds:g} seconds...")
+
+        try:
+            summary = await self.serv.profiler.profile(args.seconds, args.slow / 1000)
+        except (ProfilerBusyError, ValueError) as e:
+            return self.send_notice(f"Failed to profile: {str(e)}")
+
+        self.send_notice(summary, formatted=f"<pre><code>{html.escape(summary)}</code></pre>")
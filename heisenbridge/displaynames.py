@@ -0,0 +1,166 @@
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+"""
+Displaynames of room members, indexed both ways with matchers that are only rebuilt when they change.
+"""
+
+_no_users = frozenset()
+
+
+class Displaynames(dict):
+    """
+    A dict of user id to displayname that keeps track of changes.
+
+    The version is bumped on every change so anything derived from the displaynames can be cached until it moves. A
+    reverse index of displayname to user ids is kept up to date as well.
+    """
+
+    version = 0
+
+    _matcher: Optional[Tuple[int, Dict[str, str], List[int]]] = None
+    _users: Dict[str, Set[str]]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._users = {}
+        for user_id, displayname in self.items():
+            self._index(user_id, displayname)
+
+    def _index(self, user_id: str, displayname: str) -> None:
+        if displayname in self._users:
+            self._users[displayname].add(user_id)
+        else:
+            self._users[displayname] = {user_id}
+
+    def _unindex(self, user_id: str, displayname: str) -> None:
+        users = self._users[displayname]
+        users.discard(user_id)
+        if not users:
+            del self._users[displayname]
+
+    def _changed(self) -> None:
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self._unindex(key, self[key])
+
+        super().__setitem__(key, value)
+        self._index(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        if key in self:
+            self._unindex(key, self[key])
+
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        super().clear()
+        self._users.clear()
+        self._changed()
+
+    def pop(self, key, *args):
+        if key in self:
+            self._unindex(key, self[key])
+
+        result = super().pop(key, *args)
+        self._changed()
+        return result
+
+    def popitem(self):
+        (key, value) = item = super().popitem()
+        self._unindex(key, value)
+        self._changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            if key in self:
+                self._unindex(key, self[key])
+
+            super().__setitem__(key, value)
+            self._index(key, value)
+
+        self._changed()
+
+    def users(self, displayname: str) -> Set[str]:
+        """Return the user ids that have displayname, do not modify."""
+        return self._users.get(displayname, _no_users)
+
+    def copy(self) -> "Displaynames":
+        """Return a copy that can be read from another thread while this one keeps changing."""
+        copy = type(self)(self)
+
+        # matchers are replaced and never changed so a current one can be shared
+        if self._matcher is not None and self._matcher[0] == self.version:
+            copy._matcher = (copy.version,) + self._matcher[1:]
+
+        return copy
+
+    def __reduce__(self):
+        # the index and cached matchers are cheaper to rebuild than to pickle
+        return (type(self), (dict(self),))
+
+    def matcher(self) -> Tuple[Dict[str, str], List[int]]:
+        """Return what each user id and @displayname is replaced with and their distinct lengths, longest first."""
+        if self._matcher is None or self._matcher[0] != self.version:
+            replacements = {}
+
+            # FluffyChat prefixes mentions in fallback with @
+            for user_id, displayname in self.items():
+                if displayname:
+                    replacements["@" + displayname] = displayname
+
+            for user_id, displayname in self.items():
+                replacements[user_id] = displayname
+
+            self._matcher = (self.version, replacements, sorted({len(key) for key in replacements}, reverse=True))
+
+        return self._matcher[1:]
+
+    def substitute(self, text: str) -> str:
+        """Replace user ids and @displaynames in text with displaynames in a single pass."""
+        (replacements, lengths) = self.matcher()
+
+        # everything to replace starts with an @ so only those positions need to be looked at
+        pos = text.find("@")
+        if pos < 0 or not replacements:
+            return text
+
+        out = []
+        last = 0
+
+        while pos >= 0:
+            for length in lengths:
+                key = text[pos : pos + length]
+
+                # the longest match wins so a user id is preferred over a displayname that is a prefix of it
+                if len(key) == length and key in replacements:
+                    out.append(text[last:pos])
+                    out.append(replacements[key])
+                    last = pos = pos + length
+                    break
+            else:
+                pos += 1
+
+            pos = text.find("@", pos)
+
+        out.append(text[last:])
+        return "".join(out)
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from collections import deque
 
 """
 Buffering event queue with merging of events.
@@ -7,32 +8,92 @@ Buffering event queue with merging of events.
 
 
 class EventQueue:
-    def __init__(self, callback):
+    __slots__ = (
+        "delay",
+        "max_age",
+        "max_size",
+        "_callback",
+        "_events",
+        "_loop",
+        "_timer",
+        "_start",
+        "_chain",
+        "_task",
+        "_timeout",
+        "_started",
+        "_waiter",
+        "_idle_timeout",
+        "_deadline",
+        "_body",
+        "_formatted_body",
+        "_length",
+    )
+
+    def __init__(self, callback, delay=0.1, max_age=1.0, max_size=64_000):
+        # flush after a pause of delay seconds, when the batch is max_age seconds old or would exceed max_size
+        self.delay = delay
+        self.max_age = max_age
+        self.max_size = max_size
+
         self._callback = callback
         self._events = []
         self._loop = asyncio.get_event_loop()
         self._timer = None
         self._start = 0
-        self._chain = asyncio.Queue()
+        self._deadline = 0
+        self._body = []
+        self._formatted_body = []
+        self._length = 0
+        self._chain = deque()
         self._task = None
         self._timeout = 3600
+        self._started = False
+        self._waiter = None
+        self._idle_timeout = 30
 
     def start(self):
-        if self._task is None:
-            self._task = asyncio.ensure_future(self._run())
+        self._started = True
+        self._wakeup()
 
     def stop(self):
+        self._started = False
+
         if self._task:
             self._task.cancel()
             self._task = None
 
+    def _wakeup(self):
+        # a lingering drain task picks up new work by itself
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+        # the chain is only drained by a task while there is something in it, idle rooms have none
+        if self._started and self._task is None and len(self._chain) > 0:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _linger(self):
+        self._waiter = self._loop.create_future()
+
+        try:
+            await asyncio.wait_for(self._waiter, timeout=self._idle_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiter = None
+
     async def _run(self):
         while True:
-            try:
-                task = await self._chain.get()
-            except asyncio.CancelledError:
-                logging.debug("EventQueue was cancelled.")
-                return
+            # keep the task around for a while so busy rooms do not respawn it on every flush
+            if len(self._chain) == 0:
+                try:
+                    if not await self._linger():
+                        break
+                except asyncio.CancelledError:
+                    logging.debug("EventQueue was cancelled.")
+                    return
+
+            task = self._chain.popleft()
 
             try:
                 await asyncio.wait_for(task, timeout=self._timeout)
@@ -41,28 +102,56 @@ class EventQueue:
                 return
             except asyncio.TimeoutError:
                 logging.warning("EventQueue task timed out.")
-            finally:
-                self._chain.task_done()
+
+        self._task = None
+
+        # something may have been queued right as we gave up
+        self._wakeup()
+
+    def _on_timer(self):
+        self._timer = None
+
+        if len(self._events) == 0:
+            return
+
+        # the deadline only ever moves forward while a batch is open so the timer may have fired early, rearm it
+        if self._loop.time() < self._deadline:
+            self._timer = self._loop.call_at(self._deadline, self._on_timer)
+        else:
+            self._flush()
+
+    def _begin(self, event):
+        content = event["content"]
+
+        # merged lines are collected here and only joined when the batch is flushed
+        self._body = [content["body"]] if "body" in content else []
+        self._formatted_body = [content["formatted_body"]] if "formatted_body" in content else []
+        self._length = sum(map(len, self._body)) + sum(map(len, self._formatted_body))
+
+        self._events.append(event)
 
     def _flush(self):
         events = self._events
 
-        self._timer = None
         self._events = []
 
-        self._chain.put_nowait(self._callback(events))
+        if len(self._body) > 1:
+            events[-1]["content"]["body"] = "\n".join(self._body)
+        if len(self._formatted_body) > 1:
+            events[-1]["content"]["formatted_body"] = "<br>".join(self._formatted_body)
+        self._body = []
+        self._formatted_body = []
+
+        self._chain.append(self._callback(events))
+        self._wakeup()
 
     def enqueue(self, event):
         now = self._loop.time()
 
-        # always cancel timer when we enqueue
-        if self._timer:
-            self._timer.cancel()
-
         # stamp start time when we queue first event, always append event
         if len(self._events) == 0:
             self._start = now
-            self._events.append(event)
+            self._begin(event)
         else:
             # lets see if we can merge the event
             prev = self._events[-1]
@@ -70,14 +159,6 @@ class EventQueue:
             prev_formatted = "format" in prev["content"]
             cur_formatted = "format" in event["content"]
 
-            # calculate content length if we need to flush anyway to stay within max event size
-            prev_len = 0
-            if "content" in prev:
-                if "body" in prev["content"]:
-                    prev_len += len(prev["content"]["body"])
-                if "formatted_body" in prev["content"]:
-                    prev_len += len(prev["content"]["formatted_body"])
-
             if (
                 prev["type"] == event["type"]
                 and prev["type"][0] != "_"
@@ -85,19 +166,28 @@ class EventQueue:
                 and "msgtype" in prev["content"]
                 and prev["content"]["msgtype"] == event["content"]["msgtype"]
                 and prev_formatted == cur_formatted
-                and prev_len < 64_000  # a single IRC event can't overflow with this
+                and self._length < self.max_size  # a single IRC event can't overflow with the default
             ):
-                prev["content"]["body"] += "\n" + event["content"]["body"]
+                body = event["content"]["body"]
+                self._body.append(body)
+                self._length += 1 + len(body)
+
                 if cur_formatted:
-                    prev["content"]["formatted_body"] += "<br>" + event["content"]["formatted_body"]
+                    formatted_body = event["content"]["formatted_body"]
+                    self._formatted_body.append(formatted_body)
+                    self._length += 4 + len(formatted_body)
             else:
                 # can't merge, force flush but enqueue the next event
                 self._flush()
                 self._start = now
-                self._events.append(event)
+                self._begin(event)
 
-        # if we have bumped ourself for a full second, flush now
-        if now >= self._start + 1.0:
+        # if we have bumped ourself for too long, flush now
+        if now >= self._start + self.max_age:
             self._flush()
-        else:
-            self._timer = self._loop.call_later(0.1, self._flush)
+            return
+
+        # otherwise flush when there has been a short pause, a single timer is kept and moved on expiry
+        self._deadline = min(now + self.delay, self._start + self.max_age)
+        if self._timer is None:
+            self._timer = self._loop.call_at(self._deadline, self._on_timer)
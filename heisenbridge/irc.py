@@ -1,7 +1,12 @@
 import asyncio
 import base64
 import collections
+import ipaddress
 import logging
+import socket
+from typing import Dict
+from typing import List
+from typing import Optional
 
 from irc.client import ServerConnectionError
 from irc.client_aio import AioConnection
@@ -104,12 +109,74 @@ class HeisenProtocol(IrcProtocol):
         self.connection.send_items("PING", self.connection.real_server_name)
 
 
+class ConnectionIndex:
+    """
+    Idents of outgoing IRC connections by their address, for identd.
+
+    Keys are (local port, remote address, remote port) with IPv4 addresses mapped to IPv6 so they compare equal to what
+    a dual stack listener sees.
+    """
+
+    def __init__(self):
+        self._entries: Dict[tuple, str] = {}
+        self._waiters: Dict[tuple, List[asyncio.Future]] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(local_port: int, remote_addr: str, remote_port: int) -> tuple:
+        addr = ipaddress.ip_address(remote_addr)
+
+        if isinstance(addr, ipaddress.IPv4Address):
+            addr = ipaddress.ip_address("::ffff:" + remote_addr)
+
+        return (int(local_port), addr, int(remote_port))
+
+    def add(self, key: tuple, ident: str) -> None:
+        self._entries[key] = ident
+
+        for waiter in self._waiters.pop(key, []):
+            if not waiter.done():
+                waiter.set_result(ident)
+
+    def remove(self, key: tuple) -> None:
+        self._entries.pop(key, None)
+
+    def get(self, key: tuple) -> Optional[str]:
+        return self._entries.get(key)
+
+    async def wait(self, key: tuple, timeout: float) -> Optional[str]:
+        """Return the ident for key, waiting up to timeout seconds for the connection to show up."""
+        if key in self._entries:
+            return self._entries[key]
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.setdefault(key, []).append(waiter)
+
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+
 class HeisenConnection(AioConnection):
     protocol_class = HeisenProtocol
 
+    # shared by every connection so identd can find them all
+    index = ConnectionIndex()
+
     def __init__(self, reactor):
         super().__init__(reactor)
         self._queue = OrderedPriorityQueue()
+        self._index_key = None
 
     async def expect(self, events, timeout=30):
         events = events if not isinstance(events, str) and not isinstance(events, int) else [events]
@@ -143,10 +210,14 @@ class HeisenConnection(AioConnection):
         connect_factory=AioFactory(),
         sasl_username=None,
         sasl_password=None,
+        ident=None,
+        sock=None,
     ):
         if self.connected:
             self.disconnect("Changing servers")
 
+        self._unindex()
+
         self.buffer = self.buffer_class()
         self.handlers = {}
         self.real_server_name = ""
@@ -163,12 +234,30 @@ class HeisenConnection(AioConnection):
         self.connect_factory = connect_factory
 
         protocol_instance = self.protocol_class(self, self.reactor.loop)
-        connection = self.connect_factory(protocol_instance, self.server_address)
-        transport, protocol = await connection
+
+        # an already connected socket is used as is, server and port are still kept for reference
+        if sock is not None:
+            if ident is not None:
+                self._index(sock.getsockname(), sock.getpeername(), ident)
+
+            factory = AioFactory(sock=sock, **self.connect_factory.connection_args)
+            connection = factory(protocol_instance, (None, None))
+        else:
+            connection = self.connect_factory(protocol_instance, self.server_address)
+
+        try:
+            transport, protocol = await connection
+        except BaseException:
+            self._unindex()
+            raise
 
         self.transport = transport
         self.protocol = protocol
 
+        # answer ident queries for this connection
+        if ident is not None and sock is None:
+            self._index(transport.get_extra_info("sockname"), transport.get_extra_info("peername"), ident)
+
         self.connected = True
         self._task = asyncio.ensure_future(self._run())
         self.reactor._on_connect(self.protocol, self.transport)
@@ -207,9 +296,56 @@ class HeisenConnection(AioConnection):
         self.nick(self.nickname)
         self.user(self.username, self.ircname)
 
+    @classmethod
+    async def bound_socket(cls, host: str, port: int, ident: str) -> socket.socket:
+        """
+        Connect a socket to host and port that is bound before connecting.
+
+        The local port is known before the server sees the connection so it is registered for identd right away and
+        ident queries sent while connecting are answered without waiting.
+        """
+        loop = asyncio.get_event_loop()
+        error = OSError(f"Could not resolve {host}")
+
+        for family, type, proto, _, address in await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+            sock = socket.socket(family, type, proto)
+            key = None
+
+            try:
+                sock.setblocking(False)
+                sock.bind(("", 0))
+
+                key = cls.index.key(sock.getsockname()[1], address[0], address[1])
+                cls.index.add(key, ident)
+
+                await loop.sock_connect(sock, address)
+                return sock
+            except BaseException as e:
+                if key is not None:
+                    cls.index.remove(key)
+
+                sock.close()
+
+                if not isinstance(e, OSError):
+                    raise
+
+                error = e
+
+        raise error
+
+    def _index(self, sockname, peername, ident):
+        self._index_key = self.index.key(sockname[1], peername[0], peername[1])
+        self.index.add(self._index_key, ident)
+
+    def _unindex(self):
+        if self._index_key is not None:
+            self.index.remove(self._index_key)
+            self._index_key = None
+
     def close(self):
         logging.debug("Canceling IRC event queue")
         self._task.cancel()
+        self._unindex()
         super().close()
 
     async def _run(self):
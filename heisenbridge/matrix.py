@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import logging
 import time
 import urllib
@@ -8,6 +9,8 @@ from aiohttp import ClientResponseError
 from aiohttp import ClientSession
 from aiohttp import TCPConnector
 
+from heisenbridge.runtime import JsonCodec
+
 
 class MatrixError(Exception):
     def __init__(self, data):
@@ -51,11 +54,18 @@ class MatrixLimitExceeded(MatrixError):
 
 
 class Matrix:
-    def __init__(self, url, token):
+    # how many transaction ids are reserved with a single account data write
+    txn_block = 1000
+
+    def __init__(self, url, token, codec: JsonCodec = None):
         self.url = url
         self.token = token
+        self.codec = codec or JsonCodec()
         self.seq = 0
+        self.seq_limit = None
         self.session = str(int(time.time()))
+        self.txn_user_id = None
+        self.txn_key = "irc.txn"
         self.conn = TCPConnector()
 
     def _matrix_error(self, data):
@@ -74,19 +84,62 @@ class Matrix:
         self.seq += 1
         return self.session + "-" + str(self.seq)
 
-    async def call(self, method, uri, data=None, content_type="application/json", retry=True):
+    def txn_id(self, *parts):
+        """Deterministic transaction id for an event that may be sent again, like a replayed transaction."""
+        return "d-" + hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+    async def load_txn(self, user_id, shard=None):
+        """
+        Restore the transaction id high-water mark from account data.
+
+        Ids are reserved in blocks and the end of the block is persisted before any id from it is used so a restart
+        never hands out an id that was already sent, at worst a part of a block is skipped. Each shard sends as the
+        same user so they keep their own high-water mark and prefix.
+        """
+        self.txn_key = "irc.txn" if shard is None else f"irc.txn.{shard}"
+
+        try:
+            data = await self.get_user_account_data(user_id, self.txn_key)
+            self.seq = int(data.get("seq", 0))
+        except MatrixNotFound:
+            self.seq = 0
+
+        self.session = "hb" if shard is None else f"hb{shard}"
+        self.txn_user_id = user_id
+        await self._reserve_txn()
+
+    async def _reserve_txn(self):
+        seq_limit = self.seq + self.txn_block
+        await self.put_user_account_data(self.txn_user_id, self.txn_key, {"seq": seq_limit})
+        self.seq_limit = max(seq_limit, self.seq_limit or 0)
+
+    async def _next_txn(self):
+        while self.seq_limit is not None and self.seq >= self.seq_limit:
+            await self._reserve_txn()
+
+        return self._txn()
+
+    async def call(self, method, uri, data=None, content_type="application/json", retry=True, content_length=None):
         async with ClientSession(
-            headers={"Authorization": "Bearer " + self.token}, connector=self.conn, connector_owner=False
+            headers={"Authorization": "Bearer " + self.token},
+            connector=self.conn,
+            connector_owner=False,
+            json_serialize=self.codec.dumps,
         ) as session:
             for i in range(0, 60):
                 try:
                     if content_type == "application/json":
                         resp = await session.request(method, self.url + uri, json=data)
                     else:
+                        headers = {"Content-type": content_type}
+                        if content_length is not None:
+                            headers["Content-Length"] = str(content_length)
+
+                        # a streamed body can only be sent once, a callable gives a fresh one for every attempt
                         resp = await session.request(
-                            method, self.url + uri, data=data, headers={"Content-type": content_type}
+                            method, self.url + uri, data=data() if callable(data) else data, headers=headers
                         )
-                    ret = await resp.json()
+                    ret = await resp.json(loads=self.codec.loads)
 
                     if resp.status > 299:
                         raise self._matrix_error(ret)
@@ -205,10 +258,13 @@ class Matrix:
             {"user_id": user_id},
         )
 
-    async def put_room_send_event(self, room_id, type, content, user_id=None):
+    async def put_room_send_event(self, room_id, type, content, user_id=None, txn_id=None):
         if user_id:
             user_id = urllib.parse.quote(user_id, safe="")
 
+        if txn_id is None:
+            txn_id = await self._next_txn()
+
         return await self.call(
             "PUT",
             "/_matrix/client/r0/rooms/"
@@ -216,7 +272,7 @@ class Matrix:
             + "/send/"
             + type
             + "/"
-            + self._txn()
+            + txn_id
             + ("?user_id={}".format(user_id) if user_id else ""),
             content,
         )
@@ -283,12 +339,13 @@ class Matrix:
             "PUT", f"/_matrix/client/r0/presence/{user_id}/status", {"presence": presence, "status_msg": status_msg}
         )
 
-    async def post_media_upload(self, data, content_type, filename=None):
+    async def post_media_upload(self, data, content_type, filename=None, content_length=None):
         return await self.call(
             "POST",
             "/_matrix/media/r0/upload" + ("?filename=" + urllib.parse.quote(filename, safe="") if filename else ""),
             data,
             content_type=content_type,
+            content_length=content_length,
         )
 
     async def get_synapse_admin_users_admin(self, user_id):
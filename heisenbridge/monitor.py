@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+import types
+from collections import deque
+from typing import Dict
+from typing import List
+
+"""
+Event loop lag and handler duration monitoring.
+"""
+
+
+class HandlerStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+@types.coroutine
+def _timed_steps(coro, busy):
+    # drive the coroutine step by step so only the time it runs on the loop is counted, not the time it awaits
+    value = None
+    error = None
+
+    while True:
+        start = time.perf_counter()
+        try:
+            if error is None:
+                yielded = coro.send(value)
+            else:
+                yielded = coro.throw(error)
+        except StopIteration as e:
+            return e.value
+        finally:
+            busy[0] += time.perf_counter() - start
+
+        try:
+            value = yield yielded
+            error = None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            value = None
+            error = e
+
+
+class Monitor:
+    handlers: Dict[str, HandlerStats]
+
+    def __init__(self, threshold=0.1, interval=1.0):
+        # handlers running longer than threshold seconds on the loop and lag over it are logged
+        self.threshold = threshold
+        self.interval = interval
+        self.handlers = {}
+        self.max_lag = 0.0
+        self._lags = deque(maxlen=60)
+        self._timer = None
+        self._expected = 0
+
+    def start(self) -> None:
+        loop = asyncio.get_event_loop()
+        self._expected = loop.time() + self.interval
+        self._timer = loop.call_at(self._expected, self._tick)
+
+    def stop(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _tick(self) -> None:
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        lag = max(now - self._expected, 0.0)
+
+        self._lags.append(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+        if lag > self.threshold:
+            logging.warning(f"Event loop is lagging {lag * 1000:.0f} ms behind")
+
+        self._expected = now + self.interval
+        self._timer = loop.call_at(self._expected, self._tick)
+
+    def record(self, name: str, elapsed: float, context) -> None:
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats()
+
+        stats.count += 1
+        stats.total += elapsed
+        if elapsed > stats.max:
+            stats.max = elapsed
+
+        if elapsed > self.threshold:
+            logging.warning(f"{name} blocked the event loop for {elapsed * 1000:.0f} ms ({context()})")
+
+    def call(self, name: str, context, func, *args):
+        """Call func with args and record how long it took, context is only called for outliers."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.record(name, time.perf_counter() - start, context)
+
+    async def run(self, name: str, context, coro):
+        """Await coro and record how long it ran on the loop in total, context is only called for outliers."""
+        busy = [0.0]
+        try:
+            return await _timed_steps(coro, busy)
+        finally:
+            self.record(name, busy[0], context)
+
+    def status(self, limit: int = 5) -> List[str]:
+        lines = []
+
+        if self._lags:
+            lines.append(
+                f"Event loop lag is {self._lags[-1] * 1000:.0f} ms, max {max(self._lags) * 1000:.0f} ms in the last"
+                f" {len(self._lags) * self.interval:.0f} seconds and {self.max_lag * 1000:.0f} ms since start"
+            )
+
+        slowest = sorted(self.handlers.items(), key=lambda item: -item[1].max)[:limit]
+        if slowest:
+            lines.append("Slowest handlers by time on the event loop:")
+            for name, stats in slowest:
+                lines.append(
+                    f"\t{name}: {stats.count} calls, avg {stats.total / stats.count * 1000:.2f} ms,"
+                    f" max {stats.max * 1000:.2f} ms"
+                )
+
+        return lines
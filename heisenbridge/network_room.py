@@ -24,9 +24,11 @@ from python_socks.async_.asyncio import Proxy
 
 from heisenbridge import __version__
 from heisenbridge.channel_room import ChannelRoom
+from heisenbridge.command_parse import BoundCommands
 from heisenbridge.command_parse import CommandManager
 from heisenbridge.command_parse import CommandParser
 from heisenbridge.command_parse import CommandParserError
+from heisenbridge.irc import HeisenConnection
 from heisenbridge.irc import HeisenReactor
 from heisenbridge.parser import IRCMatrixParser
 from heisenbridge.plumbed_room import PlumbedRoom
@@ -60,18 +62,23 @@ def ircroom_event(target_arg=None):
                 # switch target around if it's targeted towards us directly
                 target = event.target.lower() if event.target != conn.real_nickname else event.source.nick.lower()
 
+            def context():
+                return f"{event.type} from {event.source} to {target} on {self.name}"
+
             if target in self.rooms:
                 room = self.rooms[target]
                 try:
                     room_f = getattr(room, "on_" + event.type)
                     try:
-                        return room_f(conn, event)
+                        return self.serv.monitor().call(
+                            f"{type(room).__name__}.on_{event.type}", context, room_f, conn, event
+                        )
                     except Exception:
                         logging.exception(f"Calling on_{event.type} failed for {target}")
                 except AttributeError:
                     logging.warning(f"Expected {room} to have on_{event.type} but didn't")
 
-            return f(self, conn, event)
+            return self.serv.monitor().call(f"NetworkRoom.{f.__name__}", context, f, self, conn, event)
 
         return wrapper
 
@@ -97,42 +104,17 @@ class NetworkRoom(Room):
     rejoin_kick: bool
 
     # state
-    commands: CommandManager
+    commands: BoundCommands
     conn: Any
     rooms: Dict[str, Room]
     connecting: bool
     real_host: str
     pending_kickbans: Dict[str, List[Tuple[str, str]]]
 
-    def init(self):
-        self.name = None
-        self.connected = False
-        self.nick = None
-        self.username = None
-        self.ircname = None
-        self.password = None
-        self.sasl_username = None
-        self.sasl_password = None
-        self.autocmd = None
-        self.pills_length = 2
-        self.pills_ignore = []
-        self.autoquery = True
-        self.allow_ctcp = False
-        self.tls_cert = None
-        self.rejoin_invite = True
-        self.rejoin_kick = False
-
-        self.commands = CommandManager()
-        self.conn = None
-        self.rooms = {}
-        self.connlock = asyncio.Lock()
-        self.disconnect = True
-        self.real_host = "?" * 63  # worst case default
-        self.keys = {}  # temp dict of join channel keys
-        self.keepnick_task = None  # async task
-        self.whois_data = defaultdict(dict)  # buffer for keeping partial whois replies
-        self.pending_kickbans = defaultdict(list)
+    mx_events = {"m.room.message": "on_mx_message"}
 
+    @classmethod
+    def init_commands(cls, commands: CommandManager) -> None:
         cmd = CommandParser(
             prog="NICK",
             description="set/change nickname",
@@ -143,7 +125,7 @@ class NetworkRoom(Room):
             ),
         )
         cmd.add_argument("nick", nargs="?", help="new nickname")
-        self.commands.register(cmd, self.cmd_nick)
+        commands.register(cmd, "cmd_nick")
 
         cmd = CommandParser(
             prog="USERNAME",
@@ -156,7 +138,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("username", nargs="?", help="new username")
         cmd.add_argument("--remove", action="store_true", help="remove stored username")
-        self.commands.register(cmd, self.cmd_username)
+        commands.register(cmd, "cmd_username")
 
         cmd = CommandParser(
             prog="IRCNAME",
@@ -165,7 +147,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("ircname", nargs="?", help="new ircname")
         cmd.add_argument("--remove", action="store_true", help="remove stored ircname")
-        self.commands.register(cmd, self.cmd_ircname)
+        commands.register(cmd, "cmd_ircname")
 
         cmd = CommandParser(
             prog="PASSWORD",
@@ -179,7 +161,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("password", nargs="?", help="new password")
         cmd.add_argument("--remove", action="store_true", help="remove stored password")
-        self.commands.register(cmd, self.cmd_password)
+        commands.register(cmd, "cmd_password")
 
         cmd = CommandParser(
             prog="SASL",
@@ -193,7 +175,7 @@ class NetworkRoom(Room):
         cmd.add_argument("--username", help="SASL username")
         cmd.add_argument("--password", help="SASL password")
         cmd.add_argument("--remove", action="store_true", help="remove stored credentials")
-        self.commands.register(cmd, self.cmd_sasl)
+        commands.register(cmd, "cmd_sasl")
 
         cmd = CommandParser(
             prog="CERTFP",
@@ -209,7 +191,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("--set", action="store_true", help="set X509 certificate bundle (PEM)")
         cmd.add_argument("--remove", action="store_true", help="remove stored certificate")
-        self.commands.register(cmd, self.cmd_certfp)
+        commands.register(cmd, "cmd_certfp")
 
         cmd = CommandParser(
             prog="AUTOCMD",
@@ -224,7 +206,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("command", nargs="*", help="commands separated with ';'")
         cmd.add_argument("--remove", action="store_true", help="remove stored command")
-        self.commands.register(cmd, self.cmd_autocmd)
+        commands.register(cmd, "cmd_autocmd")
 
         cmd = CommandParser(
             prog="CONNECT",
@@ -237,7 +219,7 @@ class NetworkRoom(Room):
                 "If you want to cancel automatic reconnect you need to issue the DISCONNECT command.\n"
             ),
         )
-        self.commands.register(cmd, self.cmd_connect)
+        commands.register(cmd, "cmd_connect")
 
         cmd = CommandParser(
             prog="DISCONNECT",
@@ -247,10 +229,10 @@ class NetworkRoom(Room):
                 "reconnection attempt.\n"
             ),
         )
-        self.commands.register(cmd, self.cmd_disconnect)
+        commands.register(cmd, "cmd_disconnect")
 
         cmd = CommandParser(prog="RECONNECT", description="reconnect to network")
-        self.commands.register(cmd, self.cmd_reconnect)
+        commands.register(cmd, "cmd_reconnect")
 
         cmd = CommandParser(
             prog="RAW",
@@ -263,7 +245,7 @@ class NetworkRoom(Room):
             ),
         )
         cmd.add_argument("text", nargs="+", help="raw text")
-        self.commands.register(cmd, self.cmd_raw)
+        commands.register(cmd, "cmd_raw")
 
         cmd = CommandParser(
             prog="QUERY",
@@ -274,7 +256,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("nick", help="target nickname")
         cmd.add_argument("message", nargs="*", help="optional message")
-        self.commands.register(cmd, self.cmd_query)
+        commands.register(cmd, "cmd_query")
 
         cmd = CommandParser(
             prog="MSG",
@@ -285,7 +267,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("nick", help="target nickname")
         cmd.add_argument("message", nargs="+", help="message")
-        self.commands.register(cmd, self.cmd_msg)
+        commands.register(cmd, "cmd_msg")
 
         cmd = CommandParser(
             prog="CTCP",
@@ -294,7 +276,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("nick", help="target nickname")
         cmd.add_argument("command", nargs="+", help="command and arguments")
-        self.commands.register(cmd, self.cmd_ctcp)
+        commands.register(cmd, "cmd_ctcp")
 
         cmd = CommandParser(
             prog="CTCPCFG",
@@ -303,7 +285,7 @@ class NetworkRoom(Room):
         cmd.add_argument("--enable", dest="enabled", action="store_true", help="Enable CTCP replies")
         cmd.add_argument("--disable", dest="enabled", action="store_false", help="Disable CTCP replies")
         cmd.set_defaults(enabled=None)
-        self.commands.register(cmd, self.cmd_ctcpcfg)
+        commands.register(cmd, "cmd_ctcpcfg")
 
         cmd = CommandParser(
             prog="NICKSERV",
@@ -311,7 +293,7 @@ class NetworkRoom(Room):
             epilog="Alias: NS",
         )
         cmd.add_argument("message", nargs="+", help="message")
-        self.commands.register(cmd, self.cmd_nickserv, ["NS"])
+        commands.register(cmd, "cmd_nickserv", ["NS"])
 
         cmd = CommandParser(
             prog="CHANSERV",
@@ -319,7 +301,7 @@ class NetworkRoom(Room):
             epilog="Alias: CS",
         )
         cmd.add_argument("message", nargs="+", help="message")
-        self.commands.register(cmd, self.cmd_chanserv, ["CS"])
+        commands.register(cmd, "cmd_chanserv", ["CS"])
 
         cmd = CommandParser(
             prog="JOIN",
@@ -332,7 +314,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("channel", help="target channel")
         cmd.add_argument("key", nargs="?", help="channel key")
-        self.commands.register(cmd, self.cmd_join)
+        commands.register(cmd, "cmd_join")
 
         cmd = CommandParser(
             prog="PLUMB",
@@ -345,11 +327,11 @@ class NetworkRoom(Room):
         cmd.add_argument("room", help="target Matrix room ID (eg. !uniqueid:your-homeserver)")
         cmd.add_argument("channel", help="target channel")
         cmd.add_argument("key", nargs="?", help="channel key")
-        self.commands.register(cmd, self.cmd_plumb)
+        commands.register(cmd, "cmd_plumb")
 
         cmd = CommandParser(prog="UMODE", description="set user modes")
         cmd.add_argument("flags", help="user mode flags")
-        self.commands.register(cmd, self.cmd_umode)
+        commands.register(cmd, "cmd_umode")
 
         cmd = CommandParser(
             prog="WAIT",
@@ -357,7 +339,7 @@ class NetworkRoom(Room):
             epilog=("Use with AUTOCMD to add delays between commands."),
         )
         cmd.add_argument("seconds", help="how many seconds to wait")
-        self.commands.register(cmd, self.cmd_wait)
+        commands.register(cmd, "cmd_wait")
 
         cmd = CommandParser(
             prog="PILLS",
@@ -367,7 +349,7 @@ class NetworkRoom(Room):
             "--length", help="minimum length of nick to generate a pill, setting to 0 disables this feature", type=int
         )
         cmd.add_argument("--ignore", help="comma separated list of nicks to ignore for pills")
-        self.commands.register(cmd, self.cmd_pills)
+        commands.register(cmd, "cmd_pills")
 
         cmd = CommandParser(
             prog="AUTOQUERY",
@@ -376,11 +358,11 @@ class NetworkRoom(Room):
         cmd.add_argument("--enable", dest="enabled", action="store_true", help="Enable autoquery")
         cmd.add_argument("--disable", dest="enabled", action="store_false", help="Disable autoquery")
         cmd.set_defaults(enabled=None)
-        self.commands.register(cmd, self.cmd_autoquery)
+        commands.register(cmd, "cmd_autoquery")
 
         cmd = CommandParser(prog="WHOIS", description="send a WHOIS(IS) command")
         cmd.add_argument("nick", help="target nick")
-        self.commands.register(cmd, self.cmd_whois)
+        commands.register(cmd, "cmd_whois")
 
         cmd = CommandParser(
             prog="ROOM",
@@ -392,7 +374,7 @@ class NetworkRoom(Room):
         )
         cmd.add_argument("target", help="IRC channel or nick that has a room")
         cmd.add_argument("command", help="Command and arguments", nargs=argparse.REMAINDER)
-        self.commands.register(cmd, self.cmd_room)
+        commands.register(cmd, "cmd_room")
 
         cmd = CommandParser(
             prog="AVATAR",
@@ -402,7 +384,7 @@ class NetworkRoom(Room):
         cmd.add_argument("nick", help="nick")
         cmd.add_argument("url", nargs="?", help="new avatar URL (mxc:// format)")
         cmd.add_argument("--remove", help="remove avatar", action="store_true")
-        self.commands.register(cmd, self.cmd_avatar)
+        commands.register(cmd, "cmd_avatar")
 
         cmd = CommandParser(prog="REJOIN", description="configure rejoin behavior for channel rooms")
         cmd.add_argument("--enable-invite", dest="invite", action="store_true", help="Enable rejoin on invite")
@@ -410,9 +392,36 @@ class NetworkRoom(Room):
         cmd.add_argument("--enable-kick", dest="kick", action="store_true", help="Enable rejoin on kick")
         cmd.add_argument("--disable-kick", dest="kick", action="store_false", help="Disable rejoin on kick")
         cmd.set_defaults(invite=None, kick=None)
-        self.commands.register(cmd, self.cmd_rejoin)
+        commands.register(cmd, "cmd_rejoin")
 
-        self.mx_register("m.room.message", self.on_mx_message)
+    def init(self):
+        self.name = None
+        self.connected = False
+        self.nick = None
+        self.username = None
+        self.ircname = None
+        self.password = None
+        self.sasl_username = None
+        self.sasl_password = None
+        self.autocmd = None
+        self.pills_length = 2
+        self.pills_ignore = []
+        self.autoquery = True
+        self.allow_ctcp = False
+        self.tls_cert = None
+        self.rejoin_invite = True
+        self.rejoin_kick = False
+
+        self.commands = self.bind_commands()
+        self.conn = None
+        self.rooms = {}
+        self.connlock = asyncio.Lock()
+        self.disconnect = True
+        self.real_host = "?" * 63  # worst case default
+        self.keys = {}  # temp dict of join channel keys
+        self.keepnick_task = None  # async task
+        self.whois_data = defaultdict(dict)  # buffer for keeping partial whois replies
+        self.pending_kickbans = defaultdict(list)
 
     @staticmethod
     async def create(serv, name, user_id):
@@ -1002,20 +1011,21 @@ class NetworkRoom(Room):
                         server_hostname = server["address"]
 
                     proxy = None
-                    sock = None
-                    address = server["address"]
-                    port = server["port"]
 
                     with_proxy = ""
                     if "proxy" in server and server["proxy"] is not None and len(server["proxy"]) > 0:
                         proxy = Proxy.from_url(server["proxy"])
-                        address = port = None
                         with_proxy = " through a SOCKS proxy"
 
                     self.send_notice(f"Connecting to {server['address']}:{server['port']}{with_tls}{with_proxy}...")
 
+                    # our own socket is registered for identd before the server even sees it
+                    ident = self.get_ident()
+
                     if proxy:
                         sock = await proxy.connect(dest_host=server["address"], dest_port=server["port"])
+                    else:
+                        sock = await HeisenConnection.bound_socket(server["address"], server["port"], ident)
 
                     if self.sasl_username and self.sasl_password:
                         self.send_notice(f"Using SASL credentials for username {self.sasl_username}")
@@ -1023,10 +1033,10 @@ class NetworkRoom(Room):
                     reactor = HeisenReactor(loop=asyncio.get_event_loop())
                     irc_server = reactor.server()
                     irc_server.buffer_class = buffer.LenientDecodingLineBuffer
-                    factory = irc.connection.AioFactory(ssl=ssl_ctx, sock=sock, server_hostname=server_hostname)
+                    factory = irc.connection.AioFactory(ssl=ssl_ctx, server_hostname=server_hostname)
                     self.conn = await irc_server.connect(
-                        address,
-                        port,
+                        server["address"],
+                        server["port"],
                         self.get_nick(),
                         self.password,
                         username=self.get_ident() if self.username is None else self.username,
@@ -1034,6 +1044,8 @@ class NetworkRoom(Room):
                         connect_factory=factory,
                         sasl_username=self.sasl_username,
                         sasl_password=self.sasl_password,
+                        ident=ident,
+                        sock=sock,
                     )
 
                     self.conn.add_global_handler("disconnect", self.on_disconnect)
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+"""
+Running pure formatting functions away from the event loop.
+"""
+
+
+class OrderedResults:
+    __slots__ = ("_last",)
+
+    def __init__(self):
+        self._last = None
+
+    async def wait(self, aw):
+        """
+        Wait for aw but return only after everything passed in before has returned.
+
+        Work is not serialized, only the hand out of results is, so a small message following a large paste runs right
+        away but is not returned before the paste.
+        """
+        prev = self._last
+        done = asyncio.get_event_loop().create_future()
+        self._last = done
+
+        try:
+            try:
+                return await aw
+            finally:
+                if prev is not None and not prev.done():
+                    await asyncio.wait([prev])
+        finally:
+            done.set_result(None)
+
+
+class Offloader:
+    def __init__(self, threshold=16 * 1024, max_pending=16, workers=2):
+        # inputs smaller than threshold characters are cheaper to handle inline than to send elsewhere
+        self.threshold = threshold
+        self.max_pending = max_pending
+        self.workers = workers
+        self._executor = None
+        self._pending = None
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            try:
+                # spawned as forking a process with a running loop and threads is asking for trouble
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            except (ImportError, NotImplementedError, OSError):
+                logging.warning("Process pool is not available, formatting large messages in threads")
+                self._executor = self._threads()
+
+        return self._executor
+
+    def _threads(self) -> Executor:
+        return ThreadPoolExecutor(self.workers, thread_name_prefix="heisenbridge-offload")
+
+    async def run(self, size: int, func, *args):
+        """
+        Call func with args and return the result.
+
+        If size is over the threshold func runs in a worker process instead of the loop so it needs to be a picklable
+        module level function. At most max_pending calls are out at once, the rest wait for their turn.
+        """
+        if size < self.threshold:
+            return func(*args)
+
+        if self._pending is None:
+            self._pending = asyncio.Semaphore(self.max_pending)
+
+        async with self._pending:
+            loop = asyncio.get_event_loop()
+
+            try:
+                return await loop.run_in_executor(self.executor(), func, *args)
+            except BrokenProcessPool:
+                logging.warning("Process pool broke, formatting large messages in threads from now on")
+                self._executor = self._threads()
+                return await loop.run_in_executor(self._executor, func, *args)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
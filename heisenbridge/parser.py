@@ -1,10 +1,14 @@
 import re
+from html import unescape
 from typing import Dict
+from typing import List
 from typing import Optional
 from typing import Pattern
+from typing import Tuple
 
 from mautrix.types import RoomAlias
 from mautrix.types import UserID
+from mautrix.util.formatter import html_reader_htmlparser
 from mautrix.util.formatter.formatted_string import EntityType
 from mautrix.util.formatter.html_reader import HTMLNode
 from mautrix.util.formatter.markdown_string import MarkdownString
@@ -66,6 +70,14 @@ class IRCMatrixParser(MatrixParser):
     # use .* to account for legacy empty mxid
     mention_regex: Pattern = re.compile("https://matrix.to/#/(@.*:.+)")
 
+    # tags the single pass parser handles, mx-reply is skipped as a whole
+    simple_tags = ("a", "b", "strong", "i", "em", "code", "p")
+    simple_tag_regex: Pattern = re.compile(
+        r"<(?:/([a-zA-Z][-a-zA-Z0-9]*)\s*"
+        r"|([a-zA-Z][-a-zA-Z0-9]*)((?:\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*\s*=\s*(?:\"[^\"]*\"|'[^']*'))*)\s*(/?))>"
+    )
+    simple_attr_regex: Pattern = re.compile(r"([a-zA-Z_:][-a-zA-Z0-9_:.]*)\s*=\s*(?:\"([^\"]*)\"|'([^']*)')")
+
     @classmethod
     def tag_aware_parse_node(cls, node: HTMLNode, ctx: RecursionContext) -> T:
         msgs = cls.node_to_tagged_fstrings(node, ctx)
@@ -118,10 +130,160 @@ class IRCMatrixParser(MatrixParser):
             displayname = ctx.displaynames[user_id]
         return msg.format(cls.e.USER_MENTION, user_id=user_id, displayname=displayname)
 
+    @classmethod
+    def simple_join(cls, items: List[Tuple[str, str]]) -> str:
+        # tag_aware_parse_node for plain strings, p is the only block tag the single pass parser knows
+        output = []
+        prev_was_block = True
+        for msg, tag in items:
+            if tag == "p":
+                msg = msg.strip()
+                if not prev_was_block:
+                    output.append("\n")
+                prev_was_block = True
+            else:
+                prev_was_block = False
+            output.append(msg)
+        return "".join(output).strip()
+
+    @classmethod
+    def simple_node(cls, tag: str, attrs: str, items: List[Tuple[str, str]], ctx: RecursionContext) -> Optional[str]:
+        if tag == "code":
+            return '"' + " ".join(msg for msg, _ in items) + '"'
+
+        msg = cls.simple_join(items)
+        if tag == "p":
+            return msg + "\n"
+
+        attrib = {}
+        for m in cls.simple_attr_regex.finditer(attrs):
+            value = m.group(2) if m.group(2) is not None else m.group(3)
+            attrib[m.group(1).lower()] = unescape(value)
+
+        if tag != "a":
+            if cls.exclude_plaintext_attrib in attrib:
+                return msg
+            return f"*{msg}*" if tag in ("b", "strong") else f"_{msg}_"
+
+        href = attrib.get("href", "")
+        if not href:
+            return msg
+
+        if href.startswith("mailto:"):
+            return href[len("mailto:") :]
+
+        mention = cls.mention_regex.match(href)
+        if mention:
+            displaynames = getattr(ctx, "displaynames", None)
+            if displaynames is None:
+                return None
+            user_id = mention.group(1)
+            if user_id in displaynames and displaynames[user_id] is not None:
+                return displaynames[user_id]
+            return msg
+
+        if cls.room_regex.match(href):
+            return msg
+
+        if cls.ignore_less_relevant_links and cls.exclude_plaintext_attrib in attrib:
+            return msg
+
+        return msg if href == msg else f"{msg} ({href})"
+
+    @classmethod
+    def parse_simple(cls, data: str, ctx: RecursionContext) -> Optional[str]:
+        """
+        Convert a formatted body in a single pass without building a DOM.
+
+        Only knows the simple tags most messages are made of, gives the same result as the full parser or None if the
+        body has anything else in it or is not well nested.
+        """
+        frames = [("body", "", [])]
+        skip = []
+        pos = 0
+
+        while True:
+            lt = data.find("<", pos)
+            text = data[pos:] if lt < 0 else data[pos:lt]
+
+            if text and not skip:
+                (tag, _, items) = frames[-1]
+                if "&" in text:
+                    text = unescape(text)
+                if tag != "code":
+                    text = text.replace("\n", "")
+                items.append((text, "text"))
+
+            if lt < 0:
+                break
+
+            m = cls.simple_tag_regex.match(data, lt)
+            if not m:
+                return None
+
+            pos = m.end()
+            (end_tag, tag, attrs, self_closing) = m.groups()
+
+            if end_tag is not None:
+                end_tag = end_tag.lower()
+
+                if skip:
+                    if skip[-1] != end_tag:
+                        return None
+                    skip.pop()
+                    if not skip:
+                        frames[-1][2].append(("", "mx-reply"))
+                    continue
+
+                if len(frames) == 1 or frames[-1][0] != end_tag:
+                    return None
+
+                (tag, attrs, items) = frames.pop()
+                msg = cls.simple_node(tag, attrs, items, ctx)
+                if msg is None:
+                    return None
+                frames[-1][2].append((msg, tag))
+                continue
+
+            tag = tag.lower()
+
+            if tag in ("script", "style"):
+                return None
+
+            if skip:
+                if not self_closing and tag not in html_reader_htmlparser.NodeifyingParser.void_tags:
+                    skip.append(tag)
+                continue
+
+            if frames[-1][0] == "code":
+                return None
+
+            if tag == "br":
+                frames[-1][2].append(("\n", "br"))
+            elif self_closing:
+                return None
+            elif tag == "mx-reply":
+                skip.append(tag)
+            elif tag in cls.simple_tags:
+                frames.append((tag, attrs, []))
+            else:
+                return None
+
+        if len(frames) > 1 or skip:
+            return None
+
+        return cls.simple_join(frames[0][2])
+
     @classmethod
     def parse(cls, data: str, ctx: Optional[RecursionContext] = None) -> T:
         if ctx is None:
             ctx = RecursionContext()
 
+        # the single pass parser follows the tree html.parser builds, lxml is not the same
+        if cls.read_html is html_reader_htmlparser.read_html:
+            simple = cls.parse_simple(data, ctx)
+            if simple is not None:
+                return cls.fs(simple)
+
         msg = cls.node_to_fstring(cls.read_html(f"<body>{data}</body>"), ctx)
         return msg
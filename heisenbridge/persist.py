@@ -0,0 +1,52 @@
+import asyncio
+import copy
+
+"""
+Debounced persistence of config dicts.
+"""
+
+
+class DebouncedSave:
+    __slots__ = ("_write", "_delay", "_saved", "_pending", "_writing")
+
+    def __init__(self, write, delay=0.5):
+        self._write = write
+        self._delay = delay
+        self._saved = None
+        self._pending = None
+        self._writing = None
+
+    def saved(self, config: dict) -> None:
+        """Mark config as already persisted, eg. right after loading it."""
+        self._saved = copy.deepcopy(config)
+
+    async def save(self, get_config) -> None:
+        """
+        Save the config returned by get_config after a short delay.
+
+        Every save requested within the delay is coalesced into a single write and the config is only resolved right
+        before writing so it is always the latest one. If nothing changed since the previous write it is skipped.
+        """
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._flush(get_config))
+
+        await asyncio.shield(self._pending)
+
+    async def _flush(self, get_config) -> None:
+        await asyncio.sleep(self._delay)
+
+        # anything requested from now on needs a new write
+        self._pending = None
+
+        # writes may be retried for a long time, a newer config must not be overtaken by an older one
+        if self._writing is None:
+            self._writing = asyncio.Lock()
+
+        async with self._writing:
+            # copy so changes made while writing are caught by the next save
+            config = copy.deepcopy(get_config())
+            if config == self._saved:
+                return
+
+            await self._write(config)
+            self._saved = config
@@ -2,6 +2,7 @@ import logging
 from typing import Optional
 
 from heisenbridge.channel_room import ChannelRoom
+from heisenbridge.command_parse import CommandManager
 from heisenbridge.command_parse import CommandParser
 from heisenbridge.matrix import MatrixError
 
@@ -20,14 +21,19 @@ class PlumbedRoom(ChannelRoom):
     allow_notice = False
     force_forward = True
 
-    def init(self) -> None:
-        super().init()
+    # relayed traffic is less interactive, fewer and larger events are kinder to the room
+    merge_delay = 0.5
+    merge_max_age = 2.0
+
+    @classmethod
+    def init_commands(cls, commands: CommandManager) -> None:
+        super().init_commands(commands)
 
         cmd = CommandParser(
             prog="MAXLINES", description="set maximum number of lines per message until truncation or pastebin"
         )
         cmd.add_argument("lines", type=int, nargs="?", help="Number of lines")
-        self.commands.register(cmd, self.cmd_maxlines)
+        commands.register(cmd, "cmd_maxlines")
 
         cmd = CommandParser(prog="PASTEBIN", description="enable or disable automatic pastebin of long messages")
         cmd.add_argument("--enable", dest="enabled", action="store_true", help="Enable pastebin")
@@ -35,7 +41,7 @@ class PlumbedRoom(ChannelRoom):
             "--disable", dest="enabled", action="store_false", help="Disable pastebin (messages will be truncated)"
         )
         cmd.set_defaults(enabled=None)
-        self.commands.register(cmd, self.cmd_pastebin)
+        commands.register(cmd, "cmd_pastebin")
 
         cmd = CommandParser(
             prog="DISPLAYNAMES", description="enable or disable use of displaynames in relayed messages"
@@ -45,7 +51,7 @@ class PlumbedRoom(ChannelRoom):
             "--disable", dest="enabled", action="store_false", help="Disable displaynames (fallback to MXID)"
         )
         cmd.set_defaults(enabled=None)
-        self.commands.register(cmd, self.cmd_displaynames)
+        commands.register(cmd, "cmd_displaynames")
 
         cmd = CommandParser(
             prog="DISAMBIGUATION", description="enable or disable disambiguation of conflicting displaynames"
@@ -55,19 +61,19 @@ class PlumbedRoom(ChannelRoom):
         )
         cmd.add_argument("--disable", dest="enabled", action="store_false", help="Disable disambiguation")
         cmd.set_defaults(enabled=None)
-        self.commands.register(cmd, self.cmd_disambiguation)
+        commands.register(cmd, "cmd_disambiguation")
 
         cmd = CommandParser(prog="ZWSP", description="enable or disable Zero-Width-Space anti-ping")
         cmd.add_argument("--enable", dest="enabled", action="store_true", help="Enable ZWSP anti-ping")
         cmd.add_argument("--disable", dest="enabled", action="store_false", help="Disable ZWSP anti-ping")
         cmd.set_defaults(enabled=None)
-        self.commands.register(cmd, self.cmd_zwsp)
+        commands.register(cmd, "cmd_zwsp")
 
         cmd = CommandParser(prog="NOTICERELAY", description="enable or disable relaying of Matrix notices to IRC")
         cmd.add_argument("--enable", dest="enabled", action="store_true", help="Enable notice relay")
         cmd.add_argument("--disable", dest="enabled", action="store_false", help="Disable notice relay")
         cmd.set_defaults(enabled=None)
-        self.commands.register(cmd, self.cmd_noticerelay)
+        commands.register(cmd, "cmd_noticerelay")
 
     def is_valid(self) -> bool:
         # we are valid as long as the appservice is in the room
@@ -170,11 +176,8 @@ class PlumbedRoom(ChannelRoom):
             sender_displayname = self.displaynames[event["sender"]]
 
             # ensure displayname is unique
-            if self.use_disambiguation:
-                for user_id, displayname in self.displaynames.items():
-                    if user_id != event["sender"] and displayname == sender_displayname:
-                        sender_displayname += f" ({sender})"
-                        break
+            if self.use_disambiguation and len(self.displaynames.users(sender_displayname)) > 1:
+                sender_displayname += f" ({sender})"
 
             # add ZWSP if displayname matches something on IRC
             if self.use_zwsp and len(sender_displayname) > 1:
@@ -189,12 +192,11 @@ class PlumbedRoom(ChannelRoom):
 
             # process media event like it was a text message
             media_event = {"content": {"body": self.serv.mxc_to_url(event["content"]["url"], event["content"]["body"])}}
-            messages = self._process_event_content(media_event, prefix=f"<{sender}> ")
+            messages = await self._process_event_content(media_event, prefix=f"<{sender}> ")
             self.network.conn.privmsg(self.name, messages[0])
 
             self.react(event["event_id"], "\U0001F517")  # link
-            self.media.append([event["event_id"], event["content"]["url"]])
-            await self.save()
+            self.add_media(event["event_id"], event["content"]["url"])
         elif event["content"]["msgtype"] == "m.emote":
             await self._send_message(event, self.network.conn.action, prefix=f"{sender} ")
         elif event["content"]["msgtype"] == "m.text":
@@ -1,19 +1,25 @@
 import asyncio
+import hashlib
 import html
 import logging
 import re
 import unicodedata
+from collections import OrderedDict
 from datetime import datetime
 from datetime import timezone
 from html import escape
+from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Optional
 from typing import Tuple
 from urllib.parse import urlparse
 
+from heisenbridge.command_parse import BoundCommands
 from heisenbridge.command_parse import CommandManager
 from heisenbridge.command_parse import CommandParser
 from heisenbridge.command_parse import CommandParserError
+from heisenbridge.displaynames import Displaynames
 from heisenbridge.parser import IRCMatrixParser
 from heisenbridge.parser import IRCRecursionContext
 from heisenbridge.room import Room
@@ -32,6 +38,20 @@ def unix_to_local(timestamp: Optional[str]):
         return timestamp
 
 
+def merge_policy_error(delay, max_age, max_size) -> Optional[str]:
+    """Return why a merge policy can't be used, shared by the MERGE command and config loading."""
+    if not all(type(value) in (int, float) for value in (delay, max_age, max_size)) or type(max_size) != int:
+        return "Delay and max age must be numbers and max size a whole number."
+
+    if not (0 <= delay <= max_age <= 10):
+        return "Delay and max age must be between 0 and 10 seconds and delay can't exceed max age."
+
+    if not (0 < max_size <= 64_000):
+        return "Max size must be between 1 and 64000 characters."
+
+    return None
+
+
 def connected(f):
     def wrapper(*args, **kwargs):
         self = args[0]
@@ -45,97 +65,154 @@ def connected(f):
     return wrapper
 
 
-# this is very naive and will break html tag close/open order right now
+# mIRC colours 0-98, 99 is the default colour
+IRC_COLORS = (
+    "ffffff 000000 00007f 009300 ff0000 7f0000 9c009c fc7f00 ffff00 00fc00 009393 00ffff 0000fc ff00ff 7f7f7f d2d2d2 "
+    "470000 472100 474700 324700 004700 00472c 004747 002747 000047 2e0047 470047 47002a "
+    "740000 743a00 747400 517400 007400 007449 007474 004074 000074 4b0074 740074 740045 "
+    "b50000 b56300 b5b500 7db500 00b500 00b571 00b5b5 0063b5 0000b5 7500b5 b500b5 b5006b "
+    "ff0000 ff8c00 ffff00 b2ff00 00ff00 00ffa0 00ffff 008cff 0000ff a500ff ff00ff ff0098 "
+    "ff5959 ffb459 ffff71 cfff60 6fff6f 65ffc9 6dffff 59b4ff 5959ff c459ff ff66ff ff59bc "
+    "ff9c9c ffd39c ffff9c e2ff9c 9cff9c 9cffdb 9cffff 9cd3ff 9c9cff dc9cff ff9cff ff94d3 "
+    "000000 131313 282828 363636 4d4d4d 656565 818181 9f9f9f bcbcbc e2e2e2 ffffff"
+).split()
+
+# control code to the style it toggles, in the order tags are opened
+IRC_STYLES = {"\x02": "b", "\x1D": "i", "\x1F": "u", "\x1E": "del", "\x11": "code"}
+IRC_STYLE_ORDER = ("b", "i", "u", "del", "code", "font")
+
+IRC_CONTROL_REGEX = re.compile(
+    r"(\x03(?:([0-9]{1,2})(?:,([0-9]{1,2}))?)?|\x04(?:([0-9A-Fa-f]{6})(?:,([0-9A-Fa-f]{6}))?)?|[\x02\x0F\x11\x16\x1D\x1E\x1F])"
+)
+
+# this will also match some non-nick characters so pillify fails on purpose
+IRC_PILL_REGEX = re.compile(r"[^\s\?!:;,\.]+(\.[A-Za-z0-9])?")
+
+
+def irc_color(code: Optional[str]) -> Optional[str]:
+    if code is None:
+        return None
+
+    if len(code) == 6:
+        return "#" + code.lower()
+
+    code = int(code)
+    return "#" + IRC_COLORS[code] if code < len(IRC_COLORS) else None
+
+
+def irc_pills(text: str, pills) -> str:
+    def replace_pill(m):
+        word = m.group(0).lower()
+
+        if word in pills:
+            mxid, displayname = pills[word]
+            return f'<a href="https://matrix.to/#/{escape(mxid)}">{escape(displayname)}</a>'
+
+        return m.group(0)
+
+    return IRC_PILL_REGEX.sub(replace_pill, text)
+
+
 def parse_irc_formatting(input: str, pills=None) -> Tuple[str, Optional[str]]:
-    plain = []
-    formatted = []
+    """
+    Convert IRC control codes to Matrix HTML in a single pass.
 
-    have_formatting = False
-    bold = False
-    italic = False
-    underline = False
+    Returns the plain text and the HTML, or None as the HTML if there is no formatting and no pills were taken. Tags
+    are only opened right before the text they apply to and closed in reverse order so they are always well nested.
+    """
+    parts = IRC_CONTROL_REGEX.split(input)
 
-    for m in re.finditer(
-        r"(\x02|\x03([0-9]{1,2})?(,([0-9]{1,2}))?|\x1D|\x1F|\x16|\x0F)?([^\x02\x03\x1D\x1F\x16\x0F]*)", input
-    ):
-        # fg is group 2, bg is group 4 but we're ignoring them now
-        (ctrl, text) = (m.group(1), m.group(5))
+    # most lines have no formatting at all
+    if len(parts) == 1:
+        if not pills:
+            return (input, None)
 
-        if ctrl:
-            have_formatting = True
+        formatted = irc_pills(escape(input), pills)
+        return (input, formatted if "<a href" in formatted else None)
 
-            if ctrl[0] == "\x02":
-                if not bold:
-                    formatted.append("<b>")
-                else:
-                    formatted.append("</b>")
-
-                bold = not bold
-            if ctrl[0] == "\x03":
-                """
-                ignoring color codes for now
-                """
-            elif ctrl[0] == "\x1D":
-                if not italic:
-                    formatted.append("<i>")
-                else:
-                    formatted.append("</i>")
+    plain = []
+    formatted = []
+    have_formatting = False
 
-                italic = not italic
-            elif ctrl[0] == "\x1F":
-                if not underline:
-                    formatted.append("<u>")
-                else:
-                    formatted.append("</u>")
-
-                underline = not underline
-            elif ctrl[0] == "\x16":
-                """
-                ignore reverse
-                """
-            elif ctrl[0] == "\x0F":
-                if bold:
-                    formatted.append("</b>")
-                if italic:
-                    formatted.append("</i>")
-                if underline:
-                    formatted.append("</u>")
-
-                bold = italic = underline = False
+    # wanted styles and colours, open tags as (style, tag) in the order they were opened
+    styles = set()
+    fg = bg = None
+    opened = []
+
+    # split gives text followed by the control code and its groups, repeated
+    for i in range(0, len(parts), 6):
+        text = parts[i]
 
         if text:
             plain.append(text)
 
-            # escape any existing html in the text
+            font = None
+            if fg or bg:
+                font = "<font"
+                if fg:
+                    font += f' data-mx-color="{fg}"'
+                if bg:
+                    font += f' data-mx-bg-color="{bg}"'
+                font += ">"
+
+            # close everything from the first open tag that is no longer wanted
+            for depth, (style, tag) in enumerate(opened):
+                if (style not in styles) if style != "font" else (tag != font):
+                    for style, tag in reversed(opened[depth:]):
+                        formatted.append(f"</{style}>")
+                    del opened[depth:]
+                    break
+
+            # open what is missing
+            if len(opened) < len(styles) + (font is not None):
+                have = {style for style, tag in opened}
+                for style in IRC_STYLE_ORDER:
+                    if style not in have and (style in styles if style != "font" else font is not None):
+                        tag = font if style == "font" else f"<{style}>"
+                        formatted.append(tag)
+                        opened.append((style, tag))
+                        have_formatting = True
+
             text = escape(text)
 
-            # create pills
             if pills:
+                text = irc_pills(text, pills)
 
-                def replace_pill(m):
-                    word = m.group(0).lower()
+                # if the formatted version has a link, we took some pills
+                if "<a href" in text:
+                    have_formatting = True
 
-                    if word in pills:
-                        mxid, displayname = pills[word]
-                        return f'<a href="https://matrix.to/#/{escape(mxid)}">{escape(displayname)}</a>'
+            formatted.append(text)
 
-                    return m.group(0)
+        if i + 1 == len(parts):
+            break
 
-                # this will also match some non-nick characters so pillify fails on purpose
-                text = re.sub(r"[^\s\?!:;,\.]+(\.[A-Za-z0-9])?", replace_pill, text)
+        ctrl = parts[i + 1]
 
-            # if the formatted version has a link, we took some pills
-            if "<a href" in text:
-                have_formatting = True
+        if ctrl in IRC_STYLES:
+            styles ^= {IRC_STYLES[ctrl]}
+        elif ctrl[0] == "\x03":
+            if len(ctrl) == 1:
+                fg = bg = None
+            else:
+                fg = irc_color(parts[i + 2])
+                if parts[i + 3] is not None:
+                    bg = irc_color(parts[i + 3])
+        elif ctrl[0] == "\x04":
+            if len(ctrl) == 1:
+                fg = bg = None
+            else:
+                fg = irc_color(parts[i + 4])
+                if parts[i + 5] is not None:
+                    bg = irc_color(parts[i + 5])
+        elif ctrl == "\x0F":
+            styles.clear()
+            fg = bg = None
 
-            formatted.append(text)
+        # reverse (\x16) has no HTML equivalent and is ignored
 
-    if bold:
-        formatted.append("</b>")
-    if italic:
-        formatted.append("</i>")
-    if underline:
-        formatted.append("</u>")
+    for style, tag in reversed(opened):
+        formatted.append(f"</{style}>")
 
     return ("".join(plain), "".join(formatted) if have_formatting else None)
 
@@ -163,6 +240,75 @@ def split_long(nick, user, host, target, message):
     return out
 
 
+# turn Matrix message content into IRC lines, pure so large messages can be formatted off the loop
+def format_irc_lines(
+    content: dict,
+    displaynames: Displaynames,
+    strip_reply: bool,
+    reply_sender: Optional[str],
+    prefix: str,
+    nick: str,
+    user: str,
+    host: str,
+    target: str,
+) -> List[str]:
+    if "formatted_body" in content:
+        lines = str(
+            IRCMatrixParser.parse(content["formatted_body"], IRCRecursionContext(displaynames=displaynames))
+        ).split("\n")
+    else:
+        body = content["body"]
+
+        body = displaynames.substitute(body)
+        lines = body.split("\n")
+
+        if strip_reply:
+            # skip all quoted lines, it will skip the next empty line as well (it better be empty)
+            while len(lines) > 0 and lines.pop(0).startswith(">"):
+                pass
+
+    # drop all whitespace-only lines
+    lines = [x for x in lines if not re.match(r"^\s*$", x)]
+
+    # prefix first line with nickname of the reply_to source
+    if reply_sender is not None:
+        first_line = reply_sender + ": " + lines.pop(0)
+        lines.insert(0, first_line)
+
+    messages = []
+
+    for i, line in enumerate(lines):
+        # prefix first line if needed
+        if i == 0 and prefix and len(prefix) > 0:
+            line = prefix + line
+
+        # filter control characters except ZWSP
+        line = "".join(c for c in line if unicodedata.category(c)[0] != "C" or c == "\u200B")
+
+        messages += split_long(nick, user, host, target, line)
+
+    return messages
+
+
+# lines joined with newlines, encoded in chunks of about size bytes
+def paste_chunks(lines: List[str], size: int = 64 * 1024) -> Iterator[bytes]:
+    chunk = []
+    length = 0
+
+    for i, line in enumerate(lines):
+        data = (line if i == 0 else "\n" + line).encode("utf-8")
+        chunk.append(data)
+        length += len(data)
+
+        if length >= size:
+            yield b"".join(chunk)
+            chunk = []
+            length = 0
+
+    if chunk:
+        yield b"".join(chunk)
+
+
 # generate an edit that follows usual IRC conventions
 def line_diff(a, b):
     a = a.split()
@@ -204,28 +350,68 @@ class PrivateRoom(Room):
     name: str
     network: Optional[NetworkRoom]
     network_name: str
-    media: List[List[str]]
+    media: Dict[str, str]
+    merge: Optional[Dict[str, float]]
 
     # for compatibility with plumbed rooms
     max_lines = 0
     force_forward = False
 
-    commands: CommandManager
+    # conversations want replies to show up as soon as possible
+    merge_delay = 0.05
+
+    # media of most recent events kept for redactions and how long media alone waits to be saved
+    media_history = 20
+    media_save_delay = 60.0
+
+    # pastes remembered so the same text is uploaded once and how many may upload at once
+    paste_cache_size = 32
+    max_uploads = 2
+
+    commands: BoundCommands
+
+    _pastes: Dict[str, asyncio.Future]
+    _uploads: Optional[asyncio.Semaphore]
+    _media_save: Optional[asyncio.TimerHandle]
+
+    mx_events = {
+        "m.room.message": "on_mx_message",
+        "m.room.redaction": "on_mx_redaction",
+    }
 
     def init(self) -> None:
         self.name = None
         self.network = None
         self.network_name = None
-        self.media = []
+        self.media = OrderedDict()
+        self.merge = None
+        self._media_save = None
+        self._pastes = OrderedDict()
+        self._uploads = None
 
-        self.commands = CommandManager()
+        self.commands = self.bind_commands()
 
-        if type(self) == PrivateRoom:
+    @classmethod
+    def init_commands(cls, commands: CommandManager) -> None:
+        if cls == PrivateRoom:
             cmd = CommandParser(prog="WHOIS", description="WHOIS the other user")
-            self.commands.register(cmd, self.cmd_whois)
-
-        self.mx_register("m.room.message", self.on_mx_message)
-        self.mx_register("m.room.redaction", self.on_mx_redaction)
+            commands.register(cmd, "cmd_whois")
+
+        cmd = CommandParser(
+            prog="MERGE",
+            description="override how IRC messages are merged into Matrix events for this room",
+            epilog=(
+                "Consecutive messages from the same IRC user are sent as a single Matrix event."
+                " A longer delay means fewer events in busy rooms but messages show up later.\n"
+                "\n"
+                "Without arguments shows the current settings."
+            ),
+        )
+        cmd.add_argument("--delay", type=float, help="seconds to wait for more messages before sending")
+        cmd.add_argument("--max-age", type=float, help="maximum seconds to hold back the first message")
+        cmd.add_argument("--max-size", type=int, help="maximum characters in a merged event")
+        cmd.add_argument("--reset", action="store_true", help="reset to defaults for this type of room")
+        commands.register(cmd, "cmd_merge")
 
     def from_config(self, config: dict) -> None:
         if "name" not in config:
@@ -238,10 +424,38 @@ class PrivateRoom(Room):
         self.network_name = config["network"]
 
         if "media" in config:
-            self.media = config["media"]
+            self.media = OrderedDict(config["media"][-self.media_history :])
+
+        # account data can be edited by hand, anything unusable falls back to the defaults
+        self.merge = None
+        merge = config.get("merge")
+        if merge is not None:
+            cls = type(self)
+            policy = (
+                (
+                    merge.get("delay", cls.merge_delay),
+                    merge.get("max_age", cls.merge_max_age),
+                    merge.get("max_size", cls.merge_max_size),
+                )
+                if isinstance(merge, dict)
+                else (None, None, None)
+            )
+
+            error = merge_policy_error(*policy)
+            if error is None:
+                self.merge = dict(zip(("delay", "max_age", "max_size"), policy))
+            else:
+                logging.warning(f"Ignoring merge policy of {self.id}: {error}")
+
+        self.set_merge_policy(**(self.merge or {}))
 
     def to_config(self) -> dict:
-        return {"name": self.name, "network": self.network_name, "media": self.media[:5]}
+        return {
+            "name": self.name,
+            "network": self.network_name,
+            "media": [list(media) for media in self.media.items()],
+            "merge": self.merge,
+        }
 
     @staticmethod
     def create(network: NetworkRoom, name: str) -> "PrivateRoom":
@@ -296,8 +510,27 @@ class PrivateRoom(Room):
         if self.network and self.name in self.network.rooms:
             del self.network.rooms[self.name]
 
+        if self._media_save:
+            self._media_save.cancel()
+            self._media_save = None
+
         super().cleanup()
 
+    def add_media(self, event_id: str, url: str) -> None:
+        self.media[event_id] = url
+        self.media.move_to_end(event_id)
+
+        while len(self.media) > self.media_history:
+            self.media.popitem(last=False)
+
+        # media is only needed for redactions, it goes out with the next save or after a while if nothing else changes
+        if self._media_save is None:
+            self._media_save = asyncio.get_event_loop().call_later(self.media_save_delay, self._save_media)
+
+    def _save_media(self) -> None:
+        self._media_save = None
+        asyncio.ensure_future(self.save())
+
     def send_notice(
         self,
         text: str,
@@ -429,68 +662,45 @@ class PrivateRoom(Room):
         (plain, formatted) = parse_irc_formatting(" ".join(event.arguments))
         self.send_notice_html(f"<b>{str(event.source)}</b> sent <b>CTCP REPLY {html.escape(plain)}</b> (ignored)")
 
-    def _process_event_content(self, event, prefix, reply_to=None):
+    async def _process_event_content(self, event, prefix, reply_to=None):
         content = event["content"]
         if "m.new_content" in content:
             content = content["m.new_content"]
 
         if "formatted_body" in content:
-            lines = str(
-                IRCMatrixParser.parse(content["formatted_body"], IRCRecursionContext(displaynames=self.displaynames))
-            ).split("\n")
+            size = len(content["formatted_body"])
         elif "body" in content:
-            body = content["body"]
-
-            for user_id, displayname in self.displaynames.items():
-                body = body.replace(user_id, displayname)
-
-                # FluffyChat prefixes mentions in fallback with @
-                body = body.replace("@" + displayname, displayname)
-
-            lines = body.split("\n")
-
-            # remove original text that was replied to
-            if "m.relates_to" in event["content"] and "m.in_reply_to" in event["content"]["m.relates_to"]:
-                # skip all quoted lines, it will skip the next empty line as well (it better be empty)
-                while len(lines) > 0 and lines.pop(0).startswith(">"):
-                    pass
+            size = len(content["body"])
         else:
             logging.warning("_process_event_content called with no usable body")
             return
 
-        # drop all whitespace-only lines
-        lines = [x for x in lines if not re.match(r"^\s*$", x)]
+        # remove original text that was replied to
+        strip_reply = "m.relates_to" in event["content"] and "m.in_reply_to" in event["content"]["m.relates_to"]
 
-        # handle replies
+        # resolve displayname of the reply_to source
+        reply_sender = None
         if reply_to and reply_to["sender"] != event["sender"]:
-            # resolve displayname
-            sender = reply_to["sender"]
-            if sender in self.displaynames:
-                sender = self.displaynames[sender]
-
-            # prefix first line with nickname of the reply_to source
-            first_line = sender + ": " + lines.pop(0)
-            lines.insert(0, first_line)
-
-        messages = []
-
-        for i, line in enumerate(lines):
-            # prefix first line if needed
-            if i == 0 and prefix and len(prefix) > 0:
-                line = prefix + line
-
-            # filter control characters except ZWSP
-            line = "".join(c for c in line if unicodedata.category(c)[0] != "C" or c == "\u200B")
-
-            messages += split_long(
-                self.network.conn.real_nickname,
-                self.network.conn.username,
-                self.network.real_host,
-                self.name,
-                line,
-            )
-
-        return messages
+            reply_sender = self.displaynames.get(reply_to["sender"], reply_to["sender"])
+
+        # formatting off the loop may happen in a thread while member events keep changing the displaynames
+        displaynames = self.displaynames
+        if size >= self.serv.offloader().threshold:
+            displaynames = displaynames.copy()
+
+        return await self.offload(
+            size,
+            format_irc_lines,
+            content,
+            displaynames,
+            strip_reply,
+            reply_sender,
+            prefix,
+            self.network.conn.real_nickname,
+            self.network.conn.username,
+            self.network.real_host,
+            self.name,
+        )
 
     async def _send_message(self, event, func, prefix=""):
         # try to find out if this was a reply
@@ -515,11 +725,11 @@ class PrivateRoom(Room):
                 )
 
         if "m.new_content" in event["content"]:
-            messages = self._process_event_content(event, prefix, reply_to)
+            messages = await self._process_event_content(event, prefix, reply_to)
             event_id = event["content"]["m.relates_to"]["event_id"]
             prev_event = self.last_messages[event["sender"]]
             if prev_event and prev_event["event_id"] == event_id:
-                old_messages = self._process_event_content(prev_event, prefix, reply_to)
+                old_messages = await self._process_event_content(prev_event, prefix, reply_to)
 
                 mlen = max(len(messages), len(old_messages))
                 edits = []
@@ -552,37 +762,17 @@ class PrivateRoom(Room):
         else:
             # keep track of the last message
             self.last_messages[event["sender"]] = event
-            messages = self._process_event_content(event, prefix, reply_to)
+            messages = await self._process_event_content(event, prefix, reply_to)
 
         for i, message in enumerate(messages):
             if self.max_lines > 0 and i == self.max_lines - 1 and len(messages) > self.max_lines:
                 self.react(event["event_id"], "\u2702")  # scissors
 
                 if self.use_pastebin:
-                    resp = await self.serv.api.post_media_upload(
-                        "\n".join(messages).encode("utf-8"), content_type="text/plain; charset=UTF-8"
-                    )
-
-                    if self.max_lines == 1:
-                        func(
-                            self.name,
-                            f"{prefix}{self.serv.mxc_to_url(resp['content_uri'])} (long message, {len(messages)} lines)",
-                        )
-                    else:
-                        func(
-                            self.name,
-                            f"... long message truncated: {self.serv.mxc_to_url(resp['content_uri'])} ({len(messages)} lines)",
-                        )
-                    self.react(event["event_id"], "\U0001f4dd")  # memo
-
-                    self.media.append([event["event_id"], resp["content_uri"]])
-                    await self.save()
+                    # upload in the background so the room is not held up by it
+                    asyncio.ensure_future(self._pastebin(event, func, prefix, messages))
                 else:
-                    if self.max_lines == 1:
-                        # best effort is to send the first line and give up
-                        func(self.name, message)
-                    else:
-                        func(self.name, "... long message truncated")
+                    self._truncated(func, messages)
 
                 return
 
@@ -592,6 +782,69 @@ class PrivateRoom(Room):
         if self.max_lines == 0 and len(messages) > 1:
             self.react(event["event_id"], f"\u2702 {len(messages)} lines")
 
+    def _truncated(self, func, messages) -> None:
+        if self.max_lines == 1:
+            # best effort is to send the first line and give up
+            func(self.name, messages[0])
+        else:
+            func(self.name, "... long message truncated")
+
+    async def _pastebin(self, event, func, prefix, messages) -> None:
+        try:
+            content_uri = await self._upload_paste(messages)
+        except Exception:
+            logging.exception(f"Failed to upload long message {event['event_id']} in {self.id}")
+            self._truncated(func, messages)
+            return
+
+        if self.max_lines == 1:
+            func(self.name, f"{prefix}{self.serv.mxc_to_url(content_uri)} (long message, {len(messages)} lines)")
+        else:
+            func(self.name, f"... long message truncated: {self.serv.mxc_to_url(content_uri)} ({len(messages)} lines)")
+        self.react(event["event_id"], "\U0001f4dd")  # memo
+
+        self.add_media(event["event_id"], content_uri)
+
+    async def _upload_paste(self, lines: List[str]) -> str:
+        """Upload lines as text and return the mxc URI, pasting the same text again reuses the earlier upload."""
+        digest = hashlib.sha256()
+        length = 0
+        for chunk in paste_chunks(lines):
+            digest.update(chunk)
+            length += len(chunk)
+        key = digest.hexdigest()
+
+        if key not in self._pastes:
+            self._pastes[key] = asyncio.ensure_future(self._post_paste(lines, length))
+
+        self._pastes.move_to_end(key)
+        while len(self._pastes) > self.paste_cache_size:
+            self._pastes.popitem(last=False)
+
+        upload = self._pastes[key]
+        try:
+            return await asyncio.shield(upload)
+        except Exception:
+            # let the next paste of the same text try again
+            if self._pastes.get(key) is upload:
+                del self._pastes[key]
+            raise
+
+    async def _post_paste(self, lines: List[str], length: int) -> str:
+        async def body():
+            for chunk in paste_chunks(lines):
+                yield chunk
+
+        if self._uploads is None:
+            self._uploads = asyncio.Semaphore(self.max_uploads)
+
+        async with self._uploads:
+            resp = await self.serv.api.post_media_upload(
+                body, content_type="text/plain; charset=UTF-8", content_length=length
+            )
+
+        return resp["content_uri"]
+
     async def on_mx_message(self, event) -> None:
         if event["sender"] != self.user_id:
             return
@@ -607,8 +860,7 @@ class PrivateRoom(Room):
                 self.name, self.serv.mxc_to_url(event["content"]["url"], event["content"]["body"])
             )
             self.react(event["event_id"], "\U0001F517")  # link
-            self.media.append([event["event_id"], event["content"]["url"]])
-            await self.save()
+            self.add_media(event["event_id"], event["content"]["url"])
         elif event["content"]["msgtype"] == "m.text":
             # allow commanding the appservice in rooms
             match = re.match(r"^\s*@?([^:,\s]+)[\s:,]*(.+)$", event["content"]["body"])
@@ -625,28 +877,56 @@ class PrivateRoom(Room):
         await self.serv.api.post_room_receipt(event["room_id"], event["event_id"])
 
     async def on_mx_redaction(self, event) -> None:
-        for media in self.media:
-            if media[0] == event["redacts"]:
-                url = urlparse(media[1])
-                if self.serv.synapse_admin:
-                    try:
-                        await self.serv.api.post_synapse_admin_media_quarantine(url.netloc, url.path[1:])
-                        self.network.send_notice(
-                            f"Associated media {media[1]} for redacted event {event['redacts']} "
-                            + f"in room {self.name} was quarantined."
-                        )
-                    except Exception:
-                        self.network.send_notice(
-                            f"Failed to quarantine media! Associated media {media[1]} "
-                            + f"for redacted event {event['redacts']} in room {self.name} is left available."
-                        )
-                else:
-                    self.network.send_notice(
-                        f"No permission to quarantine media! Associated media {media[1]} "
-                        + f"for redacted event {event['redacts']} in room {self.name} is left available."
-                    )
-                return
+        if event["redacts"] not in self.media:
+            return
+
+        media = self.media[event["redacts"]]
+        url = urlparse(media)
+        if self.serv.synapse_admin:
+            try:
+                await self.serv.api.post_synapse_admin_media_quarantine(url.netloc, url.path[1:])
+                self.network.send_notice(
+                    f"Associated media {media} for redacted event {event['redacts']} "
+                    + f"in room {self.name} was quarantined."
+                )
+            except Exception:
+                self.network.send_notice(
+                    f"Failed to quarantine media! Associated media {media} "
+                    + f"for redacted event {event['redacts']} in room {self.name} is left available."
+                )
+        else:
+            self.network.send_notice(
+                f"No permission to quarantine media! Associated media {media} "
+                + f"for redacted event {event['redacts']} in room {self.name} is left available."
+            )
 
     @connected
     async def cmd_whois(self, args) -> None:
         self.network.conn.whois(f"{self.name} {self.name}")
+
+    async def cmd_merge(self, args) -> None:
+        if args.reset:
+            self.merge = None
+            self.set_merge_policy()
+            await self.save()
+        elif args.delay is not None or args.max_age is not None or args.max_size is not None:
+            (delay, max_age, max_size) = self.get_merge_policy()
+            delay = delay if args.delay is None else args.delay
+            max_age = max_age if args.max_age is None else args.max_age
+            max_size = max_size if args.max_size is None else args.max_size
+
+            error = merge_policy_error(delay, max_age, max_size)
+            if error is not None:
+                self.send_notice(error, forward=args._forward)
+                return
+
+            self.merge = {"delay": delay, "max_age": max_age, "max_size": max_size}
+            self.set_merge_policy(**self.merge)
+            await self.save()
+
+        (delay, max_age, max_size) = self.get_merge_policy()
+        self.send_notice(
+            f"Merging messages with {delay}s delay, {max_age}s max age and {max_size} characters max size"
+            + (" (room override)" if self.merge else ""),
+            forward=args._forward,
+        )
@@ -0,0 +1,164 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import time
+
+from heisenbridge.irc import HeisenReactor
+
+"""
+Runtime toggleable profiling of the event loop.
+
+Nothing is hooked while a profile is not running, the timing wrappers are swapped in for the duration of a single
+profile and the originals put back afterwards.
+"""
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+class SlowCallbackHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.callbacks = []
+
+    def emit(self, record):
+        # asyncio debug mode reports these as "Executing <handle> took N seconds"
+        if isinstance(record.msg, str) and record.msg.startswith("Executing"):
+            self.callbacks.append(record.getMessage())
+
+
+class Profiler:
+    def __init__(self, serv):
+        self.serv = serv
+        self.running = False
+        self._timings = {}
+        self._restore = []
+
+    def _record(self, name, elapsed):
+        stat = self._timings.get(name)
+        if stat is None:
+            self._timings[name] = [1, elapsed, elapsed]
+        else:
+            stat[0] += 1
+            stat[1] += elapsed
+            if elapsed > stat[2]:
+                stat[2] = elapsed
+
+    def _patch(self, cls, name, wrap):
+        original = cls.__dict__[name]
+        setattr(cls, name, wrap(original))
+        self._restore.append(lambda: setattr(cls, name, original))
+
+    def _hook(self):
+        record = self._record
+
+        def wrap_mx_event(func):
+            async def _on_mx_event(serv, event):
+                start = time.perf_counter()
+                try:
+                    return await func(serv, event)
+                finally:
+                    record(f"_on_mx_event {event.get('type')}", time.perf_counter() - start)
+
+            return _on_mx_event
+
+        def wrap_handle_event(func):
+            def _handle_event(reactor, connection, event):
+                start = time.perf_counter()
+                try:
+                    return func(reactor, connection, event)
+                finally:
+                    record(f"_handle_event {event.type}", time.perf_counter() - start)
+
+            return _handle_event
+
+        def wrap_flush_events(func, name):
+            async def _flush_events(events):
+                start = time.perf_counter()
+                try:
+                    return await func(events)
+                finally:
+                    record(name, time.perf_counter() - start)
+
+            return _flush_events
+
+        self._patch(type(self.serv), "_on_mx_event", wrap_mx_event)
+        self._patch(HeisenReactor, "_handle_event", wrap_handle_event)
+
+        # queues hold on to the bound method so each live room is wrapped, rooms created while profiling are not
+        for room in list(self.serv._rooms.values()):
+            queue = room._queue
+            original = queue._callback
+            queue._callback = wrap_flush_events(original, f"_flush_events {type(room).__name__}")
+            self._restore.append(lambda queue=queue, original=original: setattr(queue, "_callback", original))
+
+    def _unhook(self):
+        while self._restore:
+            self._restore.pop()()
+
+    async def profile(self, seconds: float, slow_callback_duration: float = 0.1, limit: int = 20) -> str:
+        """Profile the event loop for the given time and return a text summary."""
+        if self.running:
+            raise ProfilerBusyError("A profile is already running.")
+
+        loop = asyncio.get_event_loop()
+        debug = loop.get_debug()
+        duration = loop.slow_callback_duration
+        logger = logging.getLogger("asyncio")
+        level = logger.level
+        handler = SlowCallbackHandler()
+        profiler = cProfile.Profile()
+
+        self.running = True
+        self._timings = {}
+
+        try:
+            loop.slow_callback_duration = slow_callback_duration
+            loop.set_debug(True)
+            if not logger.isEnabledFor(logging.WARNING):
+                logger.setLevel(logging.WARNING)
+            logger.addHandler(handler)
+            self._hook()
+
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+        finally:
+            self._unhook()
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+            loop.set_debug(debug)
+            loop.slow_callback_duration = duration
+            self.running = False
+
+        return self._summary(elapsed, profiler, handler.callbacks, slow_callback_duration, limit)
+
+    def _summary(self, elapsed, profiler, callbacks, slow_callback_duration, limit):
+        lines = [f"Profiled for {elapsed:.1f} seconds."]
+
+        lines.append("")
+        lines.append(f"{len(callbacks)} callbacks took longer than {slow_callback_duration * 1000:.0f} ms:")
+        for callback in callbacks[:limit]:
+            lines.append(f"  {callback}")
+
+        lines.append("")
+        lines.append("Wall time spent in handlers:")
+        lines.append(f"  {'handler':48} {'calls':>8} {'total s':>9} {'avg ms':>9} {'max ms':>9}")
+        for name, (count, total, worst) in sorted(self._timings.items(), key=lambda item: -item[1][1])[:limit]:
+            lines.append(f"  {name:48} {count:8} {total:9.3f} {total / count * 1000:9.2f} {worst * 1000:9.2f}")
+
+        lines.append("")
+        lines.append("Functions by own time:")
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.strip_dirs().sort_stats("tottime").print_stats(limit)
+        lines += stream.getvalue().strip().split("\n")
+
+        return "\n".join(lines)
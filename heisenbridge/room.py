@@ -3,14 +3,20 @@ import logging
 import re
 from abc import ABC
 from collections import defaultdict
-from typing import Callable
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 from heisenbridge.appservice import AppService
+from heisenbridge.command_parse import BoundCommands
+from heisenbridge.command_parse import CommandManager
+from heisenbridge.command_parse import CommandRegistry
+from heisenbridge.displaynames import Displaynames
 from heisenbridge.event_queue import EventQueue
 from heisenbridge.matrix import MatrixForbidden
+from heisenbridge.offload import OrderedResults
+from heisenbridge.persist import DebouncedSave
 
 
 class RoomInvalidError(Exception):
@@ -23,11 +29,27 @@ class Room(ABC):
     serv: AppService
     members: List[str]
     lazy_members: Dict[str, str]
-    displaynames: Dict[str, str]
+    displaynames: Displaynames
     need_invite: bool = True
 
-    _mx_handlers: Dict[str, List[Callable[[dict], bool]]]
+    # how IRC lines are merged into Matrix events, see EventQueue
+    merge_delay: float = 0.1
+    merge_max_age: float = 1.0
+    merge_max_size: int = 64_000
+
+    # Matrix event type to handler method name, merged with the tables of all base classes
+    mx_events: Dict[str, str] = {
+        "m.room.member": "_on_mx_room_member",
+        "m.room.join_rules": "_on_mx_room_join_rules",
+    }
+
+    _mx_handlers: Dict[str, str]
     _queue: EventQueue
+    _saver: DebouncedSave
+    _offloaded: OrderedResults
+
+    # command registries shared between instances, keyed by class and init_commands arguments
+    _command_registries: Dict[tuple, CommandRegistry] = {}
 
     def __init__(self, id: str, user_id: str, serv: AppService, members: List[str]):
         self.id = id
@@ -35,28 +57,48 @@ class Room(ABC):
         self.serv = serv
         self.members = members
         self.lazy_members = {}
-        self.displaynames = {}
+        self.displaynames = Displaynames()
         self.last_messages = defaultdict(str)
 
-        self._mx_handlers = {}
-        self._queue = EventQueue(self._flush_events)
+        self._queue = EventQueue(self._flush_events, self.merge_delay, self.merge_max_age, self.merge_max_size)
+        self._saver = DebouncedSave(
+            lambda config: self.serv.api.put_room_account_data(self.serv.user_id, self.id, "irc", config)
+        )
+        self._offloaded = OrderedResults()
 
         # start event queue
         if self.id:
             self._queue.start()
 
-        # we track room members
-        self.mx_register("m.room.member", self._on_mx_room_member)
-        self.mx_register("m.room.join_rules", self._on_mx_room_join_rules)
-
         self.init()
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # build the handler table once per class instead of registering them for every room
+        cls._mx_handlers = {}
+        for klass in reversed(cls.__mro__):
+            cls._mx_handlers.update(klass.__dict__.get("mx_events", {}))
+
     def from_config(self, config: dict) -> None:
         pass
 
     def init(self) -> None:
         pass
 
+    @classmethod
+    def init_commands(cls, commands: CommandManager) -> None:
+        pass
+
+    def bind_commands(self, **kwargs) -> BoundCommands:
+        cls = type(self)
+        key = (cls, tuple(sorted(kwargs.items())))
+
+        if key not in Room._command_registries:
+            Room._command_registries[key] = CommandRegistry(lambda commands: cls.init_commands(commands, **kwargs))
+
+        return Room._command_registries[key].bind(self)
+
     def is_valid(self) -> bool:
         return True
 
@@ -66,23 +108,43 @@ class Room(ABC):
     def to_config(self) -> dict:
         return {}
 
-    async def save(self) -> None:
+    def loaded(self, config: dict) -> None:
+        # config came from the homeserver, no need to write it back until it changes
+        self._saver.saved(config)
+
+    def get_config(self) -> dict:
         config = self.to_config()
         config["type"] = type(self).__name__
         config["user_id"] = self.user_id
-        await self.serv.api.put_room_account_data(self.serv.user_id, self.id, "irc", config)
+        return config
 
-    def mx_register(self, type: str, func: Callable[[dict], bool]) -> None:
-        if type not in self._mx_handlers:
-            self._mx_handlers[type] = []
+    async def save(self) -> None:
+        self.serv.snapshot_later()
+        await self._saver.save(self.get_config)
+
+    def set_merge_policy(
+        self, delay: Optional[float] = None, max_age: Optional[float] = None, max_size: Optional[int] = None
+    ) -> None:
+        # anything not given falls back to the class policy
+        cls = type(self)
+        self._queue.delay = cls.merge_delay if delay is None else delay
+        self._queue.max_age = cls.merge_max_age if max_age is None else max_age
+        self._queue.max_size = cls.merge_max_size if max_size is None else max_size
 
-        self._mx_handlers[type].append(func)
+    def get_merge_policy(self) -> Tuple[float, float, int]:
+        return (self._queue.delay, self._queue.max_age, self._queue.max_size)
 
     async def on_mx_event(self, event: dict) -> None:
-        handlers = self._mx_handlers.get(event["type"], [self._on_mx_unhandled_event])
+        handler = self._mx_handlers.get(event["type"], "_on_mx_unhandled_event")
+        await self.serv.monitor().run(
+            f"{type(self).__name__}.{handler}",
+            lambda: f"{event['type']} {event.get('event_id')} from {event.get('sender')} in {self.id}",
+            getattr(self, handler)(event),
+        )
 
-        for handler in handlers:
-            await handler(event)
+    async def offload(self, size: int, func, *args):
+        # large inputs are handled off the loop, results still come back in the order they were asked for
+        return await self._offloaded.wait(self.serv.offloader().run(size, func, *args))
 
     def in_room(self, user_id):
         return user_id in self.members
@@ -234,7 +296,9 @@ class Room(ABC):
 
                         # unpuppet
                         event["user_id"] = None
-                    await self.serv.api.put_room_send_event(self.id, event["type"], event["content"], event["user_id"])
+                    await self.serv.api.put_room_send_event(
+                        self.id, event["type"], event["content"], event["user_id"], txn_id=event.get("txn_id")
+                    )
             except Exception:
                 logging.exception("Queued event failed")
 
@@ -336,6 +400,8 @@ class Room(ABC):
                 }
             },
             "user_id": None,
+            # a retried transaction from the homeserver must not react twice
+            "txn_id": self.serv.api.txn_id(self.id, event_id, text),
         }
 
         self._queue.enqueue(event)
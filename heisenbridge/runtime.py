@@ -0,0 +1,54 @@
+import asyncio
+import json
+import logging
+
+"""
+Optional performance runtime, uses uvloop and a faster JSON library when they are installed.
+"""
+
+
+class JsonCodec:
+    """JSON encoder and decoder pair, the fastest installed one if asked to and the standard library otherwise."""
+
+    def __init__(self, fast=False):
+        self.name = "json"
+        self.loads = json.loads
+        self.dumps = json.dumps
+
+        if not fast:
+            return
+
+        try:
+            import orjson
+
+            self.name = "orjson"
+            self.loads = orjson.loads
+            # aiohttp expects a str from the encoder
+            self.dumps = lambda obj: orjson.dumps(obj).decode()
+            return
+        except ImportError:
+            pass
+
+        try:
+            import ujson
+
+            self.name = "ujson"
+            self.loads = ujson.loads
+            self.dumps = lambda obj: ujson.dumps(obj, ensure_ascii=False)
+            return
+        except ImportError:
+            pass
+
+        logging.info("No faster JSON library installed, using the standard library.")
+
+
+def install_uvloop() -> bool:
+    """Make uvloop the event loop for everything created after this if it is installed."""
+    try:
+        import uvloop
+    except ImportError:
+        logging.info("uvloop is not installed, using the default event loop.")
+        return False
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
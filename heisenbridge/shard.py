@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import zlib
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+from heisenbridge.runtime import JsonCodec
+
+"""
+Sharding of users over worker processes.
+
+The coordinator receives transactions from the homeserver and forwards every event to the worker that owns its room
+over a Unix socket. Each worker is a full bridge that only loads the rooms of its own users so all rooms of a user and
+their IRC connections live in the same process and talk to IRC and the homeserver directly.
+
+Messages are JSON objects prefixed with their length as a 32-bit big-endian integer.
+"""
+
+
+def shard_of(user_id: str, shards: int) -> int:
+    """Return the shard that owns the rooms of user_id, stable across processes unlike hash()."""
+    return zlib.crc32(user_id.encode("utf-8")) % shards
+
+
+async def read_message(reader: asyncio.StreamReader, codec: JsonCodec) -> Optional[dict]:
+    try:
+        size = int.from_bytes(await reader.readexactly(4), "big")
+        return codec.loads(await reader.readexactly(size))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def write_message(writer: asyncio.StreamWriter, codec: JsonCodec, message: dict) -> None:
+    data = codec.dumps(message).encode("utf-8")
+    writer.write(len(data).to_bytes(4, "big") + data)
+
+
+class ShardWorker:
+    """Connection of a worker to its coordinator."""
+
+    def __init__(self, index: int, shards: int, path: str):
+        self.index = index
+        self.shards = shards
+        self.path = path
+
+        self._serv = None
+        self._writer = None
+        self._task = None
+
+    def owns(self, user_id: str) -> bool:
+        return shard_of(user_id, self.shards) == self.index
+
+    async def connect(self, serv) -> None:
+        self._serv = serv
+
+        (reader, self._writer) = await asyncio.open_unix_connection(self.path)
+        self._send({"shard": self.index})
+        self._task = asyncio.ensure_future(self._read(reader))
+
+    def _send(self, message: dict) -> None:
+        write_message(self._writer, self._serv.codec, message)
+
+    def register(self, room_id: str) -> None:
+        self._send({"register": room_id})
+
+    def unregister(self, room_id: str) -> None:
+        self._send({"unregister": room_id})
+
+    def share_config(self, config: dict) -> None:
+        self._send({"config": config})
+
+    def ready(self) -> None:
+        self._send({"ready": True})
+
+    def forward(self, command: dict) -> None:
+        """Run a command on the shard that owns command["user_id"], see BridgeAppService.on_shard_command."""
+        self._send({"forward": command})
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            message = await read_message(reader, self._serv.codec)
+            if message is None:
+                break
+
+            if "event" in message:
+                await self._serv._dispatch(message["event"])
+            elif "command" in message:
+                asyncio.ensure_future(self._serv.on_shard_command(message["command"]))
+            elif "config" in message:
+                # another shard has already saved it
+                self._serv.config.clear()
+                self._serv.config.update(message["config"])
+                self._serv.saver().saved(message["config"])
+
+        logging.error(f"Shard {self.index} lost connection to the coordinator.")
+
+    async def wait_closed(self) -> None:
+        await self._task
+
+    def close(self) -> None:
+        self._task.cancel()
+        self._writer.close()
+
+
+class Coordinator:
+    """Routes events to workers by the room they are for, or by sender for rooms that are not known yet."""
+
+    rooms: Dict[str, int]
+
+    def __init__(self, shards: int, codec: JsonCodec):
+        self.shards = shards
+        self.codec = codec
+        self.rooms = {}
+
+        self._dir = None
+        self._server = None
+        self._writers = {}
+        self._ready = set()
+        self._all_ready = None
+        self._closed = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self._dir, "shards.sock")
+
+    async def start(self, spawn: Callable[[int, str], None]) -> None:
+        """Start a worker for each shard with spawn(index, path) and wait until all of them have loaded their rooms."""
+        self._all_ready = asyncio.Event()
+        self._closed = asyncio.get_event_loop().create_future()
+
+        # only the user we run as can reach the socket
+        self._dir = tempfile.mkdtemp(prefix="heisenbridge-")
+        self._server = await asyncio.start_unix_server(self._accept, self.path)
+
+        for index in range(self.shards):
+            spawn(index, self.path)
+
+        ready = asyncio.ensure_future(self._all_ready.wait())
+        await asyncio.wait([ready, self._closed], return_when=asyncio.FIRST_COMPLETED)
+
+        if not ready.done():
+            ready.cancel()
+            raise Exception("A shard exited during startup")
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        hello = await read_message(reader, self.codec)
+        if hello is None or hello.get("shard") not in range(self.shards) or hello["shard"] in self._writers:
+            logging.warning("Unexpected connection to shard socket, closing.")
+            writer.close()
+            return
+
+        index = hello["shard"]
+        self._writers[index] = writer
+        logging.info(f"Shard {index} connected.")
+
+        while True:
+            message = await read_message(reader, self.codec)
+            if message is None:
+                break
+
+            if "register" in message:
+                self.rooms[message["register"]] = index
+            elif "unregister" in message:
+                if self.rooms.get(message["unregister"]) == index:
+                    del self.rooms[message["unregister"]]
+            elif "forward" in message:
+                target = self._writers.get(shard_of(message["forward"]["user_id"], self.shards))
+                if target is not None:
+                    write_message(target, self.codec, {"command": message["forward"]})
+            elif "config" in message:
+                for other, other_writer in self._writers.items():
+                    if other != index:
+                        write_message(other_writer, self.codec, message)
+            elif "ready" in message:
+                logging.info(f"Shard {index} is ready.")
+                self._ready.add(index)
+                if len(self._ready) == self.shards:
+                    self._all_ready.set()
+
+        logging.error(f"Shard {index} disconnected.")
+        del self._writers[index]
+
+        if not self._closed.done():
+            self._closed.set_result(index)
+
+    async def dispatch(self, event: dict) -> None:
+        index = self.rooms.get(event.get("room_id"))
+
+        # invites create a control room for whoever sent them
+        if index is None:
+            index = shard_of(event.get("sender", ""), self.shards)
+
+        # wait for room before writing so an event is never left half sent when the transaction is cancelled
+        writer = self._writers[index]
+        await writer.drain()
+        write_message(writer, self.codec, {"event": event})
+
+    async def wait_closed(self) -> int:
+        """Wait until any of the workers disconnects and return its index, the bridge can not run without it."""
+        return await self._closed
+
+    def stop(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+
+        if self._server is not None:
+            self._server.close()
+
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
@@ -0,0 +1,91 @@
+import codecs
+import json
+import re
+from typing import List
+
+"""
+Incremental parsing of appservice transactions.
+"""
+
+
+class TransactionParser:
+    """
+    Decodes the events of a transaction body as it arrives.
+
+    Homeservers send the events array first so each event can be decoded as soon as it has been received in full and
+    the body never needs to be kept in memory as a whole. Anything after the events array is ignored. If the body does
+    not start with the events array it is collected and decoded as a whole when closed instead.
+    """
+
+    _head = re.compile(r'\s*\{\s*"events"\s*:\s*\[')
+    _separator = re.compile(r"\s*,?\s*")
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._state = "head"
+
+    def feed(self, data: bytes) -> List[dict]:
+        if self._state == "tail":
+            return []
+
+        self._buffer += self._decoder.decode(data)
+        return self._parse()
+
+    def close(self) -> List[dict]:
+        self._buffer += self._decoder.decode(b"", final=True)
+
+        if self._state == "head" or self._state == "whole":
+            body = json.loads(self._buffer)
+            self._buffer = ""
+            return body["events"]
+
+        events = self._parse()
+
+        if self._state != "tail":
+            raise ValueError("Transaction ended before the end of the events array")
+
+        return events
+
+    def _parse(self) -> List[dict]:
+        if self._state == "head":
+            # wait until the start of the events array should have been seen
+            if "[" not in self._buffer and len(self._buffer) < 64:
+                return []
+
+            m = self._head.match(self._buffer)
+            if not m:
+                self._state = "whole"
+                return []
+
+            self._buffer = self._buffer[m.end() :]
+            self._state = "events"
+
+        if self._state != "events":
+            return []
+
+        events = []
+        pos = 0
+
+        while True:
+            pos = self._separator.match(self._buffer, pos).end()
+
+            if pos >= len(self._buffer):
+                break
+
+            if self._buffer[pos] == "]":
+                self._state = "tail"
+                pos = len(self._buffer)
+                break
+
+            # an event that has not been received in full yet fails to decode, try again with more data
+            try:
+                (event, pos) = self._json.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                break
+
+            events.append(event)
+
+        self._buffer = self._buffer[pos:]
+        return events
@@ -0,0 +1,121 @@
+import pickle
+import random
+
+from heisenbridge.displaynames import Displaynames
+
+
+def test_version():
+    displaynames = Displaynames({"@a:example.com": "a"})
+    versions = [displaynames.version]
+
+    displaynames["@b:example.com"] = "b"
+    versions.append(displaynames.version)
+    del displaynames["@b:example.com"]
+    versions.append(displaynames.version)
+    displaynames.update({"@c:example.com": "c"})
+    versions.append(displaynames.version)
+    displaynames.pop("@c:example.com")
+    versions.append(displaynames.version)
+
+    assert len(set(versions)) == len(versions)
+
+    # the matcher is only rebuilt after a change
+    matcher = displaynames.matcher()
+    assert displaynames.matcher()[0] is matcher[0]
+    displaynames["@d:example.com"] = "d"
+    assert displaynames.matcher()[0] is not matcher[0]
+
+    # cached matchers are not pickled
+    copy = pickle.loads(pickle.dumps(displaynames))
+    assert type(copy) is Displaynames and copy == displaynames and copy._matcher is None
+
+
+def test_substitute():
+    displaynames = Displaynames(
+        {
+            "@alice:example.com": "Alice",
+            "@bob:example.com": "bob",
+            "@bobby:example.com": "Bobby Tables",
+            "@empty:example.com": "",
+        }
+    )
+
+    assert displaynames.substitute("no mentions") == "no mentions"
+    assert displaynames.substitute("@alice:example.com: hi @Alice") == "Alice: hi Alice"
+    assert displaynames.substitute("@bobby:example.com and @bob:example.com") == "Bobby Tables and bob"
+    assert displaynames.substitute("@Bobby Tables @bobcat") == "Bobby Tables bobcat"
+    assert displaynames.substitute("@empty:example.com keeps @ signs @") == " keeps @ signs @"
+
+
+def test_substitute_like_replace():
+    rnd = random.Random(1)
+    displaynames = Displaynames({f"@user{i}:example.com": f"User {i}x" for i in range(200)})
+    words = ["hello", "@", "@user", "@User", "@User 1", "@User 1x", "x"] + [
+        f"@user{i}:example.com" for i in range(0, 200, 7)
+    ]
+
+    for i in range(1000):
+        body = " ".join(rnd.choice(words) for j in range(rnd.randint(0, 20)))
+
+        expected = body
+        for user_id, displayname in displaynames.items():
+            expected = expected.replace(user_id, displayname)
+            expected = expected.replace("@" + displayname, displayname)
+
+        assert displaynames.substitute(body) == expected, body
+
+
+def test_users():
+    displaynames = Displaynames({"@a:example.com": "same", "@b:example.com": "same", "@c:example.com": "other"})
+
+    assert displaynames.users("same") == {"@a:example.com", "@b:example.com"}
+    assert displaynames.users("missing") == set()
+
+    displaynames["@b:example.com"] = "other"
+    assert displaynames.users("same") == {"@a:example.com"}
+    assert displaynames.users("other") == {"@b:example.com", "@c:example.com"}
+
+    del displaynames["@a:example.com"]
+    displaynames.pop("@c:example.com")
+    displaynames.update({"@d:example.com": "other"}, **{"@e:example.com": "new"})
+    displaynames.setdefault("@d:example.com", "ignored")
+    assert displaynames.users("same") == set()
+    assert displaynames.users("other") == {"@b:example.com", "@d:example.com"}
+
+    # the index always matches the dict
+    rnd = random.Random(1)
+    for i in range(2000):
+        user_id = f"@{rnd.randint(0, 20)}:example.com"
+        op = rnd.randint(0, 3)
+        if op == 0:
+            displaynames[user_id] = rnd.choice(["x", "y", "z"])
+        elif op == 1:
+            displaynames.pop(user_id, None)
+        elif op == 2 and user_id in displaynames:
+            del displaynames[user_id]
+        elif op == 3 and displaynames and rnd.random() < 0.05:
+            displaynames.popitem()
+        elif op == 3 and rnd.random() < 0.01:
+            displaynames.clear()
+
+        for displayname in ["x", "y", "z"]:
+            assert displaynames.users(displayname) == {k for k, v in displaynames.items() if v == displayname}
+
+    assert pickle.loads(pickle.dumps(displaynames)).users("x") == displaynames.users("x")
+
+
+def test_copy():
+    displaynames = Displaynames({"@a:example.com": "alice", "@b:example.com": "bob"})
+    matcher = displaynames.matcher()
+
+    # the copy shares the current matcher but not later changes
+    copy = displaynames.copy()
+    assert type(copy) is Displaynames
+    assert copy.matcher()[0] is matcher[0]
+
+    displaynames["@c:example.com"] = "carol"
+    del displaynames["@a:example.com"]
+    assert copy == {"@a:example.com": "alice", "@b:example.com": "bob"}
+    assert copy.users("carol") == set()
+    assert copy.substitute("@a:example.com and @c:example.com") == "alice and @c:example.com"
+    assert displaynames.substitute("@a:example.com and @c:example.com") == "@a:example.com and carol"
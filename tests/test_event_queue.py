@@ -0,0 +1,110 @@
+import asyncio
+import copy
+import random
+
+from heisenbridge.event_queue import EventQueue
+
+
+def message(user_id, body, msgtype="m.text", formatted=None):
+    content = {"msgtype": msgtype, "body": body}
+    if formatted is not None:
+        content["format"] = "org.matrix.custom.html"
+        content["formatted_body"] = formatted
+
+    return {"type": "m.room.message", "content": content, "user_id": user_id}
+
+
+def merge(events):
+    # straightforward merging by string concatenation as the queue is expected to do it
+    batches = []
+
+    for event in events:
+        if batches:
+            prev = batches[-1][-1]
+            prev_len = len(prev["content"].get("body", "")) + len(prev["content"].get("formatted_body", ""))
+
+            if (
+                prev["type"] == event["type"]
+                and prev["type"][0] != "_"
+                and prev["user_id"] == event["user_id"]
+                and "msgtype" in prev["content"]
+                and prev["content"]["msgtype"] == event["content"]["msgtype"]
+                and ("format" in prev["content"]) == ("format" in event["content"])
+                and prev_len < 64_000
+            ):
+                prev["content"]["body"] += "\n" + event["content"]["body"]
+                if "format" in event["content"]:
+                    prev["content"]["formatted_body"] += "<br>" + event["content"]["formatted_body"]
+                continue
+
+        batches.append([event])
+
+    return batches
+
+
+def run_queue(events):
+    batches = []
+
+    async def callback(events):
+        batches.append(events)
+
+    async def run():
+        queue = EventQueue(callback)
+        queue.start()
+
+        for event in events:
+            queue.enqueue(event)
+
+        await asyncio.sleep(0.2)
+        queue.stop()
+
+    asyncio.run(run())
+    return batches
+
+
+def test_merge_lines():
+    batches = run_queue(
+        [
+            message("@a:x", "one"),
+            message("@a:x", "two"),
+            message("@a:x", "three", formatted="<b>three</b>"),
+            message("@a:x", "four", formatted="four"),
+            message("@b:x", "five"),
+            message("@b:x", "six", msgtype="m.notice"),
+        ]
+    )
+
+    assert [[e["content"] for e in batch] for batch in batches] == [
+        [{"msgtype": "m.text", "body": "one\ntwo"}],
+        [
+            {
+                "msgtype": "m.text",
+                "body": "three\nfour",
+                "format": "org.matrix.custom.html",
+                "formatted_body": "<b>three</b><br>four",
+            }
+        ],
+        [{"msgtype": "m.text", "body": "five"}],
+        [{"msgtype": "m.notice", "body": "six"}],
+    ]
+
+
+def test_merge_size_cap():
+    batches = run_queue([message("@a:x", "x" * 1000) for i in range(100)])
+
+    # the cap is checked before merging so each event ends up just over it
+    assert [len(batch[0]["content"]["body"]) for batch in batches] == [64 * 1001 - 1, 36 * 1001 - 1]
+
+
+def test_merge_same_as_concatenation():
+    rnd = random.Random(0)
+    events = []
+
+    for i in range(2000):
+        sender = rnd.choice(["@a:x", "@b:x"])
+        msgtype = rnd.choice(["m.text", "m.text", "m.text", "m.notice"])
+        body = "x" * rnd.randint(0, 3000)
+        formatted = rnd.choice([None, f"<i>{body}</i>"])
+        events.append(message(sender, body, msgtype, formatted))
+
+    assert run_queue(copy.deepcopy(events)) == merge(events)
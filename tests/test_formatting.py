@@ -0,0 +1,129 @@
+import random
+from html.parser import HTMLParser
+
+from heisenbridge.private_room import IRC_COLORS
+from heisenbridge.private_room import parse_irc_formatting
+
+STYLES = {"\x02": "b", "\x1D": "i", "\x1F": "u", "\x1E": "del", "\x11": "code"}
+
+
+def reference(input):
+    # character by character interpretation of the control codes, styles of every visible character
+    out = []
+    styles = set()
+    fg = bg = None
+    i = 0
+
+    def digits(i, count, chars="0123456789"):
+        j = i
+        while j < len(input) and j - i < count and input[j] in chars:
+            j += 1
+        return input[i:j], j
+
+    def color(code):
+        if len(code) == 6:
+            return "#" + code.lower()
+        return "#" + IRC_COLORS[int(code)] if int(code) < 99 else None
+
+    while i < len(input):
+        c = input[i]
+        i += 1
+
+        if c in STYLES:
+            styles ^= {STYLES[c]}
+        elif c == "\x0F":
+            styles = set()
+            fg = bg = None
+        elif c in "\x03\x04":
+            (count, chars) = (2, "0123456789") if c == "\x03" else (6, "0123456789abcdefABCDEF")
+            code, j = digits(i, count, chars)
+
+            if not code or (c == "\x04" and len(code) < 6):
+                fg = bg = None
+                continue
+
+            fg = color(code)
+            i = j
+
+            if i < len(input) and input[i] == ",":
+                code, j = digits(i + 1, count, chars)
+                if code and (c == "\x03" or len(code) == 6):
+                    bg = color(code)
+                    i = j
+        elif c == "\x16":
+            pass
+        else:
+            out.append((c, frozenset(styles), fg, bg))
+
+    return out
+
+
+class StyleReader(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.out = []
+
+    def handle_starttag(self, tag, attrs):
+        self.stack.append((tag, dict(attrs)))
+
+    def handle_endtag(self, tag):
+        # tags must be well nested
+        assert self.stack and self.stack[-1][0] == tag
+        self.stack.pop()
+
+    def handle_data(self, data):
+        styles = frozenset(tag for tag, attrs in self.stack if tag not in ("font", "a"))
+        fg = bg = None
+        for tag, attrs in self.stack:
+            if tag == "font":
+                fg = attrs.get("data-mx-color")
+                bg = attrs.get("data-mx-bg-color")
+
+        for c in data:
+            self.out.append((c, styles, fg, bg))
+
+
+def read(formatted):
+    reader = StyleReader()
+    reader.feed(formatted)
+    reader.close()
+    assert reader.stack == []
+    return reader.out
+
+
+def check(input):
+    plain, formatted = parse_irc_formatting(input)
+    expected = reference(input)
+
+    assert plain == "".join(c for c, *styles in expected), repr(input)
+
+    if formatted is None:
+        assert all(styles == frozenset() and fg is None and bg is None for c, styles, fg, bg in expected), repr(input)
+    else:
+        assert read(formatted) == expected, repr(input)
+
+
+def test_formatting():
+    check("plain text")
+    check("\x02bold\x02 \x1Ditalic\x1D \x1Funderline\x1F \x1Estrike\x1E \x11mono\x11")
+    check("\x02bold \x1Dand italic\x02 italic\x0F none")
+    check("\x034red\x03 \x0304,12red on blue\x0399 blue\x03 none \x03,04not a colour")
+    check("\x04ff0000red\x04 \x04FF0000,00FF00red on green\x04 \x04abc not hex")
+    check("<b>not &amp; html</b>")
+
+    assert parse_irc_formatting("\x0304red") == ("red", '<font data-mx-color="#ff0000">red</font>')
+    assert parse_irc_formatting("\x02\x02\x16nothing\x0F") == ("nothing", None)
+    assert parse_irc_formatting("\x02b\x1Dbi\x02i") == ("bbii", "<b>b<i>bi</i></b><i>i</i>")
+
+
+def test_random_formatting():
+    rnd = random.Random(1)
+    tokens = (
+        ["\x02", "\x1D", "\x1F", "\x1E", "\x11", "\x16", "\x0F", "\x03", "\x04", ","]
+        + ["0", "1", "4", "12", "99", "100", "ff", "A0"]
+        + ["a", "word", " ", "<", "&", "ä"]
+    )
+
+    for i in range(5000):
+        check("".join(rnd.choice(tokens) for j in range(rnd.randint(0, 30))))
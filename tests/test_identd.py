@@ -0,0 +1,99 @@
+import asyncio
+
+from heisenbridge.identd import Identd
+from heisenbridge.irc import ConnectionIndex
+from heisenbridge.irc import HeisenConnection
+from heisenbridge.irc import HeisenReactor
+
+
+def test_identd():
+    async def query(port, request):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request.encode())
+        response = await reader.readline()
+        writer.close()
+        return response.decode()
+
+    async def run():
+        identd = Identd()
+        identd.lookup_timeout = 0.2
+        await identd.start_listening(None, 0)
+        port = identd.server.sockets[0].getsockname()[1]
+
+        index = HeisenConnection.index
+        key = ConnectionIndex.key(40000, "127.0.0.1", 6667)
+        index.add(key, "m-abcdef")
+
+        try:
+            assert await query(port, "40000, 6667\r\n") == "40000, 6667 : USERID : UNIX : m-abcdef\r\n"
+            assert await query(port, "40001, 6667\r\n") == "40001, 6667 : ERROR : NO-USER\r\n"
+
+            # a connection registered right after the query is still found
+            later = ConnectionIndex.key(40002, "::ffff:127.0.0.1", 6667)
+            asyncio.get_event_loop().call_later(0.05, index.add, later, "m-later")
+            assert await query(port, "40002,6667\r\n") == "40002, 6667 : USERID : UNIX : m-later\r\n"
+            index.remove(later)
+        finally:
+            index.remove(key)
+            identd.server.close()
+
+        assert len(index) == 0
+        assert index._waiters == {}
+
+    asyncio.run(run())
+
+
+def test_connection_index():
+    async def run():
+        server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        reactor = HeisenReactor(loop=asyncio.get_event_loop())
+        conn = await reactor.server().connect("127.0.0.1", port, "nick", ident="m-abcdef")
+
+        local_port = conn.transport.get_extra_info("sockname")[1]
+        assert HeisenConnection.index.get(ConnectionIndex.key(local_port, "127.0.0.1", port)) == "m-abcdef"
+
+        conn.close()
+        assert len(HeisenConnection.index) == 0
+
+        server.close()
+
+    asyncio.run(run())
+
+
+def test_bound_socket():
+    async def run():
+        seen = []
+
+        def accepted(reader, writer):
+            # what identd would be asked about as soon as the server sees the connection
+            client_addr, client_port, *_ = writer.get_extra_info("peername")
+            server_addr, server_port, *_ = writer.get_extra_info("sockname")
+            seen.append(HeisenConnection.index.get(ConnectionIndex.key(client_port, server_addr, server_port)))
+
+        server = await asyncio.start_server(accepted, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        sock = await HeisenConnection.bound_socket("127.0.0.1", port, "m-abcdef")
+        reactor = HeisenReactor(loop=asyncio.get_event_loop())
+        conn = await reactor.server().connect("127.0.0.1", port, "nick", ident="m-abcdef", sock=sock)
+        await asyncio.sleep(0.01)
+
+        assert seen == ["m-abcdef"]
+        assert conn.server == "127.0.0.1"
+
+        conn.close()
+        assert len(HeisenConnection.index) == 0
+
+        # nothing is left behind when connecting fails
+        server.close()
+        await server.wait_closed()
+        try:
+            await HeisenConnection.bound_socket("127.0.0.1", port, "m-abcdef")
+            assert False, "connecting should fail"
+        except OSError:
+            pass
+        assert len(HeisenConnection.index) == 0
+
+    asyncio.run(run())
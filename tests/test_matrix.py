@@ -0,0 +1,103 @@
+import asyncio
+
+from heisenbridge.matrix import Matrix
+from heisenbridge.matrix import MatrixNotFound
+
+
+class FakeMatrix(Matrix):
+    txn_block = 3
+
+    def __init__(self, account_data, log):
+        super().__init__("http://localhost", "token")
+        self.account_data = account_data
+        self.log = log
+
+    async def get_user_account_data(self, user_id, key):
+        if (user_id, key) not in self.account_data:
+            raise MatrixNotFound({"errcode": "M_NOT_FOUND", "error": "Not found"})
+        return self.account_data[(user_id, key)]
+
+    async def put_user_account_data(self, user_id, key, data):
+        self.account_data[(user_id, key)] = data
+        self.log.append(("reserve", key, data["seq"]))
+
+    async def call(self, method, uri, data=None, **kwargs):
+        self.log.append(("send", self.txn_key, uri.split("/")[-1]))
+        return {}
+
+
+async def send(matrix, count):
+    for i in range(count):
+        await matrix.put_room_send_event("!room:example.com", "m.room.message", {"body": str(i)})
+
+
+def sent(log):
+    return [txn_id for (kind, key, txn_id) in log if kind == "send"]
+
+
+def check_reserved(log):
+    # every id was covered by a persisted reservation of its own key before it was sent
+    limits = {}
+    for (kind, key, value) in log:
+        if kind == "reserve":
+            limits[key] = value
+        else:
+            assert int(value.split("-")[1]) <= limits.get(key, 0)
+
+
+def test_txn_reserve():
+    async def run():
+        account_data = {}
+        log = []
+
+        matrix = FakeMatrix(account_data, log)
+        await matrix.load_txn("@bridge:example.com")
+        await send(matrix, 7)
+
+        assert sent(log) == [f"hb-{i}" for i in range(1, 8)]
+        assert account_data == {("@bridge:example.com", "irc.txn"): {"seq": 9}}
+        check_reserved(log)
+
+    asyncio.run(run())
+
+
+def test_txn_restart():
+    async def run():
+        account_data = {}
+        log = []
+
+        # stopped in the middle of a block
+        matrix = FakeMatrix(account_data, log)
+        await matrix.load_txn("@bridge:example.com")
+        await send(matrix, 4)
+
+        restarted = FakeMatrix(account_data, log)
+        await restarted.load_txn("@bridge:example.com")
+        await send(restarted, 4)
+
+        # the rest of the block is skipped and nothing is sent twice
+        assert sent(log) == [f"hb-{i}" for i in [1, 2, 3, 4, 7, 8, 9, 10]]
+        check_reserved(log)
+
+    asyncio.run(run())
+
+
+def test_txn_shards():
+    async def run():
+        account_data = {}
+        log = []
+
+        shards = [FakeMatrix(account_data, log), FakeMatrix(account_data, log)]
+        await shards[0].load_txn("@bridge:example.com", 0)
+        await shards[1].load_txn("@bridge:example.com", 1)
+
+        for i in range(5):
+            await send(shards[i % 2], 2)
+
+        # both send as the same user but keep their own high-water mark and prefix
+        assert len(set(sent(log))) == len(sent(log)) == 10
+        assert set(account_data) == {("@bridge:example.com", "irc.txn.0"), ("@bridge:example.com", "irc.txn.1")}
+        assert {txn_id.split("-")[0] for txn_id in sent(log)} == {"hb0", "hb1"}
+        check_reserved(log)
+
+    asyncio.run(run())
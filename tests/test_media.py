@@ -0,0 +1,62 @@
+import asyncio
+
+from heisenbridge.private_room import PrivateRoom
+
+
+class FakeApi:
+    def __init__(self):
+        self.writes = []
+
+    async def put_room_account_data(self, user_id, room_id, key, data):
+        self.writes.append(data)
+
+
+class FakeServ:
+    user_id = "@bridge:example.com"
+    synapse_admin = False
+
+    def __init__(self):
+        self.api = FakeApi()
+
+    def snapshot_later(self):
+        pass
+
+
+class FakeNetwork:
+    def __init__(self):
+        self.rooms = {}
+        self.notices = []
+
+    def send_notice(self, text):
+        self.notices.append(text)
+
+
+def test_media():
+    async def run():
+        serv = FakeServ()
+        room = PrivateRoom("!room:example.com", "@user:example.com", serv, [])
+        room.from_config({"name": "nick", "network": "net", "media": [["$old", "mxc://example.com/old"]]})
+        room.network = FakeNetwork()
+        room.media_save_delay = 0.01
+
+        for i in range(room.media_history + 10):
+            room.add_media(f"${i}", f"mxc://example.com/{i}")
+
+        # only the most recent media is kept and all of it is saved, once
+        assert list(room.media) == [f"${i}" for i in range(10, room.media_history + 10)]
+        await asyncio.sleep(1)
+        assert len(serv.api.writes) == 1
+        assert serv.api.writes[0]["media"] == [[f"${i}", f"mxc://example.com/{i}"] for i in range(10, 30)]
+
+        copy = PrivateRoom("!room:example.com", "@user:example.com", serv, [])
+        copy.from_config(room.to_config())
+        assert copy.media == room.media
+
+        await room.on_mx_redaction({"redacts": "$0"})
+        assert room.network.notices == []
+        await room.on_mx_redaction({"redacts": "$29"})
+        assert "mxc://example.com/29" in room.network.notices[0]
+
+        room.cleanup()
+
+    asyncio.run(run())
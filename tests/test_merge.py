@@ -0,0 +1,121 @@
+import asyncio
+
+from heisenbridge.channel_room import ChannelRoom
+from heisenbridge.private_room import merge_policy_error
+from heisenbridge.private_room import PrivateRoom
+
+
+class FakeApi:
+    def __init__(self):
+        self.writes = []
+
+    async def put_room_account_data(self, user_id, room_id, key, data):
+        self.writes.append(data)
+
+
+class FakeServ:
+    user_id = "@bridge:example.com"
+
+    def __init__(self):
+        self.api = FakeApi()
+
+    def snapshot_later(self):
+        pass
+
+
+def make_room(cls, serv, merge=None):
+    room = cls(None, "@user:example.com", serv, [])
+    room.id = "!room:example.com"
+    room.from_config({"name": "nick", "network": "net", "merge": merge})
+    room.notices = []
+    room.send_notice = lambda text, forward=False: room.notices.append(text)
+    return room
+
+
+def test_merge_policy_error():
+    assert merge_policy_error(0.1, 1.0, 64_000) is None
+    assert merge_policy_error(0, 0, 1) is None
+    assert merge_policy_error(2.0, 1.0, 100) is not None
+    assert merge_policy_error(0.1, 11, 100) is not None
+    assert merge_policy_error(-1, 1.0, 100) is not None
+    assert merge_policy_error(0.1, 1.0, 0) is not None
+    assert merge_policy_error(0.1, 1.0, 100.5) is not None
+    assert merge_policy_error("0.1", 1.0, 100) is not None
+    assert merge_policy_error(True, 1.0, 100) is not None
+
+
+def test_merge_command():
+    async def run():
+        serv = FakeServ()
+
+        for cls in [PrivateRoom, ChannelRoom]:
+            room = make_room(cls, serv)
+            defaults = (cls.merge_delay, cls.merge_max_age, cls.merge_max_size)
+            assert room.get_merge_policy() == defaults
+
+            # only what is given changes and the whole policy is saved
+            await room.commands.trigger("MERGE --delay 0.5")
+            assert room.get_merge_policy() == (0.5, cls.merge_max_age, cls.merge_max_size)
+            assert room.merge == {"delay": 0.5, "max_age": cls.merge_max_age, "max_size": cls.merge_max_size}
+            assert "(room override)" in room.notices[-1]
+
+            # invalid values are refused and nothing changes
+            await room.commands.trigger("MERGE --max-age 0.1")
+            assert room.get_merge_policy() == (0.5, cls.merge_max_age, cls.merge_max_size)
+            assert room.notices[-1] == merge_policy_error(0.5, 0.1, cls.merge_max_size)
+
+            await room.commands.trigger("MERGE --reset")
+            assert room.get_merge_policy() == defaults
+            assert room.merge is None
+            assert "(room override)" not in room.notices[-1]
+
+            room.cleanup()
+
+    asyncio.run(run())
+
+
+def test_merge_config():
+    async def run():
+        serv = FakeServ()
+
+        room = make_room(ChannelRoom, serv)
+        await room.commands.trigger("MERGE --delay 0.2 --max-age 3 --max-size 1000")
+        await asyncio.sleep(0.2)
+
+        # persisted and restored as is
+        config = serv.api.writes[-1]
+        assert config["merge"] == {"delay": 0.2, "max_age": 3.0, "max_size": 1000}
+        copy = make_room(ChannelRoom, serv, config["merge"])
+        assert copy.get_merge_policy() == (0.2, 3.0, 1000)
+
+        # a later config without an override resets to the defaults
+        copy.from_config({"name": "nick", "network": "net", "merge": None})
+        assert copy.merge is None
+        assert copy.get_merge_policy() == (
+            ChannelRoom.merge_delay,
+            ChannelRoom.merge_max_age,
+            ChannelRoom.merge_max_size,
+        )
+
+        # unknown keys are dropped, missing ones come from the defaults
+        copy.from_config({"name": "nick", "network": "net", "merge": {"delay": 0.5, "loop": None}})
+        assert copy.merge == {
+            "delay": 0.5,
+            "max_age": ChannelRoom.merge_max_age,
+            "max_size": ChannelRoom.merge_max_size,
+        }
+
+        # edited by hand into something unusable
+        for merge in [{"delay": 5, "max_age": 1}, {"max_size": "big"}, [0.1, 1.0, 100]]:
+            copy.from_config({"name": "nick", "network": "net", "merge": merge})
+            assert copy.merge is None
+            assert copy.get_merge_policy() == (
+                ChannelRoom.merge_delay,
+                ChannelRoom.merge_max_age,
+                ChannelRoom.merge_max_size,
+            )
+
+        room.cleanup()
+        copy.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+
+from heisenbridge.monitor import Monitor
+
+
+def test_handler_time(caplog):
+    monitor = Monitor(threshold=0.05)
+
+    async def handler(fail):
+        # waiting is not counted, blocking the loop is
+        await asyncio.sleep(0.1)
+        time.sleep(0.01)
+        await asyncio.sleep(0)
+        if fail:
+            raise ValueError("failed")
+        return "done"
+
+    async def run():
+        assert await monitor.run("handler", lambda: "context", handler(False)) == "done"
+
+        try:
+            await monitor.run("handler", lambda: "context", handler(True))
+            assert False, "exception should pass through"
+        except ValueError:
+            pass
+
+        # cancellation is passed to the handler
+        task = asyncio.ensure_future(monitor.run("handler", lambda: "context", handler(False)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+            assert False, "task should be cancelled"
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+    stats = monitor.handlers["handler"]
+    assert stats.count == 3
+    assert 0.02 <= stats.total < 0.05
+    assert stats.max < 0.05
+    assert caplog.records == []
+
+    assert monitor.call("sync", lambda: "some context", time.sleep, 0.06) is None
+    assert monitor.handlers["sync"].max >= 0.06
+    assert len(caplog.records) == 1
+    assert caplog.records[0].levelno == logging.WARNING
+    assert "sync blocked the event loop" in caplog.text
+    assert "some context" in caplog.text
+
+
+def test_loop_lag(caplog):
+    monitor = Monitor(threshold=0.05, interval=0.02)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.1)
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    asyncio.run(run())
+
+    assert monitor.max_lag >= 0.05
+    assert "Event loop is lagging" in caplog.text
+    assert monitor.status()[0].startswith("Event loop lag is")
@@ -0,0 +1,64 @@
+import asyncio
+import os
+
+from heisenbridge.displaynames import Displaynames
+from heisenbridge.offload import Offloader
+from heisenbridge.offload import OrderedResults
+from heisenbridge.private_room import format_irc_lines
+
+
+def test_ordered_results():
+    results = OrderedResults()
+    order = []
+
+    async def work(name, delay, fail=False):
+        await asyncio.sleep(delay)
+        if fail:
+            raise ValueError(name)
+        return name
+
+    async def wait(name, delay, fail=False):
+        try:
+            order.append(await results.wait(work(name, delay, fail)))
+        except ValueError as e:
+            order.append(f"{e} failed")
+
+    async def run():
+        # later work finishing first is still handed out after what came before
+        await asyncio.gather(wait("slow", 0.1), wait("failing", 0.05, True), wait("fast", 0))
+        assert order == ["slow", "failing failed", "fast"]
+
+        # cancelling a waiter does not hold up the rest
+        order.clear()
+        task = asyncio.ensure_future(wait("cancelled", 1))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(wait("after", 0))
+        task.cancel()
+        await follower
+        assert order == ["after"]
+
+    asyncio.run(run())
+
+
+def test_offloader():
+    offloader = Offloader(threshold=10, max_pending=2)
+    content = {"body": "hello\n\nworld " * 100}
+    args = (content, Displaynames(), False, None, "<someone> ", "nick", "user", "host", "#target")
+
+    async def run():
+        # small work stays on the loop
+        assert await offloader.run(1, os.getpid) == os.getpid()
+        assert offloader._executor is None
+
+        expected = format_irc_lines(*args)
+        results = await asyncio.gather(
+            *[offloader.run(len(content["body"]), format_irc_lines, *args) for i in range(5)]
+        )
+        assert results == [expected] * 5
+
+        assert await offloader.run(10, os.getpid) != os.getpid()
+
+    try:
+        asyncio.run(run())
+    finally:
+        offloader.shutdown()
@@ -0,0 +1,138 @@
+import random
+
+from mautrix.util.formatter.parser import RecursionContext
+
+from heisenbridge.parser import IRCMatrixParser
+from heisenbridge.parser import IRCRecursionContext
+
+DISPLAYNAMES = {"@alice:example.com": "alice", "@bob:example.com": "bob[m]", "@empty:example.com": ""}
+
+MESSAGES = [
+    "<b>word</b>",
+    "hello <strong>world</strong> and <em>you</em> and <i>them</i>",
+    '<a href="https://matrix.to/#/@alice:example.com">Alice</a>: hi there',
+    '<a href="https://matrix.to/#/@carol:example.com">Carol</a>: who are you',
+    '<a href="https://matrix.to/#/@empty:example.com">Empty</a>: hi',
+    '<a href="https://example.com/">https://example.com/</a>',
+    "<a href='https://example.com/a?b=1&amp;c=2'>a link</a>",
+    '<a href="mailto:someone@example.com">mail me</a>',
+    '<a href="https://matrix.to/#/#room:example.com">#room:example.com</a>',
+    '<a href="https://example.com/" data-mautrix-exclude-plaintext="">x</a>',
+    '<a href="">nothing</a> <a>nothing</a>',
+    "<code>print(&quot;hello&quot;)</code> is <code>\ncode\n</code><code></code>",
+    "first line<br>second line<br/>third line<br />",
+    "<p>para one</p><p>para two</p>\n<p>para three</p>tail",
+    "before<p> in a paragraph </p>after",
+    "&lt;b&gt;not bold&lt;/b&gt; &amp; &#128512; &unknown;",
+    "<B>upper case</B> <A HREF='https://example.com'>link</A>",
+    "<b><i>nested</i> <a href='https://example.com'><code>x</code></a></b>",
+    "multi\nline\n<b>bold\nline</b>",
+    (
+        '<mx-reply><blockquote><a href="https://matrix.to/#/!room:example.com/$event">In reply to</a> '
+        '<a href="https://matrix.to/#/@bob:example.com">@bob:example.com</a><br>original <b>text</b>'
+        "</blockquote></mx-reply>the reply"
+    ),
+    "<b data-mautrix-exclude-plaintext='1'>not formatted</b>",
+    "  surrounding whitespace  ",
+    "",
+]
+
+# things the single pass parser leaves to the full parser
+COMPLEX = [
+    "<ul><li>one</li><li>two</li></ul>",
+    "<blockquote>quote</blockquote>",
+    "<pre><code>block</code></pre>",
+    "<b>unclosed",
+    "<b><i>badly nested</b></i>",
+    "stray</b>",
+    "<!-- comment -->",
+    "a < b",
+    "<img src='mxc://example.com/a'>",
+    "<code><b>bold code</b></code>",
+    "<b/>",
+    "<a href=unquoted>x</a>",
+    '<a href="https://example.com/" data-mautrix-exclude-plaintext>x</a>',
+    "<mx-reply><b>unclosed</mx-reply>",
+]
+
+
+def full_parse(data, ctx):
+    return str(IRCMatrixParser.node_to_fstring(IRCMatrixParser.read_html(f"<body>{data}</body>"), ctx))
+
+
+def check(data, ctx_factory=lambda: IRCRecursionContext(displaynames=DISPLAYNAMES)):
+    simple = IRCMatrixParser.parse_simple(data, ctx_factory())
+    if simple is not None:
+        assert simple == full_parse(data, ctx_factory()), data
+    return simple
+
+
+def test_simple_messages():
+    for message in MESSAGES:
+        assert check(message) is not None, message
+
+    for message in COMPLEX:
+        assert check(message) is None, message
+
+    # mentions without displaynames are left to the full parser
+    assert check(MESSAGES[2], RecursionContext) is None
+    assert check(MESSAGES[1], RecursionContext) is not None
+
+    assert str(IRCMatrixParser.parse(MESSAGES[2], IRCRecursionContext(displaynames=DISPLAYNAMES))) == "alice: hi there"
+
+
+def test_random_markup():
+    rnd = random.Random(1)
+    words = ["word", "two words", " ", "\n", "&amp;", "&lt;", "é", "@alice:example.com", "a:b"]
+    hrefs = [
+        "https://example.com/",
+        "https://matrix.to/#/@alice:example.com",
+        "https://matrix.to/#/@nobody:example.com",
+        "https://matrix.to/#/#room:example.com",
+        "mailto:x@example.com",
+        "word",
+        "",
+    ]
+
+    def markup(depth):
+        parts = []
+        for i in range(rnd.randint(0, 4)):
+            kind = rnd.choice(["text", "text", "tag", "br", "code", "a"] if depth < 4 else ["text", "br"])
+            if kind == "text":
+                parts.append(rnd.choice(words))
+            elif kind == "br":
+                parts.append(rnd.choice(["<br>", "<br/>", "<br />"]))
+            elif kind == "code":
+                parts.append(f"<code>{rnd.choice(words)}</code>")
+            elif kind == "a":
+                parts.append(f'<a href="{rnd.choice(hrefs)}">{markup(depth + 1)}</a>')
+            else:
+                tag = rnd.choice(["b", "strong", "i", "em", "p"])
+                parts.append(f"<{tag}>{markup(depth + 1)}</{tag}>")
+        return "".join(parts)
+
+    simple = 0
+    for i in range(2000):
+        if check(markup(0)) is not None:
+            simple += 1
+
+    # everything generated is simple enough
+    assert simple == 2000
+
+
+def test_mutated_markup():
+    rnd = random.Random(1)
+    tokens = ["<", ">", "/", "</b>", "<b>", "<p>", "</a>", "&", ";", "\n", "<br>", "'", '"', "=", " "]
+
+    for message in MESSAGES + COMPLEX:
+        for i in range(200):
+            mutated = message
+            for j in range(rnd.randint(1, 3)):
+                pos = rnd.randint(0, len(mutated))
+                if rnd.random() < 0.5:
+                    mutated = mutated[:pos] + rnd.choice(tokens) + mutated[pos:]
+                else:
+                    mutated = mutated[:pos] + mutated[pos + rnd.randint(1, 5) :]
+
+            # whatever the single pass parser accepts must come out the same
+            check(mutated)
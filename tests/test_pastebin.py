@@ -0,0 +1,71 @@
+import asyncio
+
+from heisenbridge.private_room import paste_chunks
+from heisenbridge.private_room import PrivateRoom
+
+
+class FakeApi:
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.uploads = []
+        self.running = 0
+        self.max_running = 0
+
+    async def post_media_upload(self, data, content_type, filename=None, content_length=None):
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+
+        try:
+            # retried like Matrix.call does, every attempt gets a fresh body
+            while True:
+                body = b""
+                async for chunk in data():
+                    body += chunk
+                    await asyncio.sleep(0)
+
+                if self.fail == 0:
+                    break
+
+                self.fail -= 1
+
+            assert len(body) == content_length
+            self.uploads.append(body)
+            return {"content_uri": f"mxc://example.com/{len(self.uploads)}"}
+        finally:
+            self.running -= 1
+
+
+class FakeServ:
+    def __init__(self, api):
+        self.api = api
+
+
+def test_paste_chunks():
+    lines = [f"line {i} ä" for i in range(10000)]
+    chunks = list(paste_chunks(lines, 1000))
+
+    assert b"".join(chunks) == "\n".join(lines).encode("utf-8")
+    assert all(len(chunk) < 1100 for chunk in chunks)
+    assert list(paste_chunks(["only"])) == [b"only"]
+
+
+def test_upload_paste():
+    async def run():
+        api = FakeApi(fail=1)
+        room = PrivateRoom(None, "@user:example.com", FakeServ(api), [])
+        pastes = [[f"paste {i} line {j}" for j in range(1000)] for i in range(6)]
+
+        # the same paste is only uploaded once, even while the first upload is still running
+        uris = await asyncio.gather(*[room._upload_paste(paste) for paste in pastes + pastes])
+        assert uris[:6] == uris[6:]
+        assert len(set(uris)) == 6
+        assert sorted(api.uploads) == sorted("\n".join(paste).encode() for paste in pastes)
+        assert api.max_running == room.max_uploads
+
+        # forgotten pastes are uploaded again
+        room.paste_cache_size = 2
+        await room._upload_paste(["new"])
+        await room._upload_paste(pastes[0])
+        assert len(api.uploads) == 8
+
+    asyncio.run(run())
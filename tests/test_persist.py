@@ -0,0 +1,58 @@
+import asyncio
+
+from heisenbridge.persist import DebouncedSave
+
+
+def test_debounced_save():
+    writes = []
+
+    async def write(config):
+        writes.append(config)
+
+    async def run():
+        config = {"a": 1}
+        saver = DebouncedSave(write, delay=0.01)
+        saver.saved(config)
+
+        # nothing changed since load
+        await saver.save(lambda: config)
+        assert writes == []
+
+        # multiple saves are coalesced into a single write with the latest config
+        config["a"] = 2
+        first = asyncio.ensure_future(saver.save(lambda: config))
+        config["a"] = 3
+        await asyncio.gather(first, saver.save(lambda: config))
+        assert writes == [{"a": 3}]
+
+        # written config is not affected by later changes
+        config["a"] = 4
+        assert writes == [{"a": 3}]
+        await saver.save(lambda: config)
+        assert writes == [{"a": 3}, {"a": 4}]
+
+    asyncio.run(run())
+
+
+def test_debounced_save_order():
+    writes = []
+
+    async def write(config):
+        # the first write is slow, like a request being retried
+        await asyncio.sleep(0.2 if config["nick"] == "a" else 0)
+        writes.append(config)
+
+    async def run():
+        config = {"nick": "a"}
+        saver = DebouncedSave(write, delay=0.01)
+
+        first = asyncio.ensure_future(saver.save(lambda: config))
+        await asyncio.sleep(0.05)
+        config["nick"] = "b"
+        await asyncio.gather(first, saver.save(lambda: config))
+
+        # the newer config is written last
+        assert writes == [{"nick": "a"}, {"nick": "b"}]
+        assert saver._saved == {"nick": "b"}
+
+    asyncio.run(run())
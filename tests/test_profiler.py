@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from heisenbridge.event_queue import EventQueue
+from heisenbridge.irc import HeisenReactor
+from heisenbridge.profiler import Profiler
+from heisenbridge.profiler import ProfilerBusyError
+
+
+class FakeRoom:
+    def __init__(self):
+        self.flushed = []
+        self._queue = EventQueue(self._flush_events)
+
+    async def _flush_events(self, events):
+        self.flushed += events
+
+
+class FakeServ:
+    def __init__(self, rooms):
+        self._rooms = rooms
+
+    async def _on_mx_event(self, event):
+        # block the loop long enough to be reported as a slow callback
+        time.sleep(0.05)
+
+
+def test_profile():
+    async def run():
+        room = FakeRoom()
+        serv = FakeServ({"!room:localhost": room})
+        profiler = Profiler(serv)
+
+        on_mx_event = FakeServ.__dict__["_on_mx_event"]
+        handle_event = HeisenReactor.__dict__["_handle_event"]
+        callback = room._queue._callback
+
+        async def traffic():
+            await asyncio.sleep(0.01)
+            await serv._on_mx_event({"type": "m.room.message"})
+            room._queue.start()
+            room._queue.enqueue({"type": "m.room.message", "content": {"body": "hello"}, "user_id": None})
+
+        task = asyncio.ensure_future(profiler.profile(0.3, slow_callback_duration=0.02))
+        await asyncio.sleep(0)
+
+        try:
+            await profiler.profile(0.1)
+            assert False, "second profile should not start"
+        except ProfilerBusyError:
+            pass
+
+        await traffic()
+        summary = await task
+        room._queue.stop()
+
+        assert "_on_mx_event m.room.message" in summary
+        assert "_flush_events FakeRoom" in summary
+        assert "1 callbacks took longer than 20 ms" in summary
+        assert room.flushed[0]["content"]["body"] == "hello"
+
+        # nothing is left hooked after profiling
+        assert FakeServ.__dict__["_on_mx_event"] is on_mx_event
+        assert HeisenReactor.__dict__["_handle_event"] is handle_event
+        assert room._queue._callback == callback
+        assert asyncio.get_event_loop().get_debug() is False
+        assert profiler.running is False
+
+    asyncio.run(run())
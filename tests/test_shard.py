@@ -0,0 +1,91 @@
+import asyncio
+import collections
+
+from heisenbridge.persist import DebouncedSave
+from heisenbridge.runtime import JsonCodec
+from heisenbridge.shard import Coordinator
+from heisenbridge.shard import shard_of
+from heisenbridge.shard import ShardWorker
+
+
+class FakeServ:
+    codec = JsonCodec()
+
+    def __init__(self):
+        self.config = {"owner": None}
+        self.events = []
+        self.commands = []
+        self._saver = DebouncedSave(None)
+
+    def saver(self):
+        return self._saver
+
+    async def _dispatch(self, event):
+        self.events.append(event)
+
+    async def on_shard_command(self, command):
+        self.commands.append(command)
+
+
+def test_shard_of():
+    users = [f"@user{i}:example.com" for i in range(1000)]
+    counts = collections.Counter(shard_of(user_id, 4) for user_id in users)
+
+    # stable between runs and processes and spread evenly enough
+    assert shard_of("@user:example.com", 4) == 0
+    assert sorted(counts) == [0, 1, 2, 3]
+    assert min(counts.values()) > 200
+
+
+def test_coordinator():
+    async def run():
+        coordinator = Coordinator(2, JsonCodec())
+        servs = [FakeServ(), FakeServ()]
+        workers = [ShardWorker(0, 2, None), ShardWorker(1, 2, None)]
+
+        async def start(worker, room_id):
+            await worker.connect(servs[worker.index])
+            worker.register(room_id)
+            worker.ready()
+
+        def spawn(index, path):
+            workers[index].path = path
+            asyncio.ensure_future(start(workers[index], f"!room{index}:example.com"))
+
+        await coordinator.start(spawn)
+        assert coordinator.rooms == {"!room0:example.com": 0, "!room1:example.com": 1}
+
+        # known rooms go to the shard that registered them and new ones by sender
+        sender = next(f"@user{i}:example.com" for i in range(100) if shard_of(f"@user{i}:example.com", 2) == 1)
+        await coordinator.dispatch({"room_id": "!room1:example.com", "sender": "@other:example.com"})
+        await coordinator.dispatch({"room_id": "!room0:example.com", "sender": sender})
+        await coordinator.dispatch({"room_id": "!new:example.com", "sender": sender, "type": "m.room.member"})
+        await asyncio.sleep(0.1)
+
+        assert [event["room_id"] for event in servs[0].events] == ["!room0:example.com"]
+        assert [event["room_id"] for event in servs[1].events] == ["!room1:example.com", "!new:example.com"]
+
+        # config changes reach other shards as already saved
+        servs[1].config["owner"] = sender
+        workers[1].share_config(servs[1].config)
+        workers[1].unregister("!room1:example.com")
+        await asyncio.sleep(0.1)
+
+        assert servs[0].config == {"owner": sender}
+        assert servs[0].saver()._saved == {"owner": sender}
+        assert coordinator.rooms == {"!room0:example.com": 0}
+
+        # commands about a user run on the shard that owns them
+        workers[0].forward({"command": "forget", "user_id": sender, "room_id": "!room0:example.com"})
+        await asyncio.sleep(0.1)
+        assert servs[0].commands == []
+        assert servs[1].commands == [{"command": "forget", "user_id": sender, "room_id": "!room0:example.com"}]
+
+        # losing a shard stops the coordinator
+        workers[0].close()
+        assert await asyncio.wait_for(coordinator.wait_closed(), 1) == 0
+
+        workers[1].close()
+        coordinator.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+from heisenbridge.__main__ import BridgeAppService
+from heisenbridge.room import Room
+
+
+class NickRoom(Room):
+    nick = None
+
+    def from_config(self, config):
+        self.nick = config.get("nick")
+
+    def to_config(self):
+        return {"nick": self.nick}
+
+
+class FakeApi:
+    def __init__(self, account_data):
+        self.account_data = account_data
+        self.writes = []
+
+    async def get_user_joined_rooms(self):
+        return {"joined_rooms": list(self.account_data)}
+
+    async def get_room_account_data(self, user_id, room_id, key):
+        return self.account_data[room_id]
+
+    async def get_room_joined_members(self, room_id):
+        return {"joined": {"@user:example.com": {"display_name": "user"}}}
+
+    async def put_room_account_data(self, user_id, room_id, key, data):
+        self.writes.append(data)
+
+
+def test_reconcile_config():
+    async def run():
+        room_config = {"nick": "new", "type": "NickRoom", "user_id": "@user:example.com"}
+
+        serv = BridgeAppService()
+        serv.room_types = {"NickRoom": NickRoom}
+        serv.api = FakeApi({"!room:example.com": room_config})
+        serv.user_id = "@bridge:example.com"
+        serv.server_name = "example.com"
+        serv.puppet_prefix = "irc_"
+        serv.config = {"media_url": "http://localhost"}
+        serv.snapshot_file = os.path.join(tempfile.mkdtemp(), "snapshot")
+        serv.snapshot_delay = 0.01
+        serv.endpoint = "http://localhost"
+        serv._rooms = {}
+        serv._users = {}
+        serv._foreign = set()
+
+        # restored from a snapshot written before the nick was changed
+        room = serv.init_room("!room:example.com", dict(room_config, nick="old"), ["@user:example.com"], {})
+        assert room.nick == "old"
+
+        await serv.reconcile()
+        assert room.nick == "new"
+        assert room.displaynames == {"@user:example.com": "user"}
+
+        # nothing to write back and the newer config is what the snapshot has
+        await room.save()
+        assert serv.api.writes == []
+
+        with open(serv.snapshot_file) as f:
+            assert json.load(f)["rooms"]["!room:example.com"]["config"]["nick"] == "new"
+
+        # rooms saving their config get the snapshot written soon after
+        room.nick = "newer"
+        await room.save()
+        await asyncio.sleep(0.1)
+        assert serv.api.writes == [dict(room_config, nick="newer")]
+
+        with open(serv.snapshot_file) as f:
+            assert json.load(f)["rooms"]["!room:example.com"]["config"]["nick"] == "newer"
+
+        room.cleanup()
+
+    asyncio.run(run())
+
+
+def test_reconcile_live_members():
+    async def run():
+        room_config = {"nick": "nick", "type": "NickRoom", "user_id": "@user:example.com"}
+
+        serv = BridgeAppService()
+        serv.room_types = {"NickRoom": NickRoom}
+        serv.api = FakeApi({"!room:example.com": room_config})
+        serv.user_id = "@bridge:example.com"
+        serv.server_name = "example.com"
+        serv.puppet_prefix = "irc_"
+        serv.config = {"media_url": "http://localhost"}
+        serv.snapshot_file = os.path.join(tempfile.mkdtemp(), "snapshot")
+        serv.endpoint = "http://localhost"
+        serv._rooms = {}
+        serv._users = {}
+        serv._foreign = set()
+
+        room = serv.init_room("!room:example.com", room_config, ["@user:example.com", "@gone:example.com"], {})
+        room.displaynames["@gone:example.com"] = "gone"
+
+        # members the homeserver had when asked while the bridge was handling events for the room
+        async def get_room_joined_members(room_id):
+            room.members.remove("@user:example.com")
+            room.members.append("@live:example.com")
+            room.displaynames["@live:example.com"] = "live"
+            return {"joined": {"@user:example.com": {"display_name": "user"}, "@new:example.com": {}}}
+
+        serv.api.get_room_joined_members = get_room_joined_members
+        await serv.reconcile()
+
+        # what changed on the homeserver is applied without undoing the live events
+        assert room.members == ["@live:example.com", "@new:example.com"]
+        assert room.displaynames == {"@live:example.com": "live"}
+
+        room.cleanup()
+
+    asyncio.run(run())
+
+
+def test_save_snapshot():
+    async def run():
+        serv = BridgeAppService()
+        serv.user_id = "@bridge:example.com"
+        serv.snapshot_file = os.path.join(tempfile.mkdtemp(), "snapshot")
+        serv.endpoint = "http://localhost"
+        serv._rooms = {}
+        serv._users = {"@irc_user:example.com": "user"}
+        serv._foreign = set()
+
+        threads = []
+        write_snapshot = serv._write_snapshot
+
+        def record_thread(snapshot):
+            threads.append(threading.current_thread())
+            write_snapshot(snapshot)
+
+        serv._write_snapshot = record_thread
+
+        # written from another thread one at a time and in order so the newest one is left
+        first = asyncio.ensure_future(serv.save_snapshot())
+        serv._users["@irc_other:example.com"] = "other"
+        await asyncio.gather(first, serv.save_snapshot())
+
+        assert len(threads) == 2 and threading.main_thread() not in threads
+        with open(serv.snapshot_file) as f:
+            assert json.load(f)["users"] == serv._users
+
+    asyncio.run(run())
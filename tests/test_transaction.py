@@ -0,0 +1,138 @@
+import asyncio
+import json
+import random
+from collections import OrderedDict
+
+import pytest
+
+from heisenbridge.__main__ import BridgeAppService
+from heisenbridge.transaction import TransactionParser
+
+
+def events(count):
+    return [
+        {
+            "event_id": f"$event{i}:localhost",
+            "type": "m.room.message",
+            "content": {"msgtype": "m.text", "body": f'hällo [{i}], {{"not": "json"}} 🙂' * (i % 5)},
+        }
+        for i in range(count)
+    ]
+
+
+def parse(body, rnd):
+    parser = TransactionParser()
+    result = []
+
+    # feed in randomly sized chunks, splitting multibyte characters too
+    data = body.encode()
+    pos = 0
+    while pos < len(data):
+        size = rnd.randint(1, 200)
+        result.append(parser.feed(data[pos : pos + size]))
+        pos += size
+
+    result.append(parser.close())
+    return result
+
+
+def test_incremental():
+    rnd = random.Random(1)
+
+    for count in [0, 1, 2, 50]:
+        expected = events(count)
+        bodies = [
+            json.dumps({"events": expected}),
+            json.dumps({"events": expected, "ephemeral": [{"type": "m.typing"}]}, indent=2),
+            json.dumps({"events": expected}, separators=(",", ":")),
+        ]
+
+        for body in bodies:
+            result = parse(body, rnd)
+            assert [event for chunk in result for event in chunk] == expected
+
+    # events are available before the whole body has been received
+    body = json.dumps({"events": events(50)})
+    parser = TransactionParser()
+    assert len(parser.feed(body[: len(body) // 2].encode())) > 0
+
+
+def test_unexpected_layout():
+    rnd = random.Random(1)
+    expected = events(10)
+
+    body = json.dumps({"ephemeral": [], "events": expected})
+    result = parse(body, rnd)
+    assert result[-1] == expected
+    assert [event for chunk in result[:-1] for event in chunk] == []
+
+
+def test_invalid():
+    body = json.dumps({"events": events(5)})
+
+    for broken in [body[:-20], body.replace('", "type"', '"} "type"', 1), '{"events": [1, 2']:
+        parser = TransactionParser()
+        with pytest.raises(ValueError):
+            parser.feed(broken.encode())
+            parser.close()
+
+
+class FakeContent:
+    def __init__(self, data):
+        self.data = data
+
+    async def iter_chunked(self, size):
+        for pos in range(0, len(self.data), 100):
+            yield self.data[pos : pos + 100]
+
+
+class FakeRequest:
+    content_length = None
+
+    def __init__(self, txn_id, body):
+        self.match_info = {"id": txn_id}
+        self.content = FakeContent(body.encode())
+
+
+def test_retry_while_handled():
+    async def run():
+        serv = BridgeAppService()
+        serv._txn_ids = OrderedDict()
+        serv._txn_pending = {}
+        serv._txn_events = OrderedDict()
+
+        dispatched = []
+        blocked = asyncio.Event()
+        unblock = asyncio.Event()
+
+        async def dispatch(event):
+            # the first attempt gets stuck on backpressure after a few events
+            if len(dispatched) == 3 and not unblock.is_set():
+                blocked.set()
+                await unblock.wait()
+            dispatched.append(event["event_id"])
+
+        serv._dispatch = dispatch
+        body = json.dumps({"events": events(10)})
+
+        first = asyncio.ensure_future(serv._transaction(FakeRequest("1", body)))
+        await blocked.wait()
+
+        # the homeserver gives up and retries, the retry waits for the first attempt
+        retry = asyncio.ensure_future(serv._transaction(FakeRequest("1", body)))
+        await asyncio.sleep(0.01)
+        assert not retry.done()
+
+        first.cancel()
+        unblock.set()
+        assert (await retry).status == 200
+
+        # every event was dispatched exactly once
+        assert dispatched == [event["event_id"] for event in events(10)]
+
+        # and later retries are skipped
+        assert (await serv._transaction(FakeRequest("1", body))).status == 200
+        assert len(dispatched) == 10
+        assert serv._txn_pending == {} and list(serv._txn_events) == []
+
+    asyncio.run(run())